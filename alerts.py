@@ -0,0 +1,325 @@
+import os
+import smtplib
+import ssl
+import time
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+import metrics
+
+# Sending limits, overridable from .env
+SMTP_RATE = float(os.getenv("SMTP_RATE", "5"))  # messages per second
+SMTP_MAX_PER_CONNECTION = int(os.getenv("SMTP_MAX_PER_CONNECTION", "100"))
+SMTP_RETRIES = int(os.getenv("SMTP_RETRIES", "3"))
+SMTP_BACKOFF = float(os.getenv("SMTP_BACKOFF", "1.0"))
+
+# Errors after which reconnecting and sending again can help
+TRANSIENT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError)
+
+
+def smtp_config():
+    smtp_user = os.getenv("SMTP_USER")
+    port = os.getenv("SMTP_PORT", "587")
+    return {
+        "host": os.getenv("SMTP_HOST"),
+        "port": port,
+        "user": smtp_user,
+        "password": os.getenv("SMTP_PASS"),
+        "sender": os.getenv("SMTP_FROM", f"Price Tracker <{smtp_user}>"),
+        # "ssl" (port 465), "starttls" or "none" (local test servers)
+        "security": os.getenv("SMTP_SECURITY", "ssl" if port == "465" else "starttls"),
+    }
+
+
+def _product_card(url, old_price, new_price, title, image_url, link=False):
+    """One product's row of the alert email; `link` adds a shop button under the prices (digests)."""
+    savings = round(old_price - new_price, 2)
+    img_tag = f'<img src="{image_url}" alt="Produkt" style="width: 150px; height: 150px; object-fit: contain; background: #fff; border-radius: 12px; padding: 5px;">' if image_url else ""
+    button = f"""
+                                <div style="margin-top: 15px;">
+                                    <a href="{url}" style="display: inline-block; padding: 10px 20px; background-color: #6366f1; color: #ffffff; text-decoration: none; border-radius: 10px; font-weight: 700; font-size: 14px;">Sprawdź ofertę</a>
+                                </div>""" if link else ""
+    return f"""
+            <tr>
+                <td style="padding: 0 40px 30px 40px;">
+                    <table border="0" cellpadding="0" cellspacing="0" width="100%" style="background: rgba(15, 23, 42, 0.5); border: 1px solid #334155; border-radius: 16px; padding: 20px;">
+                        <tr>
+                            <td style="width: 160px; vertical-align: top;">
+                                {img_tag}
+                            </td>
+                            <td style="padding-left: 20px; vertical-align: top;">
+                                <h2 style="margin: 0 0 10px 0; font-size: 18px; font-weight: 700; color: #ffffff;">{title}</h2>
+                                <div style="margin-bottom: 20px;">
+                                    <div style="font-size: 12px; color: #94a3b8; margin-bottom: 5px;">Aktualna Cena</div>
+                                    <div style="font-size: 24px; font-weight: 800; color: #22c55e;">{new_price} PLN</div>
+                                    <div style="font-size: 14px; color: #94a3b8; text-decoration: line-through;">Było: {old_price} PLN</div>
+                                </div>
+                                <div style="display: inline-block; padding: 10px 15px; background: rgba(34, 197, 94, 0.1); border-radius: 8px; color: #22c55e; font-weight: 700; font-size: 14px;">
+                                    Oszczędzasz: {savings} PLN
+                                </div>{button}
+                            </td>
+                        </tr>
+                    </table>
+                </td>
+            </tr>"""
+
+
+def _page(heading, intro, rows):
+    return f"""
+    <html>
+    <body style="margin: 0; padding: 0; font-family: 'Inter', Helvetica, Arial, sans-serif; background-color: #0f172a; color: #f8fafc;">
+        <table align="center" border="0" cellpadding="0" cellspacing="0" width="100%" style="max-width: 600px; margin: 20px auto; background-color: #1e293b; border-radius: 24px; border: 1px solid #334155; overflow: hidden; border-collapse: separate;">
+            <tr>
+                <td style="padding: 40px; text-align: center;">
+                    <h1 style="margin: 0 0 10px 0; font-size: 28px; font-weight: 700; color: #818cf8;">{heading}</h1>
+                    <p style="margin: 0; color: #94a3b8; font-size: 16px;">{intro}</p>
+                </td>
+            </tr>{rows}
+            <tr>
+                <td style="padding: 20px; background-color: #0f172a; text-align: center; color: #64748b; font-size: 12px;">
+                    Wiadomość wysłana przez Omnibus PoC. Dziękujemy za korzystanie z naszej apki!
+                </td>
+            </tr>
+        </table>
+    </body>
+    </html>
+    """
+
+
+def render_alert(url, old_price, new_price, title="Produkt", image_url=None):
+    """Returns (subject, plain text body, HTML body) for a price drop."""
+    savings = round(old_price - new_price, 2)
+    subject = f"🔔 Kupuj! Cena spadła o {savings} PLN"
+
+    # Plain text version (fallback)
+    body_text = f"🔔 Kupuj! Cena produktu {title} spadła o {savings} PLN! Sprawdź ofertę: {url}"
+
+    # HTML Version (styled like the app)
+    button = f"""
+            <tr>
+                <td style="padding: 0 40px 40px 40px; text-align: center;">
+                    <a href="{url}" style="display: inline-block; padding: 16px 32px; background-color: #6366f1; color: #ffffff; text-decoration: none; border-radius: 12px; font-weight: 700; font-size: 16px;">Sprawdź ofertę w sklepie</a>
+                </td>
+            </tr>"""
+    body_html = _page(
+        "Kupuj! Cena spadła",
+        "Twój produkt właśnie staniał. Sprawdź szczegóły poniżej.",
+        _product_card(url, old_price, new_price, title, image_url) + button,
+    )
+
+    return subject, body_text, body_html
+
+
+def render_digest(products, cards):
+    """
+    Returns (subject, plain text body, HTML body) for several price drops
+    sent to one subscriber. `products` are (url, old_price, new_price,
+    title, image_url) tuples, `cards` their already rendered HTML rows.
+    """
+    savings = round(sum(old - new for _, old, new, _, _ in products), 2)
+    subject = f"🔔 Kupuj! Spadły ceny {len(products)} Twoich produktów, razem o {savings} PLN"
+    lines = [f"- {title}: {old} -> {new} PLN ({url})" for url, old, new, title, _ in products]
+    body_text = "🔔 Kupuj! Ceny Twoich produktów spadły:\n" + "\n".join(lines)
+    body_html = _page(
+        "Kupuj! Ceny spadły",
+        f"{len(products)} Twoich produktów właśnie staniało. Razem oszczędzasz {savings} PLN.",
+        "".join(cards),
+    )
+    return subject, body_text, body_html
+
+
+class AlertDispatcher:
+    """
+    Collects the alerts produced during a run and sends them in one go.
+
+    Messages go out over one authenticated SMTP connection, reopened every
+    `max_per_connection` messages, at most `rate` per second. A transient
+    failure (disconnect, 4xx) reconnects and retries with exponential
+    backoff; a permanent one (5xx, refused recipient) fails that message
+    only.
+
+    Pending alerts are indexed by subscriber email, so everything queued
+    for one person goes out as a single message: the plain alert when it
+    is one product, a digest when there are more (several drops of the
+    same product are merged into one, from the first old price to the
+    latest new one). Each product is rendered once and its email or card
+    is reused for all of its recipients.
+
+    `on_result(key, sent)` is called after each message with the key it
+    was added with, so a persistent outbox can mark it sent or failed.
+    """
+
+    def __init__(self, config=None, rate=None, max_per_connection=None, retries=None, backoff=None,
+                 connect=None, sleep=time.sleep, on_result=None):
+        self.config = config or smtp_config()
+        self.rate = rate or SMTP_RATE
+        self.max_per_connection = max_per_connection or SMTP_MAX_PER_CONNECTION
+        self.retries = SMTP_RETRIES if retries is None else retries
+        self.backoff = SMTP_BACKOFF if backoff is None else backoff
+        self.connect = connect or self._connect
+        self.sleep = sleep
+        self.on_result = on_result
+        self.pending = {}
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "digests": 0, "connections": 0, "retries": 0, "rendered": 0}
+        self._server = None
+        self._sent_on_connection = 0
+        self._last_send = 0.0
+
+    def add(self, email, url, old_price, new_price, title="Produkt", image_url=None, key=None):
+        drops = self.pending.setdefault(email, {})
+        entry = drops.get(url)
+        if entry is None:
+            drops[url] = {"product": (url, old_price, new_price, title, image_url), "keys": [key]}
+        else:
+            # A later drop of the same product: keep the price the subscriber last heard about
+            entry["product"] = (url, entry["product"][1], new_price, title, image_url)
+            entry["keys"].append(key)
+        self.stats["queued"] += 1
+
+    def _report(self, key, sent):
+        if self.on_result is not None and key is not None:
+            self.on_result(key, sent)
+
+    def flush(self):
+        """Sends everything queued so far and returns the stats."""
+        config = self.config
+        if not self.pending:
+            return self.stats
+        if not config["host"] or (config["security"] != "none" and not all([config["user"], config["password"]])):
+            print("⚠️  SMTP configuration missing! Set SMTP_HOST, SMTP_USER, and SMTP_PASS in .env")
+            for drops in self.pending.values():
+                for entry in drops.values():
+                    for key in entry["keys"]:
+                        self._report(key, False)
+                self.stats["failed"] += 1
+            self.pending = {}
+            return self.stats
+
+        pending, self.pending = self.pending, {}
+        singles, cards = {}, {}
+        try:
+            for email, drops in pending.items():
+                products = [entry["product"] for entry in drops.values()]
+                if len(products) == 1:
+                    message = singles.get(products[0])
+                    if message is None:
+                        message = singles[products[0]] = self._message(*render_alert(*products[0]))
+                        self.stats["rendered"] += 1
+                else:
+                    for product in products:
+                        if product not in cards:
+                            cards[product] = _product_card(*product, link=True)
+                            self.stats["rendered"] += 1
+                    # Biggest savings first
+                    products.sort(key=lambda product: product[2] - product[1])
+                    message = self._message(*render_digest(products, [cards[product] for product in products]))
+                    self.stats["digests"] += 1
+
+                print(f"--- 🔔 SENDING HTML ALERT EMAIL TO: {email} ({len(products)} products) ---")
+                message.replace_header("To", email)
+                sent = self._send(email, message.as_string())
+                for entry in drops.values():
+                    for key in entry["keys"]:
+                        self._report(key, sent)
+        finally:
+            self.close()
+        return self.stats
+
+    def _message(self, subject, body_text, body_html):
+        message = MIMEMultipart("alternative")
+        message["From"] = self.config["sender"]
+        message["To"] = ""
+        message["Subject"] = subject
+        message.attach(MIMEText(body_text, "plain"))
+        message.attach(MIMEText(body_html, "html"))
+        return message
+
+    def _connect(self):
+        config = self.config
+        context = ssl.create_default_context()
+        if config["security"] == "ssl":
+            server = smtplib.SMTP_SSL(config["host"], int(config["port"]), context=context)
+        else:
+            server = smtplib.SMTP(config["host"], int(config["port"]))
+            if config["security"] == "starttls":
+                server.starttls(context=context)
+        if config["user"] and config["password"]:
+            server.login(config["user"], config["password"])
+        return server
+
+    def _server_for_next_message(self):
+        if self._server is not None and self._sent_on_connection >= self.max_per_connection:
+            self.close()
+        if self._server is None:
+            self._server = self.connect()
+            self._sent_on_connection = 0
+            self.stats["connections"] += 1
+        return self._server
+
+    def _throttle(self):
+        wait = self._last_send + 1.0 / self.rate - time.monotonic()
+        if wait > 0:
+            self.sleep(wait)
+        self._last_send = time.monotonic()
+
+    def _send(self, email, message):
+        started = time.perf_counter()
+        sent = self._send_with_retries(email, message)
+        metrics.ALERT_SEND_SECONDS.observe(time.perf_counter() - started, "sent" if sent else "failed")
+        return sent
+
+    def _send_with_retries(self, email, message):
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                self.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                self._throttle()
+                server = self._server_for_next_message()
+                server.sendmail(self.config["user"] or self.config["sender"], email, message)
+                self._sent_on_connection += 1
+                self.stats["sent"] += 1
+                print("✅ HTML Alert email sent successfully!")
+                return True
+            except smtplib.SMTPRecipientsRefused as e:
+                error = e
+                break
+            except smtplib.SMTPResponseException as e:
+                error = e
+                # 4xx is temporary (throttling, greylisting), 5xx is final
+                if e.smtp_code >= 500:
+                    break
+                self._drop_connection()
+            except TRANSIENT_ERRORS as e:
+                error = e
+                self._drop_connection()
+
+        print(f"❌ Failed to send email to {email}: {error}")
+        self.stats["failed"] += 1
+        return False
+
+    def _drop_connection(self):
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def close(self):
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+
+
+def send_alert(email, url, old_price, new_price, title="Produkt", image_url=None):
+    """
+    Sends a single email alert using SMTP with HTML styling.
+    Batch runs should queue alerts on an AlertDispatcher instead.
+    """
+    dispatcher = AlertDispatcher()
+    dispatcher.add(email, url, old_price, new_price, title=title, image_url=image_url)
+    dispatcher.flush()
@@ -1,16 +1,28 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 import json
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
-from urllib.parse import urlparse, quote_plus
+import time
 from parser import parse_price
-from cron import run_cron
+import fetcher
+import storage
+import history
+from cache import TTLCache
+import jobs
+import metrics
+import throttle
+import strategies
+import bulk
+from routing import AffiliateRouter
+from cron import run_cron, check_urls
+from urls import normalize_url
 
 app = FastAPI(title="Price Tracker PoC")
 
@@ -27,8 +39,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-DATA_FILE = "tracked.json"
-AFFILIATES_FILE = "affiliates.json"
+# /check responses per normalized URL; concurrent checks of one URL share a single fetch
+check_cache = TTLCache(
+    maxsize=int(os.getenv("CHECK_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("CHECK_CACHE_TTL", "300")),
+)
+
+# Blocking fetch + parse runs here, so the event loop keeps serving redirects and static files
+check_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CHECK_WORKERS", "16")),
+    thread_name_prefix="check",
+)
+
+def collect_check_cache_metrics():
+    stats = check_cache.get_stats()
+    return [
+        ("omnibus_check_cache_requests_total", "counter",
+         "/check lookups by result (coalesced: waited for a fetch already in progress).",
+         [({"result": result}, stats[key]) for result, key in (("hit", "hits"), ("miss", "misses"), ("coalesced", "coalesced"))]),
+        ("omnibus_check_cache_hit_ratio", "gauge", "Share of /check lookups served without a new fetch.",
+         [({}, stats["hit_rate"])]),
+        ("omnibus_check_cache_size", "gauge", "Entries in the /check response cache.", [({}, stats["size"])]),
+    ]
+
+metrics.register_collector(collect_check_cache_metrics)
+
+# /out targets precomputed in memory, so a click-through does not touch the database
+router = AffiliateRouter()
 
 class CheckRequest(BaseModel):
     url: str
@@ -48,47 +85,14 @@ class AffiliateRule(BaseModel):
     template: str
     active: bool
 
-def load_data():
-    if not os.path.exists(DATA_FILE):
-        return []
-    with open(DATA_FILE, "r") as f:
-        try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return []
-
-def save_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2)
-
-def load_affiliates():
-    if not os.path.exists(AFFILIATES_FILE):
-        return {}
-    with open(AFFILIATES_FILE, "r") as f:
-        try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return {}
-
-def save_affiliates(data):
-    with open(AFFILIATES_FILE, "w") as f:
-        json.dump(data, f, indent=2)
-
-def get_domain(url):
-    try:
-        parsed = urlparse(url)
-        domain = parsed.netloc
-        # Remove www.
-        if domain.startswith("www."):
-            domain = domain[4:]
-        return domain
-    except:
-        return None
-
 @app.post("/check")
 async def check_url(request: CheckRequest):
-    # ... (existing check_url logic) ...
-    data = parse_price(request.url)
+    return await check_cache.get_or_load_async(
+        normalize_url(request.url), lambda: build_check_response(request.url), check_executor
+    )
+
+def build_check_response(url):
+    data = parse_price(url)
     
     # Handle blocked state
     if data and data.get("blocked"):
@@ -109,6 +113,21 @@ async def check_url(request: CheckRequest):
     
     current_price = data["current_price"]
     lowest_30d = data["lowest_30d_price"]
+    lowest_30d_source = "shop" if data.get("lowest_30d_scraped") else "current_price"
+    history_lowest_30d = None
+    omnibus_mismatch = False
+
+    if history.is_observation(data):
+        shop_lowest = lowest_30d if data.get("lowest_30d_scraped") else None
+        # Omnibus is the lowest price before the current one, so compare first and record after
+        history_lowest_30d, omnibus_mismatch = history.compare_with_shop(url, shop_lowest)
+        history.observe(url, current_price, shop_lowest)
+        if omnibus_mismatch:
+            print(f"Omnibus mismatch for {url}: shop says {shop_lowest}, our history says {history_lowest_30d}")
+        if shop_lowest is None and history_lowest_30d is not None:
+            # The shop did not show its Omnibus price, use our own record
+            lowest_30d = history_lowest_30d
+            lowest_30d_source = "history"
     
     if current_price < lowest_30d:
         status = "green"
@@ -124,6 +143,9 @@ async def check_url(request: CheckRequest):
         "lowest_30d": lowest_30d,
         "status": status,
         "savings": savings,
+        "lowest_30d_source": lowest_30d_source,
+        "history_lowest_30d": history_lowest_30d,
+        "omnibus_mismatch": omnibus_mismatch,
         "currency": data["currency"],
         "is_simulated": data.get("is_simulated", False),
         "warning": data.get("warning"),
@@ -132,33 +154,95 @@ async def check_url(request: CheckRequest):
         "image_url": data.get("image_url")
     }
 
+@app.post("/check/bulk")
+async def bulk_check(request: Request):
+    """
+    Checks many URLs in one call. The body is JSONL ({"url": ..., "email":
+    ...} per line) or CSV (a url column, optionally email). URLs are
+    validated and deduplicated, checked concurrently, and the results are
+    streamed back as NDJSON in completion order. Rows with an email start
+    tracking the product for that address.
+    """
+    body = await request.body()
+    try:
+        rows = bulk.read_rows(body.decode("utf-8-sig"), request.headers.get("content-type"))
+        products, rejected = bulk.plan(rows)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Plik musi być zapisany w UTF-8")
+    except bulk.TooManyUrls as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except bulk.UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(stream_bulk_results(products, rejected), media_type="application/x-ndjson")
+
+def check_for_bulk(url):
+    try:
+        return check_cache.get_or_load(normalize_url(url), lambda: build_check_response(url))
+    except HTTPException as e:
+        return {"error": e.detail}
+
+def track_for_bulk(url, emails, result):
+    """Adds tracked items for the emails not yet tracking the product; returns the emails added."""
+    added = []
+    for email in emails:
+        if storage.is_tracked(url, email):
+            continue
+        item = storage.add_item({
+            "url": url,
+            "email": email,
+            "title": result.get("title"),
+            "image_url": result.get("image_url"),
+            "status": result["status"],
+            "current_price": result["current_price"],
+            "lowest_30d": result["lowest_30d"],
+            "last_known_price": result["current_price"],
+            "last_checked": datetime.now().isoformat(),
+        })
+        router.add_item(item)
+        added.append(email)
+    return added
+
+def stream_bulk_results(products, rejected):
+    """
+    NDJSON lines for /check/bulk: rejected rows first, then one line per
+    product as its check completes, then a summary. A plain generator:
+    Starlette pulls it from a worker thread, so the event loop stays free.
+    """
+    for entry in rejected:
+        yield json.dumps(entry, ensure_ascii=False) + "\n"
+
+    summary = {"urls": len(products), "rejected": len(rejected), "ok": 0, "failed": 0, "tracked": 0}
+    urls = [product["url"] for product in products.values()]
+    for url, result in check_urls(urls, check=check_for_bulk):
+        product = products[normalize_url(url)]
+        line = {"url": url, "lines": product["lines"]}
+        if not result or "error" in result:
+            line["error"] = (result or {}).get("error") or "Nie udało się sprawdzić ceny"
+            summary["failed"] += 1
+        else:
+            line["result"] = result
+            summary["ok"] += 1
+            if product["emails"] and not result.get("blocked"):
+                line["tracked"] = track_for_bulk(url, product["emails"], result)
+                summary["tracked"] += len(line["tracked"])
+        yield json.dumps(line, ensure_ascii=False) + "\n"
+
+    yield json.dumps({"summary": summary}) + "\n"
+
 # ... (existing track_product logic) ...
 
 # --- Affiliate Endpoints ---
 
 @app.get("/out/{item_id}")
 async def affiliate_redirect(item_id: str):
-    tracked_items = load_data()
-    item = next((i for i in tracked_items if i["id"] == item_id), None)
-    
-    if not item:
+    # Affiliate link if the shop has an active rule, otherwise the original URL
+    target = router.resolve(item_id)
+
+    if not target:
         # Fallback if item not found (sould handle error better in prod, but for MVP redirect to root)
         return RedirectResponse("/")
-        
-    original_url = item["url"]
-    domain = get_domain(original_url)
-    
-    affiliates = load_affiliates()
-    
-    if domain in affiliates and affiliates[domain]["active"]:
-        template = affiliates[domain]["template"]
-        encoded_url = quote_plus(original_url)
-        # Simple replacement
-        affiliate_link = template.replace("{url}", encoded_url)
-        return RedirectResponse(affiliate_link)
-    
-    # Fallback to original URL
-    return RedirectResponse(original_url)
+
+    return RedirectResponse(target)
 
 # --- Admin API ---
 
@@ -168,25 +252,22 @@ async def get_admin_panel():
 
 @app.get("/admin/affiliates")
 async def get_affiliates():
-    return load_affiliates()
+    return storage.load_affiliates()
 
 @app.post("/admin/affiliates")
 async def update_affiliate(rule: AffiliateRule):
-    affiliates = load_affiliates()
-    affiliates[rule.domain] = {
+    storage.save_affiliate(rule.domain, {
         "network": rule.network,
         "template": rule.template,
         "active": rule.active
-    }
-    save_affiliates(affiliates)
+    })
+    router.invalidate()
     return {"status": "success", "message": f"Reguła dla {rule.domain} zaktualizowana"}
 
 @app.delete("/admin/affiliates/{domain}")
 async def delete_affiliate(domain: str):
-    affiliates = load_affiliates()
-    if domain in affiliates:
-        del affiliates[domain]
-        save_affiliates(affiliates)
+    if storage.delete_affiliate(domain):
+        router.invalidate()
         return {"status": "success", "message": "Reguła usunięta"}
     raise HTTPException(status_code=404, detail="Domena nie znaleziona")
 
@@ -206,23 +287,60 @@ async def get_frontend_direct():
 
 @app.get("/tracked")
 async def get_tracked():
-    return load_data()
+    return storage.list_items()
 
 @app.delete("/tracked/{item_id}")
 async def delete_tracked(item_id: str):
-    tracked_items = load_data()
-    updated_items = [item for item in tracked_items if item["id"] != item_id]
-    
-    if len(updated_items) == len(tracked_items):
+    if not storage.delete_item(item_id):
         raise HTTPException(status_code=404, detail="Produkt nie został znaleziony")
-        
-    save_data(updated_items)
+    router.remove_item(item_id)
+
     return {"status": "success", "message": "Produkt został usunięty"}
 
-@app.post("/run-check")
+# Limits of the downsampled /history series
+HISTORY_MAX_BUCKETS = 2000
+HISTORY_DEFAULT_DAYS = 365
+
+@app.get("/history")
+def get_history(url: str, start: Optional[int] = None, end: Optional[int] = None, buckets: int = 200):
+    """
+    Price history for charts: min/max price per time bucket over
+    [start, end) (Unix time in ms, the last year by default).
+    """
+    end = end if end is not None else int(time.time() * 1000)
+    start = start if start is not None else end - HISTORY_DEFAULT_DAYS * 86400 * 1000
+    if start >= end:
+        raise HTTPException(status_code=400, detail="Początek zakresu musi być przed końcem")
+    if not 1 <= buckets <= HISTORY_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Liczba przedziałów musi być od 1 do {HISTORY_MAX_BUCKETS}")
+    return {"url": url, "start": start, "end": end, **history.series(url, start, end, buckets)}
+
+@app.get("/stats")
+async def get_stats():
+    return {
+        "http": fetcher.get_stats(),
+        "check_cache": check_cache.get_stats(),
+        "shops": throttle.get_stats(),
+        "routing": router.get_stats(),
+        "extraction": strategies.get_stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/run-check", status_code=202)
 async def run_batch_check():
-    run_cron()
-    return {"status": "success", "message": "Batch check completed"}
+    job_id = jobs.start("batch-check", run_cron)
+    return {"status": "accepted", "job_id": job_id, "message": "Batch check started"}
+
+@app.get("/run-check/{job_id}")
+async def get_batch_check(job_id: str):
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Zadanie nie zostało znalezione")
+    return job
 
 if __name__ == "__main__":
     import uvicorn
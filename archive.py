@@ -0,0 +1,275 @@
+"""
+Compact archive for old price history.
+
+Observations older than ARCHIVE_AFTER_DAYS move out of the price_history
+table into one file per product. A file is a sequence of blocks of up to
+BLOCK_POINTS observations: a fixed header (first/last timestamp in ms,
+first/min/max price in grosze, point count, delta type codes) followed by
+the timestamp deltas and price deltas as packed `array` data, using the
+narrowest type that fits. A typical observation takes 4-6 bytes instead
+of a ~50 byte SQLite row.
+
+Files are read through mmap and only the block headers are parsed to
+find the blocks of a time range; a block that falls into a single bucket
+of a downsampled series is summarised from its header without being
+decoded, so series over years of history stay cheap. New observations
+are appended to the end of the file; only a partial last block is
+rewritten in place. Writers hold an exclusive flock() on the file and
+readers a shared one, so readers never see a half-written block.
+"""
+import bisect
+import fcntl
+import hashlib
+import itertools
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import OrderedDict
+import storage
+
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "45"))
+BLOCK_POINTS = 512
+# Files whose block headers are kept parsed in memory
+INDEX_SIZE = int(os.getenv("ARCHIVE_INDEX_SIZE", "1024"))
+
+# magic, count, first_ms, last_ms, first_price, min_price, max_price, time code, price code
+HEADER = struct.Struct("<4sIqqiii2s2s")
+MAGIC = b"OPA1"
+
+_index = OrderedDict()
+_lock = threading.Lock()
+
+
+def archive_dir():
+    return os.getenv("OMNIBUS_ARCHIVE") or os.path.splitext(storage.DB_FILE)[0] + "_archive"
+
+
+def path_for(norm_url):
+    name = hashlib.sha1(norm_url.encode()).hexdigest()[:20]
+    return os.path.join(archive_dir(), name[:2], name + ".bin")
+
+
+def _narrowest(values, codes):
+    for code in codes:
+        limit = 1 << (array(code).itemsize * 8 - 1)
+        if all(-limit <= value < limit for value in values):
+            return code
+    return codes[-1]
+
+
+def encode_block(points):
+    """Packs [(ms, grosze)] (sorted by time) into one block."""
+    times = [ms for ms, _ in points]
+    prices = [grosze for _, grosze in points]
+    time_deltas = [b - a for a, b in zip(times, times[1:])]
+    price_deltas = [b - a for a, b in zip(prices, prices[1:])]
+    time_code = _narrowest(time_deltas, "iq")
+    price_code = _narrowest(price_deltas, "hi")
+    header = HEADER.pack(MAGIC, len(points), times[0], times[-1], prices[0], min(prices), max(prices),
+                         time_code.encode().ljust(2), price_code.encode().ljust(2))
+    return header + array(time_code, time_deltas).tobytes() + array(price_code, price_deltas).tobytes()
+
+
+class Block:
+    __slots__ = ("offset", "count", "first_ms", "last_ms", "first_price", "min_price", "max_price",
+                 "time_code", "price_code", "size")
+
+    def __init__(self, buffer, offset):
+        (magic, self.count, self.first_ms, self.last_ms, self.first_price, self.min_price, self.max_price,
+         time_code, price_code) = HEADER.unpack_from(buffer, offset)
+        if magic != MAGIC:
+            raise ValueError(f"Corrupt archive block at offset {offset}")
+        self.offset = offset
+        self.time_code = time_code.decode().strip()
+        self.price_code = price_code.decode().strip()
+        deltas = self.count - 1
+        self.size = HEADER.size + deltas * (array(self.time_code).itemsize + array(self.price_code).itemsize)
+
+    def columns(self, buffer):
+        """(timestamps, prices) of the block as two lists."""
+        start = self.offset + HEADER.size
+        split = start + (self.count - 1) * array(self.time_code).itemsize
+        time_deltas = array(self.time_code)
+        time_deltas.frombytes(buffer[start:split])
+        price_deltas = array(self.price_code)
+        price_deltas.frombytes(buffer[split:self.offset + self.size])
+        return (list(itertools.accumulate(time_deltas, initial=self.first_ms)),
+                list(itertools.accumulate(price_deltas, initial=self.first_price)))
+
+    def decode(self, buffer):
+        """[(ms, grosze)] of the block."""
+        return list(zip(*self.columns(buffer)))
+
+
+def _blocks(path, file, buffer):
+    """
+    Block headers of a file, cached until the file changes. A block cut
+    short by a crash while it was written is left out.
+    """
+    stat = os.fstat(file.fileno())
+    key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        cached = _index.get(path)
+        if cached and cached[0] == key:
+            _index.move_to_end(path)
+            return cached[1]
+    blocks = []
+    offset = 0
+    while offset + HEADER.size <= len(buffer):
+        block = Block(buffer, offset)
+        if offset + block.size > len(buffer):
+            break
+        blocks.append(block)
+        offset += block.size
+    with _lock:
+        _index[path] = (key, blocks)
+        _index.move_to_end(path)
+        while len(_index) > INDEX_SIZE:
+            _index.popitem(last=False)
+    return blocks
+
+
+class _Mapped:
+    """Context manager mapping a product's archive file read-only; None if there is no archive."""
+
+    def __init__(self, norm_url):
+        self.path = path_for(norm_url)
+        self.file = self.buffer = None
+
+    def __enter__(self):
+        try:
+            self.file = open(self.path, "rb")
+        except FileNotFoundError:
+            return None
+        fcntl.flock(self.file, fcntl.LOCK_SH)
+        if os.fstat(self.file.fileno()).st_size == 0:
+            return None
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    def __exit__(self, *exc):
+        if self.buffer is not None:
+            self.buffer.close()
+        if self.file is not None:
+            self.file.close()  # also releases the lock
+
+    def blocks(self):
+        return _blocks(self.path, self.file, self.buffer)
+
+
+def append(norm_url, points):
+    """
+    Adds [(ms, grosze)] observations to a product's archive and returns
+    how many were added. Points not newer than the last archived one are
+    skipped, so archiving the same rows again (after a crash before they
+    were deleted from the database) is harmless.
+    """
+    points = sorted(points)
+    if not points:
+        return 0
+    path = path_for(norm_url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), "r+b") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        offset, tail = 0, []
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                blocks = _blocks(path, f, buffer)
+                if blocks:
+                    last = blocks[-1]
+                    points = [point for point in points if point[0] > last.last_ms]
+                    if not points:
+                        return 0
+                    # A partial last block is merged with the new points and rewritten in place
+                    if last.count < BLOCK_POINTS:
+                        offset, tail = last.offset, last.decode(buffer)
+                    else:
+                        offset = last.offset + last.size
+
+        merged = tail + points
+        f.seek(offset)
+        f.write(b"".join(encode_block(merged[i:i + BLOCK_POINTS]) for i in range(0, len(merged), BLOCK_POINTS)))
+        f.truncate()  # drops a block cut short by a crash
+    return len(points)
+
+
+def first_ms(norm_url):
+    """Timestamp of the oldest archived observation, or None."""
+    with _Mapped(norm_url) as mapped:
+        blocks = mapped.blocks() if mapped else []
+    return blocks[0].first_ms if blocks else None
+
+
+class Downsampler:
+    """Min/max price per fixed-width time bucket over [start_ms, end_ms)."""
+
+    def __init__(self, start_ms, end_ms, buckets):
+        self.start = start_ms
+        self.end = end_ms
+        self.width = max(1, -(-(end_ms - start_ms) // buckets))
+        self.buckets = {}
+
+    def _bucket(self, index, low, high):
+        bucket = self.buckets.get(index)
+        if bucket is None:
+            self.buckets[index] = [low, high]
+        else:
+            bucket[0] = min(bucket[0], low)
+            bucket[1] = max(bucket[1], high)
+
+    def add(self, ms, grosze):
+        if self.start <= ms < self.end:
+            self._bucket((ms - self.start) // self.width, grosze, grosze)
+
+    def add_block(self, block, buffer):
+        if block.last_ms < self.start or block.first_ms >= self.end:
+            return
+        first = (block.first_ms - self.start) // self.width
+        if block.first_ms >= self.start and block.last_ms < self.end and first == (block.last_ms - self.start) // self.width:
+            self._bucket(first, block.min_price, block.max_price)
+            return
+        # Otherwise split the decoded block at bucket boundaries and take min/max per slice
+        times, prices = block.columns(buffer)
+        low = bisect.bisect_left(times, self.start)
+        end = bisect.bisect_left(times, self.end)
+        while low < end:
+            index = (times[low] - self.start) // self.width
+            high = min(end, bisect.bisect_left(times, self.start + (index + 1) * self.width, low))
+            self._bucket(index, min(prices[low:high]), max(prices[low:high]))
+            low = high
+
+    def series(self):
+        """[[bucket start ms, min price, max price]] for the buckets that have data."""
+        return [
+            [self.start + index * self.width, low / 100, high / 100]
+            for index, (low, high) in sorted(self.buckets.items())
+        ]
+
+
+def downsample(norm_url, start_ms, end_ms, buckets):
+    """Feeds the archived observations of [start_ms, end_ms) into a Downsampler and returns it."""
+    sampler = Downsampler(start_ms, end_ms, buckets)
+    with _Mapped(norm_url) as mapped:
+        if mapped is not None:
+            for block in mapped.blocks():
+                sampler.add_block(block, mapped.buffer)
+    return sampler
+
+
+def archive_history(after_days=ARCHIVE_AFTER_DAYS, now=None):
+    """
+    Moves price_history rows older than `after_days` into the archive, one
+    product at a time, and returns the number of rows moved. `after_days`
+    must stay above the 30-day Omnibus window, which is read from the table.
+    """
+    cutoff = (now or time.time()) - after_days * 86400
+    moved = 0
+    for norm_url in storage.history_products(until=cutoff):
+        rows = storage.history_rows(norm_url, until=cutoff)
+        append(norm_url, [(round(observed_at * 1000), round(price * 100)) for observed_at, price in rows])
+        storage.delete_history(norm_url, until=cutoff)
+        moved += len(rows)
+    return moved
@@ -0,0 +1,109 @@
+"""
+Load test: redirect latency while slow checks are running.
+
+Starts the API on a local port with a temporary database, plus a stub shop
+that takes SHOP_DELAY seconds per page. Measures /out/{id} latency alone,
+then again while concurrent /check requests and a /run-check batch job are
+hitting the slow shop.
+
+Usage: python3 bench_app.py [checks] [shop_delay_seconds]
+"""
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+TMP_DIR = tempfile.mkdtemp(prefix="omnibus-bench-")
+os.environ["OMNIBUS_DB"] = os.path.join(TMP_DIR, "omnibus.db")
+os.environ["FETCH_CACHE_FILE"] = os.path.join(TMP_DIR, "http_cache.json")
+os.environ["SHOP_RATE"] = os.environ["SHOP_BURST"] = "1000"
+
+import requests
+import uvicorn
+
+import app as api
+import storage
+from bench_cron import start_shops
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_api():
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def measure_redirects(base, item_id, seconds):
+    session = requests.Session()
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = session.get(f"{base}/out/{item_id}", allow_redirects=False)
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 307, response.status_code
+    return latencies
+
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{label:<28} n={len(latencies):<5} p50={p50:6.2f}ms  p99={p99:6.2f}ms  max={latencies[-1]:6.2f}ms")
+
+
+def main():
+    checks = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+
+    shop = start_shops(1, delay)[0]
+    shop_url = f"http://127.0.0.1:{shop.server_port}"
+    server, base = start_api()
+
+    item = storage.add_item({"url": f"{shop_url}/tracked", "email": "bench@example.invalid", "last_known_price": 100})
+    for i in range(20):
+        storage.add_item({"url": f"{shop_url}/batch/{i}", "email": "bench@example.invalid", "last_known_price": 100})
+
+    # Count database queries while only redirects are served (the routing table is built on the first one)
+    queries = []
+    get_connection = storage.get_connection
+    storage.get_connection = lambda: queries.append(1) or get_connection()
+    measure_redirects(base, item["id"], 0.1)
+    queries.clear()
+    report("redirects, idle", measure_redirects(base, item["id"], 2))
+    storage.get_connection = get_connection
+    print(f"database queries while serving redirects: {len(queries)}")
+
+    def check(i):
+        requests.post(f"{base}/check", json={"url": f"{shop_url}/check/{i}"})
+
+    workers = [threading.Thread(target=check, args=(i,)) for i in range(checks)]
+    for worker in workers:
+        worker.start()
+    job = requests.post(f"{base}/run-check").json()
+
+    report(f"redirects, {checks} checks + batch", measure_redirects(base, item["id"], delay * 1.5))
+
+    for worker in workers:
+        worker.join()
+    while requests.get(f"{base}/run-check/{job['job_id']}").json()["status"] == "running":
+        time.sleep(0.2)
+    print(f"batch job finished; /check cache: {requests.get(f'{base}/stats').json()['check_cache']}")
+
+    server.should_exit = True
+    shop.shutdown()
+
+
+if __name__ == "__main__":
+    main()
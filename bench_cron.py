@@ -0,0 +1,93 @@
+"""
+Benchmark for the concurrent batch checker.
+
+Starts a few local stub shops (one HTTP server per port, so each counts as a
+separate domain), each answering with a fixed delay, and compares a
+sequential check with cron.check_items.
+
+Usage: python3 bench_cron.py [shops] [items_per_shop] [delay_seconds]
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Stub shops don't need protecting: lift the per-shop rate limit, keep state out of the repo
+os.environ.setdefault("SHOP_RATE", "1000")
+os.environ.setdefault("SHOP_BURST", "1000")
+os.environ.setdefault("OMNIBUS_DB", os.path.join(tempfile.mkdtemp(prefix="omnibus-bench-"), "omnibus.db"))
+
+from parser import parse_price
+import cron
+
+PAGE = b"""<html><head>
+<meta property="og:title" content="Stub Product">
+<meta property="product:price:amount" content="199.00">
+</head><body>199,00 PLN</body></html>"""
+
+
+def make_handler(delay):
+    class StubShop(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.server.hits.append(self.path)
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(PAGE)))
+            self.end_headers()
+            self.wfile.write(PAGE)
+
+        def log_message(self, *args):
+            pass
+    return StubShop
+
+
+def start_shops(count, delay):
+    servers = []
+    for _ in range(count):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(delay))
+        server.hits = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def main():
+    shops = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    per_shop = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    delay = float(sys.argv[3]) if len(sys.argv) > 3 else 0.2
+
+    servers = start_shops(shops, delay)
+    items = [
+        {"id": f"{s}-{i}", "url": f"http://127.0.0.1:{server.server_port}/product/{i}"}
+        for s, server in enumerate(servers)
+        for i in range(per_shop)
+    ]
+    print(f"{len(items)} items across {shops} stub shops, {delay}s per request")
+
+    # parse_price prints a line per fallback; keep the benchmark output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        for item in items:
+            parse_price(item["url"])
+        sequential = time.perf_counter() - started
+    print(f"sequential:  {sequential:.2f}s")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        checked = sum(1 for _ in cron.check_urls([item["url"] for item in items]))
+        concurrent = time.perf_counter() - started
+    print(f"concurrent:  {concurrent:.2f}s  ({checked} items, "
+          f"max_workers={cron.MAX_WORKERS}, per_domain={cron.PER_DOMAIN_LIMIT})")
+    print(f"speedup:     {sequential / concurrent:.1f}x")
+
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Extractor throughput over the saved HTML fixtures in fixtures/<domain>/.
+
+For every fixture, runs parser.extract() repeatedly and reports pages/sec
+per extractor, next to the cost of building a full html.parser tree (what
+parse_price did for every page before the extractor registry).
+
+Usage: python3 bench_extractors.py [seconds_per_fixture]
+"""
+import glob
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+from bs4 import BeautifulSoup
+
+from extractors import Document, extractor_for
+from parser import extract
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixtures():
+    fixtures = []
+    for spec_path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*", "*.json"))):
+        with open(spec_path) as f:
+            spec = json.load(f)
+        with open(spec_path[:-5] + ".html", encoding="utf-8") as f:
+            spec["html"] = f.read()
+        spec["name"] = os.path.relpath(spec_path[:-5], FIXTURES_DIR)
+        fixtures.append(spec)
+    return fixtures
+
+
+def rate(fn, seconds):
+    count = 0
+    started = time.perf_counter()
+    while True:
+        fn()
+        count += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            return count / elapsed
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    per_extractor = defaultdict(list)
+
+    print(f"{'fixture':<40} {'KB':>6} {'extractor':>10} {'pages/s':>9} {'full tree':>10} {'tree?':>6}")
+    for fixture in load_fixtures():
+        url, text = fixture["url"], fixture["html"]
+        extractor = extractor_for(url).name
+        doc = Document(text)
+        extractor_for(url).extract(doc, url)
+
+        fast = rate(lambda: extract(url, text), seconds)
+        full = rate(lambda: BeautifulSoup(text, "html.parser"), seconds)
+        per_extractor[extractor].append(fast)
+        print(f"{fixture['name']:<40} {len(text) // 1024:>6} {extractor:>10} {fast:>9.1f} {full:>10.1f} {'yes' if doc.has_tree else 'no':>6}")
+
+    print()
+    for extractor, rates in sorted(per_extractor.items()):
+        print(f"{extractor:<12} {sum(rates) / len(rates):>9.1f} pages/s (mean over {len(rates)} fixtures)")
+
+
+if __name__ == "__main__":
+    main()
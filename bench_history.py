@@ -0,0 +1,77 @@
+"""
+Benchmark for the price history archive (archive.py).
+
+Fills price_history with years of checks for one product, then compares
+a downsampled chart series (min/max per bucket, as served by /history)
+computed from the SQLite rows with the same series after the rows were
+moved to the archive, plus the space each takes.
+
+Usage: python3 bench_history.py [years] [checks_per_day] [buckets]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+_TMP_DIR = tempfile.mkdtemp(prefix="omnibus-bench-")
+os.environ["OMNIBUS_DB"] = os.path.join(_TMP_DIR, "omnibus.db")
+os.environ["OMNIBUS_ARCHIVE"] = os.path.join(_TMP_DIR, "archive")
+
+import archive
+import history
+import storage
+
+URL = "https://shop.pl/p"
+
+
+def fill(years, per_day, now):
+    rng = random.Random(1)
+    step = 86400 / per_day
+    count = int(years * 365 * per_day)
+    price = 499.99
+    rows = []
+    for i in range(count):
+        if rng.random() < 0.02:
+            price = round(max(1.0, price + rng.choice([-50, -10, 10, 50]) + rng.choice([0.0, 0.99])), 2)
+        rows.append((URL, now - (count - i) * step, price))
+    with storage.transaction() as conn:
+        conn.executemany("INSERT INTO price_history (norm_url, observed_at, price) VALUES (?, ?, ?)", rows)
+    return count
+
+
+def timed(function, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return result, min(timings)
+
+
+def main():
+    years = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    per_day = int(sys.argv[2]) if len(sys.argv) > 2 else 96
+    buckets = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+    now = time.time()
+    count = fill(years, per_day, now)
+    start, end = int((now - years * 365 * 86400) * 1000), int(now * 1000)
+
+    storage.get_connection().execute("VACUUM")
+    db_size = os.path.getsize(storage.DB_FILE)
+    before, sqlite_seconds = timed(lambda: history.series(URL, start, end, buckets))
+
+    started = time.perf_counter()
+    moved = archive.archive_history(now=now)
+    archive_seconds = time.perf_counter() - started
+    after, archived_seconds = timed(lambda: history.series(URL, start, end, buckets))
+    archive_size = os.path.getsize(archive.path_for(URL))
+
+    print(f"{count} observations over {years} years, {buckets} buckets; {moved} archived in {archive_seconds:.2f}s")
+    print(f"sqlite rows:  {sqlite_seconds * 1000:8.1f} ms per series, {db_size / count:5.1f} bytes/observation (table + index)")
+    print(f"archive:      {archived_seconds * 1000:8.1f} ms per series, {archive_size / moved:5.1f} bytes/observation")
+    print(f"series identical: {before == after}")
+
+
+if __name__ == "__main__":
+    main()
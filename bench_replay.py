@@ -0,0 +1,231 @@
+"""
+Offline record/replay harness over the saved shop pages in fixtures/<domain>/.
+
+    python3 bench_replay.py record URL [NAME]   save a live page as a fixture
+    python3 bench_replay.py [--seconds S] [--update-baseline]
+
+Replay serves the fixtures through a local requests transport adapter, so
+every page goes through the full parse_price() path (rate limiter,
+fetcher, streaming, extractor) without touching the network. It checks
+the extracted fields against each fixture's "expected" block, reports
+throughput, p50/p99 latency and peak memory per extractor, and compares
+them with fixtures/baseline.json. Exits with status 1 on a wrong result
+or when an extractor got more than --tolerance slower or hungrier.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+# Replayed pages must not be rate-limited or touch the real state files
+os.environ.setdefault("SHOP_RATE", "1e9")
+os.environ.setdefault("SHOP_BURST", "1e9")
+os.environ.setdefault("OMNIBUS_DB", os.path.join(tempfile.mkdtemp(prefix="omnibus-replay-"), "omnibus.db"))
+
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+import fetcher
+from bench_extractors import FIXTURES_DIR, load_fixtures
+from extractors import extractor_for
+from parser import extract, parse_price
+from urls import get_domain
+
+BASELINE_FILE = os.path.join(FIXTURES_DIR, "baseline.json")
+DEFAULT_HEADERS = {"Content-Type": "text/html; charset=utf-8"}
+
+
+class ReplayAdapter(HTTPAdapter):
+    """Transport adapter answering requests from fixtures instead of the network (404 if unknown)."""
+
+    def __init__(self, fixtures):
+        super().__init__()
+        self.pages = {fixture["url"]: fixture for fixture in fixtures}
+        self.requests = 0
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        self.requests += 1
+        fixture = self.pages.get(request.url)
+        if fixture is None:
+            body, status, headers = b"", 404, {}
+        else:
+            # Fixtures are stored as UTF-8 whatever the shop sent
+            body, status, headers = fixture["html"].encode("utf-8"), fixture.get("status", 200), dict(DEFAULT_HEADERS)
+        headers["Content-Length"] = str(len(body))
+        raw = HTTPResponse(body=io.BytesIO(body), headers=headers, status=status,
+                           preload_content=False, decode_content=False, request_method=request.method)
+        response = self.build_response(request, raw)
+        if not stream:
+            response.content
+        return response
+
+
+@contextlib.contextmanager
+def replay(fixtures):
+    """Routes the fetcher's session through a ReplayAdapter for the duration of the block."""
+    session = fetcher.get_session()
+    saved = dict(session.adapters)
+    adapter = ReplayAdapter(fixtures)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    try:
+        yield adapter
+    finally:
+        session.adapters.clear()
+        for prefix, previous in saved.items():
+            session.mount(prefix, previous)
+
+
+def check_result(expected, result):
+    """
+    Compares a parse_price() result with a fixture's expected extract()
+    fields. Returns the names of the fields that differ.
+    """
+    wrong = []
+    if expected["current_price"] is None:
+        if not result.get("is_dummy"):
+            wrong.append("current_price")
+    else:
+        if result.get("current_price") != expected["current_price"]:
+            wrong.append("current_price")
+        for field in ("title", "image_url"):
+            if result.get(field) != expected[field]:
+                wrong.append(field)
+    if expected["lowest_30d"] is None:
+        if result.get("lowest_30d_scraped"):
+            wrong.append("lowest_30d")
+    elif not result.get("lowest_30d_scraped") or result.get("lowest_30d_price") != expected["lowest_30d"]:
+        wrong.append("lowest_30d")
+    return wrong
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(fixtures, seconds):
+    """
+    Replays every fixture for about `seconds` and returns (per-extractor
+    stats, {fixture name: wrong fields}). Peak memory is taken from a
+    separate tracemalloc pass, so tracing does not skew the timings.
+    """
+    latencies = defaultdict(list)
+    peaks = defaultdict(int)
+    failures = {}
+
+    with replay(fixtures), contextlib.redirect_stdout(io.StringIO()):
+        for fixture in fixtures:
+            url, extractor = fixture["url"], extractor_for(fixture["url"]).name
+            wrong = check_result(fixture["expected"], parse_price(url))
+            if wrong:
+                failures[fixture["name"]] = wrong
+
+            tracemalloc.start()
+            parse_price(url)
+            peaks[extractor] = max(peaks[extractor], tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+            started = time.perf_counter()
+            while time.perf_counter() - started < seconds:
+                call_started = time.perf_counter()
+                parse_price(url)
+                latencies[extractor].append(time.perf_counter() - call_started)
+
+    stats = {}
+    for extractor, samples in sorted(latencies.items()):
+        stats[extractor] = {
+            "pages_per_s": round(len(samples) / sum(samples), 1),
+            "p50_ms": round(percentile(samples, 0.5) * 1000, 3),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+            "peak_kb": round(peaks[extractor] / 1024, 1),
+        }
+    return stats, failures
+
+
+def compare(stats, baseline, tolerance):
+    """
+    Returns messages for every extractor whose median latency or peak
+    memory is worse than the baseline by more than `tolerance` (p99 is
+    reported but too noisy to gate on).
+    """
+    regressions = []
+    for extractor, current in stats.items():
+        previous = baseline.get(extractor)
+        if not previous:
+            continue
+        for metric in ("p50_ms", "peak_kb"):
+            if current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{extractor}: {metric} {previous[metric]} -> {current[metric]}")
+    return regressions
+
+
+def record(url, name=None):
+    """Downloads a live page and saves it as fixtures/<domain>/<name>.html plus its .json spec."""
+    response = fetcher.get_session().get(url, timeout=fetcher.TIMEOUT)
+    domain = get_domain(url)
+    name = name or url.rstrip("/").rsplit("/", 1)[-1].split(".")[0] or "index"
+    directory = os.path.join(FIXTURES_DIR, domain)
+    os.makedirs(directory, exist_ok=True)
+
+    spec = {
+        "url": url,
+        "status": response.status_code,
+        "expected": extract(url, response.text),
+    }
+    with open(os.path.join(directory, name + ".html"), "w", encoding="utf-8") as f:
+        f.write(response.text)
+    with open(os.path.join(directory, name + ".json"), "w", encoding="utf-8") as f:
+        json.dump(spec, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    print(f"Saved {domain}/{name} ({len(response.text) // 1024} KB). Check the expected fields:")
+    print(json.dumps(spec["expected"], indent=2, ensure_ascii=False))
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "record":
+        record(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+        return
+
+    cli = argparse.ArgumentParser(description="Replays the saved shop pages through parse_price.")
+    cli.add_argument("--seconds", type=float, default=1.0, help="timing per fixture")
+    cli.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown against the baseline")
+    cli.add_argument("--update-baseline", action="store_true", help=f"store the results in {BASELINE_FILE}")
+    args = cli.parse_args()
+
+    fixtures = load_fixtures()
+    stats, failures = measure(fixtures, args.seconds)
+
+    print(f"{'extractor':<10} {'pages/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'peak KB':>8}")
+    for extractor, entry in stats.items():
+        print(f"{extractor:<10} {entry['pages_per_s']:>9} {entry['p50_ms']:>8} {entry['p99_ms']:>8} {entry['peak_kb']:>8}")
+    print(f"{len(fixtures) - len(failures)}/{len(fixtures)} fixtures extracted correctly")
+    for name, wrong in failures.items():
+        print(f"  WRONG {name}: {', '.join(wrong)}")
+
+    if args.update_baseline:
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(stats, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {BASELINE_FILE}")
+        regressions = []
+    elif os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            regressions = compare(stats, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"  SLOWER {message}")
+    else:
+        regressions = []
+        print("No baseline yet; run with --update-baseline to store one")
+
+    sys.exit(1 if failures or regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
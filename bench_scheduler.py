@@ -0,0 +1,98 @@
+"""
+Simulation: price changes caught by the adaptive scheduler vs checking
+products round-robin, with the same number of fetches.
+
+Products change price as Poisson processes with different rates (a few
+volatile ones, most stable). Every hour the checker may fetch `budget`
+products. A check "catches" a change if the price differs from the
+previous check.
+
+Usage: python3 bench_scheduler.py [products] [budget_per_hour] [days]
+"""
+import random
+import sys
+
+from scheduler import Scheduler, DEFAULT_INTERVAL
+
+HOUR = 3600
+# (share of products, mean price changes per day)
+PROFILES = [(0.05, 6.0), (0.15, 1.0), (0.30, 0.2), (0.50, 0.02)]
+
+
+def make_products(count, days, rng):
+    products = []
+    for i in range(count):
+        roll, rate = rng.random(), PROFILES[-1][1]
+        for share, profile_rate in PROFILES:
+            if roll < share:
+                rate = profile_rate
+                break
+            roll -= share
+        changes, t = [], 0.0
+        while True:
+            t += rng.expovariate(rate / 86400)
+            if t > days * 86400:
+                break
+            changes.append(t)
+        products.append(changes)
+    return products
+
+
+def changes_between(changes, start, end):
+    return any(start < t <= end for t in changes)
+
+
+def simulate(products, budget, days, pick):
+    last_checked = [0.0] * len(products)
+    caught = fetches = 0
+    for hour in range(1, days * 24 + 1):
+        now = hour * HOUR
+        for i in pick(now, budget):
+            fetches += 1
+            changed = changes_between(products[i], last_checked[i], now)
+            caught += changed
+            last_checked[i] = now
+            pick.feedback(i, now, changed)
+    return caught, fetches
+
+
+class RoundRobin:
+    def __init__(self, count):
+        self.count, self.cursor = count, 0
+
+    def __call__(self, now, budget):
+        picked = [(self.cursor + k) % self.count for k in range(budget)]
+        self.cursor = (self.cursor + budget) % self.count
+        return picked
+
+    def feedback(self, i, now, changed):
+        pass
+
+
+class Adaptive:
+    def __init__(self, count):
+        self.scheduler = Scheduler((i, 0.0, DEFAULT_INTERVAL) for i in range(count))
+
+    def __call__(self, now, budget):
+        return self.scheduler.pop_due(now, budget)
+
+    def feedback(self, i, now, changed):
+        self.scheduler.reschedule(i, now, changed)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    budget = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    days = int(sys.argv[3]) if len(sys.argv) > 3 else 14
+
+    products = make_products(count, days, random.Random(42))
+    total = sum(len(changes) for changes in products)
+    print(f"{count} products, {total} price changes over {days} days, budget {budget} fetches/hour")
+
+    for name, pick in [("round-robin", RoundRobin(count)), ("adaptive", Adaptive(count))]:
+        caught, fetches = simulate(products, budget, days, pick)
+        print(f"{name:<12} fetches={fetches:<7} changes caught={caught:<6} per 1000 fetches={1000 * caught / fetches:.1f}")
+
+
+if __name__ == "__main__":
+    main()
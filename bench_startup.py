@@ -0,0 +1,60 @@
+"""
+Cold-start benchmark for the command line entry points.
+
+Runs each command in a fresh interpreter against a temporary database
+with one tracked product that is not due, so `check --due` has nothing to
+fetch, and reports the median wall time over N runs. Also shows the cost
+of importing the modules the commands now avoid loading.
+
+Usage: python3 bench_startup.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+_TMP_DIR = tempfile.mkdtemp(prefix="omnibus-startup-")
+os.environ["OMNIBUS_DB"] = os.path.join(_TMP_DIR, "omnibus.db")
+os.environ["FETCH_CACHE_FILE"] = os.path.join(_TMP_DIR, "http_cache.json")
+
+import storage
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+COMMANDS = {
+    "python -c pass": ["-c", "pass"],
+    "omnibus.py check --due": ["omnibus.py", "check", "--due"],
+    "omnibus.py stats": ["omnibus.py", "stats"],
+    "import parser, alerts": ["-c", "import parser, alerts"],
+}
+
+
+def prepare():
+    storage.add_item({"id": "1", "url": "https://shop.pl/a", "email": "a@x.pl", "last_known_price": 100})
+    storage.sync_schedule(storage.list_products(), 3600)
+    with storage.transaction() as conn:
+        conn.execute("UPDATE schedule SET next_check_at = ?", (time.time() + 86400,))
+    storage.close()
+
+
+def measure(args, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=HERE, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    prepare()
+    print(f"{'command':<26} {'median ms':>10}")
+    for name, args in COMMANDS.items():
+        print(f"{name:<26} {measure(args, runs) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark for cron worker mode (cron.py --worker).
+
+Fills a temporary database with products spread over a few local stub
+shops, then runs 1, 2, 4, ... worker processes against it and reports
+throughput, checking that every product was fetched exactly once and no
+lease was left behind. Checks are I/O-bound, so throughput grows with the
+number of workers until the CPU (process start-up, parsing) saturates.
+
+Usage: python3 bench_workers.py [max_workers] [shops] [items_per_shop] [delay_seconds]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Stub shops don't need protecting: lift the per-shop rate limit, keep state out of the repo
+_TMP_DIR = tempfile.mkdtemp(prefix="omnibus-bench-")
+os.environ.setdefault("SHOP_RATE", "1000")
+os.environ.setdefault("SHOP_BURST", "1000")
+os.environ["OMNIBUS_DB"] = os.path.join(_TMP_DIR, "omnibus.db")
+os.environ["FETCH_CACHE_FILE"] = os.path.join(_TMP_DIR, "http_cache.json")
+
+import storage
+from bench_cron import start_shops
+from scheduler import DEFAULT_INTERVAL
+
+
+def reset(servers):
+    for server in servers:
+        server.hits.clear()
+    conn = storage.get_connection()
+    conn.execute("UPDATE schedule SET next_check_at = 0, checks = 0, last_price = NULL, "
+                 "lease_owner = NULL, lease_until = NULL")
+
+
+def run_workers(count, batch):
+    command = [sys.executable, "cron.py", "--worker", "--exit-when-idle", "--batch", str(batch)]
+    started = time.perf_counter()
+    processes = [subprocess.Popen(command, stdout=subprocess.DEVNULL) for _ in range(count)]
+    for process in processes:
+        process.wait()
+    return time.perf_counter() - started
+
+
+def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    shops = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    per_shop = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    delay = float(sys.argv[4]) if len(sys.argv) > 4 else 0.2
+    batch = 40
+
+    servers = start_shops(shops, delay)
+    for s, server in enumerate(servers):
+        for i in range(per_shop):
+            # Same price as the stub page, so no alerts are queued
+            storage.add_item({"id": f"{s}-{i}", "url": f"http://127.0.0.1:{server.server_port}/product/{i}",
+                              "email": "bench@example.com", "last_known_price": 199.0})
+    storage.sync_schedule(storage.list_products(), DEFAULT_INTERVAL)
+    total = shops * per_shop
+    print(f"{total} products across {shops} stub shops, {delay}s per request, batch {batch}")
+
+    baseline = None
+    count = 1
+    while count <= max_workers:
+        reset(servers)
+        elapsed = run_workers(count, batch)
+        fetched = [(server.server_port, path) for server in servers for path in server.hits]
+        leftover = sum(1 for row in storage.load_schedule().values() if row["lease_owner"])
+        baseline = baseline or total / elapsed
+        print(f"{count} worker(s): {elapsed:6.2f}s  {total / elapsed:7.1f} products/s  "
+              f"scaling {total / elapsed / baseline:.2f}x  fetched {len(set(fetched))}/{total} ({len(fetched) - len(set(fetched))} twice)  leases left {leftover}")
+        count *= 2
+
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import csv
+import io
+import json
+import os
+from urllib.parse import urlparse
+from urls import normalize_url
+
+# Largest upload accepted by /check/bulk, in URLs
+MAX_URLS = int(os.getenv("BULK_MAX_URLS", "10000"))
+MAX_URL_LENGTH = 2048
+
+JSONL_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines", "application/json")
+CSV_TYPES = ("text/csv", "application/csv")
+
+
+class UploadError(ValueError):
+    """The upload as a whole cannot be read."""
+
+
+class TooManyUrls(UploadError):
+    pass
+
+
+def read_rows(text, content_type=None):
+    """
+    Parses a JSONL or CSV upload into (line number, {"url", "email"}) rows.
+    JSONL lines are objects with a "url" key (or bare URL strings); CSV
+    either has a header with a "url" column or one URL per line. The
+    format comes from the content type, or is guessed from the first line.
+    """
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    first_line = next((line.strip() for line in text.splitlines() if line.strip()), "")
+    if content_type in JSONL_TYPES or (content_type not in CSV_TYPES and first_line[:1] in ("{", '"')):
+        return _read_jsonl(text)
+    return _read_csv(text)
+
+
+def _read_jsonl(text):
+    rows = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            value = json.loads(line)
+        except json.JSONDecodeError:
+            rows.append((number, {"url": line.strip(), "error": "Niepoprawny JSON"}))
+            continue
+        if isinstance(value, str):
+            value = {"url": value}
+        if not isinstance(value, dict):
+            rows.append((number, {"url": line.strip(), "error": "Oczekiwano obiektu z polem url"}))
+            continue
+        rows.append((number, {"url": value.get("url"), "email": value.get("email")}))
+    return rows
+
+
+def _read_csv(text):
+    lines = list(csv.reader(io.StringIO(text)))
+    header = [column.strip().lower() for column in lines[0]] if lines else []
+    if "url" in header:
+        url_column = header.index("url")
+        email_column = header.index("email") if "email" in header else None
+        start = 1
+    elif any("://" in cell for cell in header):
+        url_column, email_column, start = 0, None, 0
+    else:
+        raise UploadError("Plik CSV musi mieć kolumnę url")
+
+    rows = []
+    for number, cells in enumerate(lines[start:], start + 1):
+        if not any(cell.strip() for cell in cells):
+            continue
+        url = cells[url_column].strip() if url_column < len(cells) else ""
+        email = cells[email_column].strip() if email_column is not None and email_column < len(cells) else None
+        rows.append((number, {"url": url, "email": email or None}))
+    return rows
+
+
+def validate_url(url):
+    """Returns a reason why `url` cannot be checked, or None if it looks fine."""
+    if not isinstance(url, str) or not url.strip():
+        return "Brak URL"
+    if len(url) > MAX_URL_LENGTH:
+        return "URL jest za długi"
+    parsed = urlparse(url.strip())
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return "Niepoprawny URL"
+    return None
+
+
+def plan(rows):
+    """
+    Validates and deduplicates upload rows. Returns (products, rejected):
+    products maps each normalized URL to {"url", "lines", "emails"}, in
+    upload order, so each product is checked once however often it was
+    listed; rejected lists {"line", "url", "error"} for unusable rows and
+    exact duplicates (same product, same email).
+    """
+    products = {}
+    rejected = []
+    for number, row in rows:
+        url = row.get("url")
+        error = row.get("error") or validate_url(url)
+        if error:
+            rejected.append({"line": number, "url": url, "error": error})
+            continue
+        url = url.strip()
+        product = products.setdefault(normalize_url(url), {"url": url, "lines": [], "emails": []})
+        email = row.get("email")
+        if product["lines"] and (email is None or email in product["emails"]):
+            rejected.append({"line": number, "url": url, "error": "Duplikat", "duplicate_of": product["lines"][0]})
+            continue
+        product["lines"].append(number)
+        if email:
+            product["emails"].append(email)
+
+    if len(products) > MAX_URLS:
+        raise TooManyUrls(f"Za dużo adresów: {len(products)} (limit {MAX_URLS})")
+    return products, rejected
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Call:
+    """A load in progress that other callers for the same key wait on."""
+
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after `ttl` seconds.
+
+    get_or_load() is single-flight: when several threads ask for the same
+    missing key at once, only the first one runs the loader and the rest
+    wait for its result (or its exception). Failed loads are not cached.
+    get_or_load_async() does the same for coroutines on one event loop.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._inflight = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key, default=None):
+        """Returns a fresh cached value without loading; misses are not counted."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= self.clock():
+                return default
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self.clock():
+                    self._data.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                del self._data[key]
+                self._stats["expirations"] += 1
+
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+                self._stats["misses"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = loader()
+        except BaseException as e:
+            call.error = e
+            raise
+        else:
+            with self._lock:
+                self._data[key] = (self.clock() + self.ttl, call.value)
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+                    self._stats["evictions"] += 1
+            return call.value
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.event.set()
+
+    async def get_or_load_async(self, key, loader, executor=None):
+        """
+        get_or_load() for coroutines. Only the first caller for a missing key
+        runs it in `executor`; the others await that caller's future on the
+        event loop, so a slow load holds one executor thread, not one per caller.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        future = self._futures.get(key)
+        if future is not None:
+            with self._lock:
+                self._stats["coalesced"] += 1
+        else:
+            future = self._futures[key] = asyncio.get_running_loop().run_in_executor(
+                executor, self.get_or_load, key, loader
+            )
+            future.add_done_callback(lambda _: self._futures.pop(key, None))
+        # A cancelled caller (client gone) must not cancel the load the others wait for
+        return await asyncio.shield(future)
+
+    def invalidate(self, key=None):
+        """Drops one key, or everything when key is None."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._data)
+        stats["maxsize"] = self.maxsize
+        stats["ttl"] = self.ttl
+        requests = stats["hits"] + stats["misses"] + stats["coalesced"]
+        # Coalesced calls did not fetch either, so they count as hits
+        stats["hit_rate"] = round((stats["hits"] + stats["coalesced"]) / requests, 3) if requests else 0.0
+        return stats
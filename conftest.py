@@ -0,0 +1,22 @@
+import os
+import tempfile
+
+import pytest
+
+# The live-scrape scripts collected by pytest (test_parser.py, test_tophifi.py) go through
+# storage and the fetcher cache; keep them away from the real files in the repo
+_TMP_DIR = tempfile.mkdtemp(prefix="omnibus-tests-")
+os.environ.setdefault("OMNIBUS_DB", os.path.join(_TMP_DIR, "omnibus.db"))
+os.environ.setdefault("FETCH_CACHE_FILE", os.path.join(_TMP_DIR, "http_cache.json"))
+
+import storage
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Points storage at a fresh SQLite database in tmp_path."""
+    monkeypatch.setattr(storage, "DB_FILE", str(tmp_path / "omnibus.db"))
+    monkeypatch.setattr(storage, "LEGACY_DATA_FILE", str(tmp_path / "tracked.json"))
+    monkeypatch.setattr(storage, "LEGACY_AFFILIATES_FILE", str(tmp_path / "affiliates.json"))
+    yield tmp_path
+    storage.close()
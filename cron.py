@@ -1,12 +1,20 @@
+import functools
 import json
 import time
 import os
-import smtplib
-import ssl
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import socket
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-from parser import parse_price
+import archive
+import metrics
+import storage
+from history import is_observation
+from urls import get_domain, normalize_url
+from scheduler import Scheduler, DEFAULT_INTERVAL
+
+# parser (requests, BeautifulSoup), fetcher and alerts (smtplib) are imported
+# where they are used, so a scheduled run with nothing to do starts fast
 
 # Try to load .env file if it exists (requires python-dotenv)
 try:
@@ -15,142 +23,371 @@ try:
 except ImportError:
     pass
 
-DATA_FILE = "tracked.json"
+# Concurrency limits for batch checks
+MAX_WORKERS = int(os.getenv("CRON_MAX_WORKERS", "16"))
+PER_DOMAIN_LIMIT = int(os.getenv("CRON_PER_DOMAIN_LIMIT", "2"))
+
+# Results are committed every JOURNAL_BATCH products or JOURNAL_INTERVAL seconds;
+# an interrupted run younger than RESUME_WINDOW seconds is resumed on the next start.
+# A run counts as interrupted when its process is gone or it has not committed for RUN_STALE_AFTER seconds.
+JOURNAL_BATCH = int(os.getenv("CRON_JOURNAL_BATCH", "25"))
+JOURNAL_INTERVAL = float(os.getenv("CRON_JOURNAL_INTERVAL", "5"))
+RESUME_WINDOW = float(os.getenv("CRON_RESUME_WINDOW", str(6 * 3600)))
+RUN_STALE_AFTER = float(os.getenv("CRON_RUN_STALE_AFTER", "600"))
+# Finished runs and old alerts are compacted away after this many days
+KEEP_DAYS = int(os.getenv("CRON_KEEP_DAYS", "7"))
+ALERT_MAX_ATTEMPTS = int(os.getenv("ALERT_MAX_ATTEMPTS", "5"))
+
+# Alert thresholds: smaller drops are not alerted, and the subscriber's last known
+# price stays put so they add up. ALERT_BELOW_LOWEST_30D=1 only alerts new 30-day lows.
+ALERT_MIN_SAVINGS = float(os.getenv("ALERT_MIN_SAVINGS", "0"))
+ALERT_MIN_SAVINGS_PERCENT = float(os.getenv("ALERT_MIN_SAVINGS_PERCENT", "0"))
+ALERT_BELOW_LOWEST_30D = os.getenv("ALERT_BELOW_LOWEST_30D", "0").lower() in ("1", "true", "yes")
+# A subscriber's alerts are held this long (s) after the first one and sent as one digest
+ALERT_DIGEST_WINDOW = float(os.getenv("ALERT_DIGEST_WINDOW", "0"))
+
+# Worker mode: products claimed per batch, and how long a claim is held (s)
+WORKER_BATCH = int(os.getenv("CRON_WORKER_BATCH", "20"))
+WORKER_LEASE = float(os.getenv("CRON_WORKER_LEASE", "300"))
+# Workers run the maintenance a cron run ends with (compaction, archiving) at most this often (s)
+MAINTENANCE_INTERVAL = float(os.getenv("CRON_MAINTENANCE_INTERVAL", "3600"))
 
-def send_alert(email, url, old_price, new_price, title="Produkt", image_url=None):
+def check_urls(urls, check=None, max_workers=MAX_WORKERS, per_domain=PER_DOMAIN_LIMIT):
     """
-    Sends a real email alert using SMTP with HTML styling.
+    Checks URLs concurrently and yields (url, result) pairs as they complete.
+    At most `max_workers` checks run at once and at most `per_domain` of them
+    hit the same shop, so a slow shop cannot starve the others.
     """
-    smtp_host = os.getenv("SMTP_HOST")
-    smtp_port = os.getenv("SMTP_PORT", "587")
-    smtp_user = os.getenv("SMTP_USER")
-    smtp_pass = os.getenv("SMTP_PASS")
-    smtp_from = os.getenv("SMTP_FROM", f"Price Tracker <{smtp_user}>")
-
-    print(f"\n--- 🔔 SENDING HTML ALERT EMAIL TO: {email} ---")
-    
-    if not all([smtp_host, smtp_user, smtp_pass]):
-        print("⚠️  SMTP configuration missing! Set SMTP_HOST, SMTP_USER, and SMTP_PASS in .env")
+    queues = {}
+    for url in urls:
+        queues.setdefault(get_domain(url), deque()).append(url)
+    if not queues:
         return
+    if check is None:
+        from parser import parse_price as check
+
+    in_flight = {domain: 0 for domain in queues}
+    pending = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while queues or pending:
+            # Fill free slots, round-robin across domains
+            for domain in list(queues):
+                queue = queues[domain]
+                while queue and in_flight[domain] < per_domain and len(pending) < max_workers:
+                    url = queue.popleft()
+                    pending[pool.submit(check, url)] = (domain, url)
+                    in_flight[domain] += 1
+                if not queue:
+                    del queues[domain]
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                domain, url = pending.pop(future)
+                in_flight[domain] -= 1
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error checking {url}: {e}")
+                    result = None
+                yield url, result
+
+def group_by_product(items):
+    """
+    Groups tracked items by normalized URL, so a product watched by many
+    subscribers is fetched once. Returns {fetch_url: [items]}.
+    """
+    groups = {}
+    for item in items:
+        groups.setdefault(normalize_url(item["url"]), []).append(item)
+    # Fetch the URL as the first subscriber entered it (keeps www. etc. and avoids redirects)
+    return {subscribers[0]["url"]: subscribers for subscribers in groups.values()}
+
+def worth_alerting(old_price, new_price, lowest_30d=None):
+    """
+    Whether a drop from `old_price` to `new_price` passes the alert
+    thresholds. `lowest_30d` is the product's 30-day lowest price before
+    this check, or a callable returning it (only called when needed).
+    """
+    savings = old_price - new_price
+    if savings <= 0 or savings < ALERT_MIN_SAVINGS:
+        return False
+    if old_price and savings / old_price * 100 < ALERT_MIN_SAVINGS_PERCENT:
+        return False
+    if ALERT_BELOW_LOWEST_30D:
+        lowest = lowest_30d() if callable(lowest_30d) else lowest_30d
+        if lowest is not None and new_price >= lowest:
+            return False
+    return True
+
+def lowest_before(url, result):
+    """The shop's declared 30-day lowest price, or the lowest in our own history."""
+    if result.get("lowest_30d_scraped"):
+        return result.get("lowest_30d_price")
+    return storage.lowest_price(url)
 
-    savings = round(old_price - new_price, 2)
-    subject = f"🔔 Kupuj! Cena spadła o {savings} PLN"
-    img_tag = f'<img src="{image_url}" alt="Produkt" style="width: 150px; height: 150px; object-fit: contain; background: #fff; border-radius: 12px; padding: 5px;">' if image_url else ""
-
-    # Plain text version (fallback)
-    body_text = f"🔔 Kupuj! Cena produktu {title} spadła o {savings} PLN! Sprawdź ofertę: {url}"
-
-    # HTML Version (styled like the app)
-    body_html = f"""
-    <html>
-    <body style="margin: 0; padding: 0; font-family: 'Inter', Helvetica, Arial, sans-serif; background-color: #0f172a; color: #f8fafc;">
-        <table align="center" border="0" cellpadding="0" cellspacing="0" width="100%" style="max-width: 600px; margin: 20px auto; background-color: #1e293b; border-radius: 24px; border: 1px solid #334155; overflow: hidden; border-collapse: separate;">
-            <tr>
-                <td style="padding: 40px; text-align: center;">
-                    <h1 style="margin: 0 0 10px 0; font-size: 28px; font-weight: 700; color: #818cf8;">Kupuj! Cena spadła</h1>
-                    <p style="margin: 0; color: #94a3b8; font-size: 16px;">Twój produkt właśnie staniał. Sprawdź szczegóły poniżej.</p>
-                </td>
-            </tr>
-            <tr>
-                <td style="padding: 0 40px 30px 40px;">
-                    <table border="0" cellpadding="0" cellspacing="0" width="100%" style="background: rgba(15, 23, 42, 0.5); border: 1px solid #334155; border-radius: 16px; padding: 20px;">
-                        <tr>
-                            <td style="width: 160px; vertical-align: top;">
-                                {img_tag}
-                            </td>
-                            <td style="padding-left: 20px; vertical-align: top;">
-                                <h2 style="margin: 0 0 10px 0; font-size: 18px; font-weight: 700; color: #ffffff;">{title}</h2>
-                                <div style="margin-bottom: 20px;">
-                                    <div style="font-size: 12px; color: #94a3b8; margin-bottom: 5px;">Aktualna Cena</div>
-                                    <div style="font-size: 24px; font-weight: 800; color: #22c55e;">{new_price} PLN</div>
-                                    <div style="font-size: 14px; color: #94a3b8; text-decoration: line-through;">Było: {old_price} PLN</div>
-                                </div>
-                                <div style="display: inline-block; padding: 10px 15px; background: rgba(34, 197, 94, 0.1); border-radius: 8px; color: #22c55e; font-weight: 700; font-size: 14px;">
-                                    Oszczędzasz: {savings} PLN
-                                </div>
-                            </td>
-                        </tr>
-                    </table>
-                </td>
-            </tr>
-            <tr>
-                <td style="padding: 0 40px 40px 40px; text-align: center;">
-                    <a href="{url}" style="display: inline-block; padding: 16px 32px; background-color: #6366f1; color: #ffffff; text-decoration: none; border-radius: 12px; font-weight: 700; font-size: 16px;">Sprawdź ofertę w sklepie</a>
-                </td>
-            </tr>
-            <tr>
-                <td style="padding: 20px; background-color: #0f172a; text-align: center; color: #64748b; font-size: 12px;">
-                    Wiadomość wysłana przez Omnibus PoC. Dziękujemy za korzystanie z naszej apki!
-                </td>
-            </tr>
-        </table>
-    </body>
-    </html>
-    """
-
-    message = MIMEMultipart("alternative")
-    message["From"] = smtp_from
-    message["To"] = email
-    message["Subject"] = subject
-    
-    message.attach(MIMEText(body_text, "plain"))
-    message.attach(MIMEText(body_html, "html"))
-
-    try:
-        context = ssl.create_default_context()
-        if smtp_port == "465":
-            with smtplib.SMTP_SSL(smtp_host, int(smtp_port), context=context) as server:
-                server.login(smtp_user, smtp_pass)
-                server.sendmail(smtp_user, email, message.as_string())
-        else:
-            with smtplib.SMTP(smtp_host, int(smtp_port)) as server:
-                server.starttls(context=context)
-                server.login(smtp_user, smtp_pass)
-                server.sendmail(smtp_user, email, message.as_string())
-        
-        print("✅ HTML Alert email sent successfully!")
-    except Exception as e:
-        print(f"❌ Failed to send email: {e}")
-
-def run_cron():
+def check_products(groups, schedule, scheduler, stats):
+    """
+    Checks product groups ({fetch_url: subscribers}) and works out what
+    changed, without writing anything. Yields one dict per product as its
+    check completes: norm_url, the subscribers' updated items, the price
+    observation (or None), the product's schedule row and the alerts to
+    queue. `stats` is updated in place.
+    """
+    for url, result in check_urls(groups):
+        subscribers = groups[url]
+        key = normalize_url(url)
+        print(f"Checked: {url} ({len(subscribers)} subscribers)")
+        observation = None
+        if is_observation(result):
+            shop_lowest = result.get("lowest_30d_price") if result.get("lowest_30d_scraped") else None
+            observation = (url, result["current_price"], shop_lowest)
+
+        # Adapt the product's check interval to how often its price moves
+        row = schedule[key]
+        changed = None
+        if is_observation(result):
+            changed = row["last_price"] is not None and abs(result["current_price"] - row["last_price"]) >= 0.01
+            row["last_price"] = result["current_price"]
+            row["checks"] += 1
+            row["changes"] += int(changed)
+            stats["price_changes"] += int(changed)
+        row["next_check_at"], row["interval"] = scheduler.reschedule(key, time.time(), changed)
+
+        alerts = []
+        # Looked up at most once per product, and only if a threshold needs it
+        lowest_30d = functools.cache(lambda: lowest_before(url, result))
+        for item in subscribers:
+            if is_observation(result):
+                new_price = result["current_price"]
+                last_known = item["last_known_price"]
+
+                if new_price < last_known and not worth_alerting(last_known, new_price, lowest_30d):
+                    stats["alerts_suppressed"] += 1
+                elif new_price < last_known:
+                    alerts.append({
+                        # The same drop for the same subscriber is only ever queued once
+                        "key": f"{item['id']}:{last_known}:{new_price}",
+                        "email": item["email"],
+                        "url": item["url"],
+                        "old_price": last_known,
+                        "new_price": new_price,
+                        "title": result.get("title", "Produkt"),
+                        "image_url": result.get("image_url"),
+                    })
+                    item["last_known_price"] = new_price
+                    stats["alerts"] += 1
+
+                item["last_checked"] = datetime.now().isoformat()
+
+        yield {"norm_url": key, "items": subscribers, "observation": observation, "schedule": row, "alerts": alerts}
+
+def collect(results):
+    """Splits check_products() results into (schedule rows, items, observations, alerts) lists."""
+    rows, items, observations, alerts = [], [], [], []
+    for result in results:
+        rows.append(result["schedule"])
+        items += result["items"]
+        if result["observation"]:
+            observations.append(result["observation"])
+        alerts += result["alerts"]
+    return rows, items, observations, alerts
+
+def deliver_alerts():
+    """
+    Sends the alerts waiting in the outbox, marking each one sent as it
+    goes out, so alerts queued before a crash are delivered exactly once.
+    """
+    claimed = storage.claim_alerts(ALERT_MAX_ATTEMPTS, WORKER_LEASE, hold=ALERT_DIGEST_WINDOW)
+    if not claimed:
+        return {"queued": 0}
+    from alerts import AlertDispatcher
+
+    dispatcher = AlertDispatcher(on_result=storage.mark_alert)
+    for alert in claimed:
+        dispatcher.add(alert["email"], alert["url"], alert["old_price"], alert["new_price"],
+                       alert["title"], alert["image_url"], key=alert["key"])
+    return dispatcher.flush()
+
+def maintain():
+    """
+    Drops finished runs and old sent alerts and moves old price history to
+    the archive. Returns the number of history rows archived.
+    """
+    storage.compact(KEEP_DAYS, ALERT_MAX_ATTEMPTS)
+    return archive.archive_history()
+
+def run_cron(due=False, budget=None):
+    """
+    Checks tracked products and alerts subscribers about price drops.
+    With due=True only products whose scheduled check time has come are
+    checked, most overdue first; `budget` caps the number of fetches.
+    """
     print(f"[{datetime.now()}] Starting price check...")
-    
-    try:
-        with open(DATA_FILE, "r") as f:
-            items = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
+    started = time.monotonic()
+    now = time.time()
+    stages_before = metrics.STAGE_SECONDS.snapshot()
+    outcomes_before = metrics.FETCH_OUTCOMES.snapshot()
+
+    items = storage.list_items()
+    if not items:
         print("No items to check.")
         return
 
-    updated_items = []
-    
-    for item in items:
-        print(f"Checking: {item['url']}")
-        result = parse_price(item['url'])
-        
-        if result:
-            new_price = result["current_price"]
-            last_known = item["last_known_price"]
-            
-            if new_price < last_known:
-                send_alert(
-                    item["email"], 
-                    item["url"], 
-                    last_known, 
-                    new_price, 
-                    title=result.get("title", "Produkt"),
-                    image_url=result.get("image_url")
-                )
-                item["last_known_price"] = new_price
-            
-            item["last_checked"] = datetime.now().isoformat()
-        
-        updated_items.append(item)
-
-    with open(DATA_FILE, "w") as f:
-        json.dump(updated_items, f, indent=2)
-    
-    print(f"[{datetime.now()}] Price check completed.")
+    products = group_by_product(items)
+    keys = {url: normalize_url(url) for url in products}
+    storage.sync_schedule(keys.values(), DEFAULT_INTERVAL)
+    schedule = storage.load_schedule()
+    scheduler = Scheduler((key, row["next_check_at"], row["interval"]) for key, row in schedule.items())
+
+    # budget=0 is a budget too (check nothing), only None means unbounded
+    mode = "due" if due or budget is not None else "full"
+    if mode == "due":
+        selected = set(scheduler.pop_due(now if due else float("inf"), budget))
+        groups = {url: subscribers for url, subscribers in products.items() if keys[url] in selected}
+    else:
+        groups = products
+
+    selected_count = len(groups)
+
+    # Products an interrupted run already committed are not checked again
+    run_id, done = storage.start_run(mode, RESUME_WINDOW, f"{socket.gethostname()}:{os.getpid()}", RUN_STALE_AFTER)
+    if done:
+        groups = {url: subscribers for url, subscribers in groups.items() if keys[url] not in done}
+        print(f"Resuming run {run_id}: {selected_count - len(groups)} products already checked")
+
+    checked_items = sum(len(subscribers) for subscribers in groups.values())
+    stats = {
+        "items": checked_items,
+        "fetches": len(groups),
+        "fetches_saved": checked_items - len(groups),
+        "not_due": len(products) - selected_count,
+        "resumed": selected_count - len(groups),
+        "alerts": 0,
+        "alerts_suppressed": 0,
+        "price_changes": 0,
+    }
+
+    # Commit results as they arrive, so a crash loses at most one small batch
+    pending = []
+    last_commit = time.monotonic()
+    for result in check_products(groups, schedule, scheduler, stats):
+        pending.append(result)
+        if len(pending) >= JOURNAL_BATCH or time.monotonic() - last_commit >= JOURNAL_INTERVAL:
+            storage.commit_results(run_id, *collect(pending))
+            pending = []
+            last_commit = time.monotonic()
+    storage.commit_results(run_id, *collect(pending))
+    stats["email"] = deliver_alerts()
+    storage.finish_run(run_id)
+    stats["archived"] = maintain()
+
+    if groups:
+        import fetcher
+        import throttle
+
+        fetcher.flush()
+        stats["http"] = fetcher.get_stats()
+        stats["shops"] = throttle.get_stats()
+    stats["next_due"] = scheduler.next_due()
+    stats["duration"] = round(time.monotonic() - started, 2)
+    stats.update(run_summary(stages_before, outcomes_before))
+    metrics.RUN_SECONDS.observe(stats["duration"], mode)
+    print(f"[{datetime.now()}] Price check completed: {json.dumps(stats)}")
+    return stats
+
+def run_summary(stages_before, outcomes_before):
+    """
+    Per-shop breakdown of a run from the metrics recorded since the given
+    snapshots: {"outcomes": {domain: {outcome: n}}, "stages": {domain:
+    {stage: {"count", "seconds", "avg"}}}}, with the slowest shops first.
+    """
+    outcomes = {}
+    for (domain, outcome), count in metrics.FETCH_OUTCOMES.summary(since=outcomes_before).items():
+        outcomes.setdefault(domain, {})[outcome] = count
+    stages = {}
+    for (domain, stage), timing in metrics.STAGE_SECONDS.summary(since=stages_before).items():
+        stages.setdefault(domain, {})[stage] = timing
+    slowest = sorted(stages, key=lambda domain: -sum(t["seconds"] for t in stages[domain].values()))
+    return {"outcomes": outcomes, "stages": {domain: stages[domain] for domain in slowest}}
+
+def run_daemon(budget=None, poll=60):
+    """
+    Runs forever, checking whatever is due and sleeping until the next
+    product is due (re-reading the schedule at least every `poll` seconds,
+    so newly tracked products are picked up).
+    """
+    while True:
+        stats = run_cron(due=True, budget=budget)
+        next_due = stats and stats["next_due"]
+        pause = poll if next_due is None else min(poll, max(1.0, next_due - time.time()))
+        time.sleep(pause)
+
+def run_worker(worker_id=None, batch=WORKER_BATCH, lease=WORKER_LEASE, poll=60, exit_when_idle=False):
+    """
+    Worker mode for running several checkers against one database (more
+    processes or machines). Each worker claims a batch of due products
+    under a lease, checks them and commits the results together with
+    releasing the lease. Products of a worker that died are claimed again
+    once their lease runs out; results that come back after the lease was
+    taken over are dropped, so each check is applied and alerted once.
+    Every MAINTENANCE_INTERVAL seconds the worker also runs maintain().
+
+    With exit_when_idle=True the worker returns its stats once nothing is due.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    started = time.monotonic()
+    stats = {"batches": 0, "items": 0, "fetches": 0, "lost_leases": 0, "alerts": 0, "alerts_suppressed": 0,
+             "price_changes": 0, "archived": 0}
+    print(f"[{datetime.now()}] Worker {worker_id} started")
+    storage.sync_schedule(storage.list_products(), DEFAULT_INTERVAL)
+    last_maintenance = None
+
+    while True:
+        # A worker never ends the way a cron run does, so it keeps the tables in check itself
+        if last_maintenance is None or time.monotonic() - last_maintenance >= MAINTENANCE_INTERVAL:
+            stats["archived"] += maintain()
+            last_maintenance = time.monotonic()
+
+        claimed = {row["norm_url"]: row for row in storage.claim_due(worker_id, batch, lease)}
+        if not claimed:
+            if exit_when_idle:
+                break
+            # Nothing due: pick up newly tracked products, then wait
+            storage.sync_schedule(storage.list_products(), DEFAULT_INTERVAL)
+            next_due = min((row["next_check_at"] for row in storage.load_schedule().values()), default=None)
+            time.sleep(poll if next_due is None else min(poll, max(1.0, next_due - time.time())))
+            continue
+
+        batch_started = time.monotonic()
+        groups = group_by_product(storage.items_for(claimed))
+        scheduler = Scheduler((key, row["next_check_at"], row["interval"]) for key, row in claimed.items())
+        schedule_updates, updates, observations, alerts = collect(check_products(groups, claimed, scheduler, stats))
+
+        # Products nobody tracks any more: release them, sync_schedule drops them later
+        checked = {row["norm_url"] for row in schedule_updates}
+        schedule_updates += [row for key, row in claimed.items() if key not in checked]
+
+        committed = storage.complete_claims(worker_id, schedule_updates, updates, observations, alerts)
+        metrics.RUN_SECONDS.observe(time.monotonic() - batch_started, "worker_batch")
+        deliver_alerts()
+        if groups:
+            import fetcher
+            fetcher.flush()
+
+        stats["batches"] += 1
+        stats["items"] += len(updates)
+        stats["fetches"] += len(groups)
+        stats["lost_leases"] += len(claimed) - len(committed)
+
+    stats["duration"] = round(time.monotonic() - started, 2)
+    print(f"[{datetime.now()}] Worker {worker_id} finished: {stats}")
+    return stats
 
 if __name__ == "__main__":
-    run_cron()
+    # Kept for existing crontabs: `python3 cron.py [options]` is `omnibus.py check [options]`,
+    # run with this module so cron.py is not imported (and set up) a second time
+    import sys
+    import omnibus
+
+    omnibus.check(omnibus.build_parser().parse_args(["check"] + sys.argv[1:]), cron=sys.modules[__name__])
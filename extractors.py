@@ -0,0 +1,425 @@
+import html
+import json
+import re
+import time
+from bs4 import BeautifulSoup
+from urls import get_domain
+
+# lxml is much faster than the stdlib parser; fall back if it is not installed
+try:
+    import lxml  # noqa: F401
+    TREE_PARSER = "lxml"
+except ImportError:
+    TREE_PARSER = "html.parser"
+
+META_TAG = re.compile(r"<meta\s[^>]*>", re.IGNORECASE)
+ATTRIBUTE = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+TITLE_TAG = re.compile(r"<title[^>]*>([^<]*)</title>", re.IGNORECASE)
+HEAD_END = re.compile(r"</head\s*>", re.IGNORECASE)
+JSON_LD = re.compile(r"""<script[^>]*type\s*=\s*["']application/ld\+json["'][^>]*>(.*?)</script\s*>""", re.IGNORECASE | re.DOTALL)
+
+# Ways to find the current price, cheapest and most reliable first:
+# structured data (JSON-LD), meta tags, CSS selectors over the full tree, text patterns
+STRATEGIES = ("jsonld", "meta", "selectors", "regex")
+# Amount in shop text: "129,99 PLN" -> "129,99"
+AMOUNT = re.compile(r"(\d+[,.]\d{2})")
+
+
+def scan_meta(text):
+    """
+    Collects <meta property|name=... content=...> tags with a regex pass over
+    the raw HTML, without building a tree. Returns {property: content}.
+    """
+    meta = {}
+    for tag in META_TAG.finditer(text):
+        attrs = {}
+        for match in ATTRIBUTE.finditer(tag.group(0)):
+            value = next(v for v in match.groups()[1:] if v is not None)
+            attrs[match.group(1).lower()] = html.unescape(value)
+        key = attrs.get("property") or attrs.get("name") or attrs.get("itemprop")
+        if key and "content" in attrs:
+            meta.setdefault(key, attrs["content"])
+    return meta
+
+
+def parse_amount(text):
+    """'1 499,00 zł' -> 1499.0"""
+    cleaned = text.replace("\xa0", "").replace(" ", "").replace(",", ".")
+    match = re.search(r"(\d+[.]?\d*)", cleaned)
+    return float(match.group(1)) if match else None
+
+
+def to_amount(value):
+    """Machine-readable price from a meta tag or JSON ('1499.00', '1499,00', 1499) -> 1499.0, or None."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, str) or not value.strip():
+        return None
+    try:
+        return float(value.strip().replace(" ", "").replace(",", "."))
+    except ValueError:
+        return parse_amount(value)
+
+
+def _types(node):
+    types = node.get("@type", ())
+    return {types} if isinstance(types, str) else set(types)
+
+
+def _nodes(data):
+    """All JSON-LD objects in a script, flattening lists and @graph."""
+    if isinstance(data, list):
+        for entry in data:
+            yield from _nodes(entry)
+    elif isinstance(data, dict):
+        yield data
+        if "@graph" in data:
+            yield from _nodes(data["@graph"])
+
+
+def jsonld_products(text):
+    """
+    Product objects from the page's <script type="application/ld+json">
+    blocks, as (name, image, price) tuples; price comes from the first
+    offer (Offer price, AggregateOffer lowPrice or a priceSpecification).
+    """
+    products = []
+    for block in JSON_LD.finditer(text):
+        try:
+            data = json.loads(block.group(1), strict=False)
+        except ValueError:
+            continue
+        for node in _nodes(data):
+            if "Product" not in _types(node):
+                continue
+            price = None
+            offers = node.get("offers")
+            for offer in offers if isinstance(offers, list) else [offers]:
+                if not isinstance(offer, dict):
+                    continue
+                specification = offer.get("priceSpecification")
+                if isinstance(specification, list):
+                    specification = specification[0] if specification else None
+                price = to_amount(offer.get("price") if "price" in offer else offer.get("lowPrice"))
+                if price is None and isinstance(specification, dict):
+                    price = to_amount(specification.get("price"))
+                if price is not None:
+                    break
+            image = node.get("image")
+            if isinstance(image, list):
+                image = image[0] if image else None
+            if isinstance(image, dict):
+                image = image.get("url")
+            products.append((node.get("name"), image, price))
+    return products
+
+
+class Document:
+    """
+    A fetched page. Meta tags come from a cheap regex pre-scan; the full
+    BeautifulSoup tree is only built if an extractor asks for it.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.meta = scan_meta(text)
+        self._soup = None
+        self._jsonld = None
+
+    @property
+    def jsonld(self):
+        """JSON-LD products on the page (see jsonld_products), parsed on first use."""
+        if self._jsonld is None:
+            self._jsonld = jsonld_products(self.text) if "ld+json" in self.text else []
+        return self._jsonld
+
+    @property
+    def soup(self):
+        if self._soup is None:
+            self._soup = BeautifulSoup(self.text, TREE_PARSER)
+        return self._soup
+
+    @property
+    def has_tree(self):
+        return self._soup is not None
+
+    def select_fragment(self, marker, selector, size=4096):
+        """
+        select_one() that only parses the markup around the first occurrence
+        of `marker` instead of the whole page (or uses the full tree if it
+        was already built).
+        """
+        if self._soup is not None:
+            return self._soup.select_one(selector)
+        pos = self.text.find(marker)
+        if pos == -1:
+            return None
+        start = self.text.rfind("<", 0, pos)
+        fragment = BeautifulSoup(self.text[start:start + size], TREE_PARSER)
+        return fragment.select_one(selector)
+
+    def title_tag(self):
+        match = TITLE_TAG.search(self.text)
+        return html.unescape(match.group(1)) if match else None
+
+    def find_string(self, pattern):
+        """First text node (text between two tags) matching pattern, or None."""
+        for match in re.finditer(r">([^<]+)<", self.text):
+            if pattern.search(match.group(1)):
+                return html.unescape(match.group(1))
+        return None
+
+
+class Extractor:
+    """
+    Base extractor: title, description and image from Open Graph tags, and
+    the current price from the first strategy (see STRATEGIES) that finds
+    one: JSON-LD Product data, the meta tags in `price_meta`, the
+    `price_selectors` over the full tree, then the text `price_patterns`.
+    `strategies` is the order tried before anything was learned about a
+    shop. Shop extractors declare their own order, selectors and patterns,
+    fill in missing details in extract_details() and read the Omnibus price
+    in extract_lowest().
+
+    For streamed downloads, `required_meta` lists the head meta tags without
+    which extract() needs the whole page, and `markers` lists (marker,
+    chars) pairs: body markup that must be downloaded, plus `chars` of
+    context after it.
+    """
+
+    name = "generic"
+    domains = ()
+    meta = ("og:title", "og:description", "og:image")
+    price_meta = ("product:price:amount", "og:price:amount", "price")
+    # (marker, selector) pairs: the tree is only built if the marker is in the page
+    price_selectors = (("itemprop", '[itemprop="price"]'),)
+    # Text node patterns; the first amount in the matching text is the price.
+    # None by default: a wrong price is worse than no price
+    price_patterns = ()
+    strategies = STRATEGIES
+    required_meta = ()
+    markers = ()
+
+    def extract(self, doc, url, order=STRATEGIES):
+        return self.extract_with_attempts(doc, url, order)[0]
+
+    def extract_with_attempts(self, doc, url, order=STRATEGIES):
+        """
+        extract() trying the price strategies in `order`. Also returns the
+        attempts as [(strategy, found, seconds)], up to the one that found it.
+        """
+        title = doc.meta.get("og:title") or doc.title_tag() or "Produkt"
+        fields = {
+            "title": html.unescape(title),
+            "description": html.unescape(doc.meta.get("og:description", "")),
+            "image_url": doc.meta.get("og:image", ""),
+            "current_price": None,
+            "lowest_30d": None,
+        }
+        attempts = []
+        for name in order:
+            started = time.perf_counter()
+            found = getattr(self, "price_from_" + name)(doc, fields)
+            attempts.append((name, found, time.perf_counter() - started))
+            if found:
+                break
+        self.extract_details(doc, fields)
+        self.extract_lowest(doc, fields)
+        return fields, attempts
+
+    def price_from_jsonld(self, doc, fields):
+        for name, image, price in doc.jsonld:
+            if price:
+                fields["current_price"] = price
+                if fields["title"] == "Produkt" and name:
+                    fields["title"] = html.unescape(name)
+                if not fields["image_url"] and image:
+                    fields["image_url"] = image
+                return True
+        return False
+
+    def price_from_meta(self, doc, fields):
+        for name in self.price_meta:
+            price = to_amount(doc.meta.get(name))
+            if price:
+                fields["current_price"] = price
+                return True
+        return False
+
+    def price_from_selectors(self, doc, fields):
+        for marker, selector in self.price_selectors:
+            if marker not in doc.text:
+                continue
+            tag = doc.soup.select_one(selector)
+            if tag:
+                price = to_amount(tag.get("content")) or parse_amount(tag.get_text())
+                if price:
+                    fields["current_price"] = price
+                    return True
+        return False
+
+    def price_from_regex(self, doc, fields):
+        for pattern in self.price_patterns:
+            text = doc.find_string(pattern)
+            match = AMOUNT.search(text) if text else None
+            if match:
+                fields["current_price"] = to_amount(match.group(1))
+                return True
+        return False
+
+    def extract_details(self, doc, fields):
+        """Shop-specific fallbacks for a missing title or image."""
+
+    def extract_lowest(self, doc, fields):
+        """Shop-specific lowest price from the last 30 days (Omnibus)."""
+
+    def stream_check(self, winner=None):
+        """
+        Returns a callable(text_so_far) -> bool for fetcher.fetch(until=...),
+        True once the downloaded prefix holds everything extract() reads.
+
+        `winner` is the strategy that finds the shop's price (see
+        strategies.winner()) and decides how far to read: the head for
+        "meta" or None if it holds a price tag, up to the first priced
+        JSON-LD Product for "jsonld" (and for a head without a price), and
+        the whole page for "selectors" and "regex".
+        """
+        state = {"head": None, "price": False, "offset": 0}
+
+        def has_enough(text):
+            if state["head"] is None:
+                head_end = HEAD_END.search(text)
+                if not head_end:
+                    return False
+                meta = scan_meta(text[:head_end.start()])
+                # Missing meta means selector fallbacks over the whole page
+                state["head"] = all(name in meta for name in self.required_meta)
+                if winner in (None, "meta"):
+                    state["price"] = any(name in meta for name in self.price_meta)
+            if not state["head"]:
+                return False
+            if not state["price"]:
+                if winner in ("selectors", "regex"):
+                    return False
+                # Only the blocks downloaded since the last chunk are parsed
+                for block in JSON_LD.finditer(text, state["offset"]):
+                    state["offset"] = block.end()
+                    if any(price for _, _, price in jsonld_products(block.group(0))):
+                        state["price"] = True
+                        break
+                if not state["price"]:
+                    # Resume at a <script> still being downloaded, if any, else near the end
+                    unfinished = text.rfind("<script", state["offset"])
+                    if unfinished == -1 or "</script" in text[unfinished:]:
+                        unfinished = len(text) - 100
+                    state["offset"] = max(state["offset"], unfinished)
+                    return False
+            for marker, chars in self.markers:
+                if isinstance(marker, str):
+                    pos = text.find(marker)
+                else:
+                    found = marker.search(text)
+                    pos = found.end() if found else -1
+                if pos == -1 or len(text) - pos < chars:
+                    return False
+            return True
+
+        return has_enough
+
+
+_registry = {}
+
+
+def register(cls):
+    """Class decorator adding an extractor for each domain in cls.domains."""
+    instance = cls()
+    for domain in cls.domains:
+        _registry[domain] = instance
+    return cls
+
+
+GENERIC = Extractor()
+
+
+def extractor_for(url):
+    """Dict lookup by domain, then by parent domains (sklep.tophifi.pl -> tophifi.pl)."""
+    domain = (get_domain(url) or "").lower().split(":")[0]
+    while domain:
+        extractor = _registry.get(domain)
+        if extractor:
+            return extractor
+        domain = domain.partition(".")[2]
+    return GENERIC
+
+
+@register
+class TopHiFi(Extractor):
+    name = "tophifi"
+    domains = ("tophifi.pl",)
+    meta = Extractor.meta + ("product:price:amount",)
+    price_selectors = (
+        ('data-price-type="finalPrice"', '.product-info-main .price-box .price-container [data-price-type="finalPrice"] .price'),
+    )
+    # The shop's own price tag before JSON-LD, whose AggregateOffer lowPrice is a "from" price
+    strategies = ("meta", "jsonld", "selectors", "regex")
+    required_meta = ("og:image", "product:price:amount")
+    markers = (("price-omnibus", 4096),)
+
+    def extract_details(self, doc, fields):
+        if not fields["image_url"]:
+            img_tag = doc.soup.select_one(".gallery-placeholder__image")
+            if img_tag:
+                fields["image_url"] = img_tag.get("src")
+
+    def extract_lowest(self, doc, fields):
+        omnibus_tag = doc.select_fragment("price-omnibus", ".price-omnibus")
+        if omnibus_tag:
+            text = omnibus_tag.get_text()
+            # Find all numbers in the text. We expect the price to be the one NOT equal to 30
+            for match in re.finditer(r"(\d+[\s,.]\d*)", text):
+                val_str = match.group(1).replace(",", ".").replace("\xa0", "").replace(" ", "")
+                try:
+                    val = float(val_str)
+                except ValueError:
+                    continue
+                if val != 30:  # Simple heuristic: skip the "30" in "30 dni"
+                    fields["lowest_30d"] = val
+                    break
+
+
+@register
+class InkHouse(Extractor):
+    name = "inkhouse"
+    domains = ("inkhouse.pl",)
+    meta = Extractor.meta + ("product:price:amount",)
+    price_selectors = ()
+    price_patterns = (re.compile(r"\d+[,.]\d{2}\s*PLN"),)
+    strategies = TopHiFi.strategies
+
+    OMNIBUS_TEXT = re.compile(r"Najniższa cena z 30 dni|30 dni przed", re.IGNORECASE)
+
+    required_meta = ("og:image", "product:price:amount")
+    markers = ((OMNIBUS_TEXT, 1024),)
+
+    def extract_details(self, doc, fields):
+        if not fields["title"] or fields["title"] == "Produkt":
+            title_tag = doc.soup.select_one("h1")
+            if title_tag:
+                fields["title"] = title_tag.get_text().strip()
+
+        if not fields["image_url"]:
+            img_tag = doc.soup.select_one("#product-image")
+            if img_tag:
+                fields["image_url"] = img_tag.get("src")
+
+    def extract_lowest(self, doc, fields):
+        omnibus_text = doc.find_string(self.OMNIBUS_TEXT)
+        if omnibus_text:
+            price_match = AMOUNT.search(omnibus_text)
+            if not price_match:
+                # The amount sits in a sibling element; only now is the tree needed
+                node = doc.soup.find(string=self.OMNIBUS_TEXT)
+                if node is not None and node.parent:
+                    price_match = AMOUNT.search(node.parent.get_text())
+            if price_match:
+                fields["lowest_30d"] = float(price_match.group(1).replace(",", "."))
@@ -0,0 +1,339 @@
+import codecs
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import atexit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util.connection import allowed_gai_family
+import metrics
+from urls import get_domain
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
+TIMEOUT = 10
+
+CACHE_FILE = os.getenv("FETCH_CACHE_FILE", "http_cache.json")
+# Hosts kept in the pool and keep-alive connections per host
+POOL_HOSTS = int(os.getenv("FETCH_POOL_HOSTS", "64"))
+POOL_SIZE = int(os.getenv("FETCH_POOL_SIZE", "10"))
+# Validators are written to disk at most this often (and on exit)
+FLUSH_INTERVAL = 30
+# Read size for streamed downloads
+STREAM_CHUNK = 16384
+# A download stopped early is still read to the end when at most this many bytes
+# are left, so its keep-alive connection goes back to the pool instead of being closed
+DRAIN_BYTES = int(os.getenv("FETCH_DRAIN_BYTES", "65536"))
+
+# Failures that say the shop is slow or refusing connections
+NETWORK_ERRORS = (requests.exceptions.Timeout, requests.exceptions.ConnectionError)
+
+_session = None
+_session_lock = threading.Lock()
+
+_validators = None
+_validators_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_dirty = False
+_last_flush = 0.0
+
+_stats = {"requests": 0, "hits": 0, "misses": 0, "not_modified": 0}
+_stream_stats = {}
+_stats_lock = threading.Lock()
+
+# Connection setup time of the fetch running on this thread (see _TimedConnection)
+_setup = threading.local()
+
+
+class _TimedConnection:
+    """
+    Times DNS resolution and connection setup (TCP, plus TLS for https)
+    of new pooled connections into metrics.STAGE_SECONDS. The host is
+    resolved here, so the two can be told apart, and the addresses are
+    tried in order like urllib3's create_connection does.
+    """
+
+    def _new_conn(self):
+        started = time.perf_counter()
+        try:
+            addresses = [sockaddr[0] for *_, sockaddr in
+                         socket.getaddrinfo(self._dns_host, self.port, allowed_gai_family(), socket.SOCK_STREAM)]
+        except OSError:
+            addresses = []  # let urllib3 raise its usual error
+        self._dns_seconds = time.perf_counter() - started
+        if not addresses:
+            return super()._new_conn()
+        host = self._dns_host
+        try:
+            for address in addresses[:-1]:
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except ConnectTimeoutError:
+                    # Unreachable address (e.g. IPv6 without a route); try the next one
+                    continue
+            self._dns_host = addresses[-1]
+            return super()._new_conn()
+        finally:
+            self._dns_host = host
+
+    def connect(self):
+        self._dns_seconds = 0.0
+        started = time.perf_counter()
+        super().connect()
+        elapsed = time.perf_counter() - started
+        default_port = 443 if isinstance(self, HTTPSConnection) else 80
+        domain = get_domain(f"//{self.host}" + (f":{self.port}" if self.port != default_port else ""))
+        metrics.STAGE_SECONDS.observe(self._dns_seconds, domain, "dns")
+        metrics.STAGE_SECONDS.observe(elapsed - self._dns_seconds, domain, "connect")
+        _setup.seconds = getattr(_setup, "seconds", 0.0) + elapsed
+
+
+class _TimedHTTPConnection(_TimedConnection, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnection, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools open _TimedConnection connections."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def get_session():
+    """
+    Returns the shared requests.Session. Connections are pooled per host and
+    kept alive, so repeated checks on the same shop skip DNS, TCP and TLS setup.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.headers.update(HEADERS)
+                adapter = TimedAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def get_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+        streaming = {domain: dict(entry) for domain, entry in _stream_stats.items()}
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    for entry in streaming.values():
+        entry["seconds_saved"] = round(entry["seconds_saved"], 3)
+    stats["streaming"] = streaming
+    return stats
+
+
+def _record_download(url, bytes_read, content_length, elapsed, truncated, closed):
+    """
+    Per-domain download counters. When a download stops early and the shop
+    sent Content-Length, the skipped bytes are counted as saved, and the time
+    they would have taken is estimated from the rate of the part we read.
+    A download that stopped early either drained the rest of the body or
+    closed its connection (the next request to the shop connects again).
+    """
+    bytes_saved = max(0, content_length - bytes_read) if truncated and content_length else 0
+    seconds_saved = elapsed * bytes_saved / bytes_read if bytes_read else 0.0
+    with _stats_lock:
+        entry = _stream_stats.setdefault(get_domain(url), {
+            "downloads": 0, "truncated": 0, "drained": 0, "connections_closed": 0,
+            "bytes_read": 0, "bytes_saved": 0, "seconds_saved": 0.0,
+        })
+        entry["downloads"] += 1
+        entry["truncated"] += int(truncated)
+        entry["drained"] += int(truncated and not closed)
+        entry["connections_closed"] += int(closed)
+        entry["bytes_read"] += bytes_read
+        entry["bytes_saved"] += bytes_saved
+        entry["seconds_saved"] += seconds_saved
+
+
+def _bytes_read(response, text):
+    """Bytes off the wire (compressed, if the shop gzips)."""
+    return response.raw.tell() if hasattr(response.raw, "tell") else len(text)
+
+
+def _read_body(url, response, until):
+    """
+    Reads the response body as text. With `until`, the body is decoded chunk
+    by chunk and decoding stops as soon as until(text_so_far) returns True;
+    otherwise the whole body is read. After an early stop the rest of a
+    small body is drained so the connection can be reused, a large one is
+    skipped by closing the connection.
+    """
+    started = time.perf_counter()
+    truncated = closed = False
+    if until is None:
+        text = response.text
+    else:
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+        text = ""
+        for chunk in response.iter_content(STREAM_CHUNK):
+            text += decoder.decode(chunk)
+            if until(text):
+                truncated = True
+                break
+        else:
+            text += decoder.decode(b"", final=True)
+
+    content_length = int(response.headers.get("Content-Length") or 0)
+    if truncated:
+        if content_length and content_length - _bytes_read(response, text) <= DRAIN_BYTES:
+            response.raw.drain_conn()
+        if content_length and _bytes_read(response, text) >= content_length:
+            response.raw.release_conn()
+        else:
+            closed = True
+            response.close()
+    bytes_read = _bytes_read(response, text)
+    elapsed = time.perf_counter() - started
+    _record_download(url, bytes_read, content_length, elapsed, truncated, closed)
+    metrics.STAGE_SECONDS.observe(elapsed, get_domain(url), "download")
+    return text
+
+
+def _load_validators():
+    global _validators
+    if _validators is None:
+        try:
+            with open(CACHE_FILE, "r") as f:
+                _validators = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            _validators = {}
+    return _validators
+
+
+def flush():
+    """Writes the validator cache to disk if it changed."""
+    global _dirty, _last_flush
+    with _flush_lock:
+        with _validators_lock:
+            if not _dirty:
+                return
+            data = json.dumps(_validators)
+            _dirty = False
+            _last_flush = time.monotonic()
+
+        directory = os.path.dirname(os.path.abspath(CACHE_FILE))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".http_cache-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(data)
+            os.replace(tmp_path, CACHE_FILE)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+atexit.register(flush)
+
+
+def _collect_metrics():
+    stats = get_stats()
+    return [
+        ("omnibus_http_requests_total", "counter", "Page requests sent to shops.",
+         [({}, stats["requests"])]),
+        ("omnibus_http_validator_lookups_total", "counter",
+         "Fetches by whether ETag/Last-Modified validators were cached (hit) or not (miss).",
+         [({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"])]),
+        ("omnibus_http_not_modified_total", "counter", "Fetches answered 304 Not Modified.",
+         [({}, stats["not_modified"])]),
+        ("omnibus_http_bytes_read_total", "counter", "Page bytes downloaded, by shop.",
+         [({"domain": domain}, entry["bytes_read"]) for domain, entry in sorted(stats["streaming"].items())]),
+        ("omnibus_http_connections_closed_total", "counter",
+         "Keep-alive connections closed to stop a download early, by shop.",
+         [({"domain": domain}, entry["connections_closed"]) for domain, entry in sorted(stats["streaming"].items())]),
+    ]
+
+metrics.register_collector(_collect_metrics)
+
+
+def fetch(url, until=None):
+    """
+    Conditional GET through the shared session.
+    Returns (response, text, cached_result). When the shop answers 304 Not
+    Modified, cached_result is the result parsed from the previous full
+    download and the caller can skip parsing entirely; otherwise
+    cached_result is None and text is the page.
+
+    `until` is an optional callable(text_so_far) -> bool (see
+    Extractor.stream_check); with it, text may be a prefix of the page.
+    """
+    with _validators_lock:
+        entry = _load_validators().get(url)
+
+    headers = {}
+    if entry:
+        _count("hits")
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    else:
+        _count("misses")
+
+    _count("requests")
+    _setup.seconds = 0.0
+    response = get_session().get(url, headers=headers, timeout=TIMEOUT, stream=True)
+    # Time to the response headers, minus setting up a new connection (timed separately)
+    wait = max(0.0, response.elapsed.total_seconds() - _setup.seconds)
+    metrics.STAGE_SECONDS.observe(wait, get_domain(url), "wait")
+
+    if response.status_code == 304 and entry:
+        _count("not_modified")
+        response.content  # consume the empty body so the connection goes back to the pool
+        return response, "", entry["result"]
+    return response, _read_body(url, response, until), None
+
+
+def remember(url, response, result):
+    """
+    Stores the response validators together with the parsed result, so the
+    next fetch of `url` can be answered with 304 and reuse `result`.
+    """
+    global _dirty
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    with _validators_lock:
+        validators = _load_validators()
+        if etag or last_modified:
+            validators[url] = {"etag": etag, "last_modified": last_modified, "result": result}
+        elif validators.pop(url, None) is None:
+            return
+        _dirty = True
+        due = time.monotonic() - _last_flush > FLUSH_INTERVAL
+    if due:
+        flush()
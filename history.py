@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import deque
+import archive
+import storage
+from urls import normalize_url
+
+WINDOW_DAYS = 30
+# Differences below one grosz are rounding noise, not a disagreement
+TOLERANCE = 0.01
+
+
+def is_observation(result):
+    """True if a parse result is a real price read from the shop (not simulated or dummy)."""
+    return bool(
+        result
+        and result.get("current_price")
+        and not result.get("is_simulated")
+        and not result.get("is_dummy")
+    )
+
+
+class PriceWindow:
+    """
+    Sliding-window minimum over a product's price series.
+
+    Keeps a monotonic deque of (timestamp, price in grosze) where prices
+    strictly increase from front to back: an observation can never be the
+    minimum again once a cheaper or equal one arrives after it. Pushing is
+    amortized O(1) and the window minimum is always at the front.
+    """
+
+    __slots__ = ("window", "points", "first_seen", "last_seen")
+
+    def __init__(self, window_days=WINDOW_DAYS):
+        self.window = window_days * 86400
+        self.points = deque()
+        self.first_seen = None
+        self.last_seen = None
+
+    def push(self, ts, price):
+        grosze = round(price * 100)
+        points = self.points
+        while points and points[-1][1] >= grosze:
+            points.pop()
+        points.append((ts, grosze))
+        if self.first_seen is None:
+            self.first_seen = ts
+        self.last_seen = ts
+
+    def minimum(self, now=None):
+        cutoff = (now or time.time()) - self.window
+        points = self.points
+        while points and points[0][0] < cutoff:
+            points.popleft()
+        return points[0][1] / 100 if points else None
+
+    def coverage_days(self, now=None):
+        if self.first_seen is None:
+            return 0
+        return ((now or time.time()) - self.first_seen) / 86400
+
+
+_windows = {}
+_lock = threading.Lock()
+
+
+def _window_for(url, now):
+    """
+    Returns the up-to-date window for a product. The first call loads the last
+    30 days from price_history; later calls only read rows newer than the last
+    one seen, which also picks up observations written by the cron process.
+    """
+    key = normalize_url(url)
+    with _lock:
+        window = _windows.get(key)
+        first_load = window is None
+        if first_load:
+            window = _windows[key] = PriceWindow()
+            first = storage.get_connection().execute(
+                "SELECT MIN(observed_at) FROM price_history WHERE norm_url = ?", (key,)
+            ).fetchone()[0]
+            since = now - window.window
+        else:
+            first = None
+            since = window.last_seen if window.last_seen is not None else now - window.window
+
+        rows = storage.get_connection().execute(
+            "SELECT observed_at, price FROM price_history WHERE norm_url = ? AND observed_at > ? ORDER BY observed_at",
+            (key, since),
+        ).fetchall()
+        for observed_at, price in rows:
+            window.push(observed_at, price)
+        if first is not None:
+            window.first_seen = first
+        if first_load:
+            # Observations moved to the archive still count towards coverage
+            archived = archive.first_ms(key)
+            if archived is not None:
+                window.first_seen = min(archived / 1000, window.first_seen or float("inf"))
+        return window
+
+
+def observe(url, price, shop_lowest_30d=None):
+    """Records an observation in price_history."""
+    storage.record_prices([(url, price, shop_lowest_30d)])
+
+
+def lowest_30d(url, now=None):
+    """Lowest price we observed for the product in the last 30 days, or None."""
+    now = now or time.time()
+    return _window_for(url, now).minimum(now)
+
+
+def compare_with_shop(url, shop_lowest_30d, now=None):
+    """
+    Compares the shop's claimed Omnibus price with our own history.
+    Returns (our_lowest, mismatch). Our value being lower is always a
+    mismatch (we saw that price). Our value being higher only counts once we
+    have watched the product for the full 30 days, otherwise we may simply
+    have missed the cheaper period.
+    """
+    now = now or time.time()
+    window = _window_for(url, now)
+    ours = window.minimum(now)
+    if ours is None or shop_lowest_30d is None:
+        return ours, False
+    if ours < shop_lowest_30d - TOLERANCE:
+        return ours, True
+    if ours > shop_lowest_30d + TOLERANCE and window.coverage_days(now) >= WINDOW_DAYS:
+        return ours, True
+    return ours, False
+
+
+def series(url, start_ms, end_ms, buckets):
+    """
+    Downsampled price series of a product for [start_ms, end_ms):
+    {"bucket_ms", "points"}, with one [bucket start ms, min, max] point per
+    bucket that has observations, from the archive and the recent rows
+    still in price_history.
+    """
+    key = normalize_url(url)
+    sampler = archive.downsample(key, start_ms, end_ms, buckets)
+    for observed_at, price in storage.history_rows(key, since=start_ms / 1000, until=end_ms / 1000):
+        sampler.add(round(observed_at * 1000), round(price * 100))
+    return {"bucket_ms": sampler.width, "points": sampler.series()}
@@ -0,0 +1,61 @@
+import threading
+import uuid
+from datetime import datetime
+
+# Finished jobs kept for status lookups
+MAX_FINISHED = 100
+
+_jobs = {}
+_running = {}
+_lock = threading.Lock()
+
+
+def start(kind, target):
+    """
+    Runs target() in a background thread and returns the job id.
+    Only one job of a kind runs at a time: starting a kind that is already
+    running returns the id of the running job instead of starting another.
+    """
+    with _lock:
+        if kind in _running:
+            return _running[kind]
+        job_id = str(uuid.uuid4())
+        _jobs[job_id] = {
+            "id": job_id,
+            "kind": kind,
+            "status": "running",
+            "started_at": datetime.now().isoformat(),
+            "finished_at": None,
+            "result": None,
+            "error": None,
+        }
+        _running[kind] = job_id
+        _prune()
+
+    threading.Thread(target=_run, args=(job_id, kind, target), daemon=True).start()
+    return job_id
+
+
+def _run(job_id, kind, target):
+    try:
+        result = target()
+        update = {"status": "done", "result": result}
+    except Exception as e:
+        print(f"Job {kind} {job_id} failed: {e}")
+        update = {"status": "failed", "error": str(e)}
+
+    with _lock:
+        _jobs[job_id].update(update, finished_at=datetime.now().isoformat())
+        del _running[kind]
+
+
+def _prune():
+    finished = [job_id for job_id, job in _jobs.items() if job["status"] != "running"]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED)]:
+        del _jobs[job_id]
+
+
+def get(job_id):
+    with _lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
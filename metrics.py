@@ -0,0 +1,186 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+_collectors = []
+_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with labels, e.g. fetches per domain and outcome."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _lock:
+            _metrics.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def summary(self, since=None):
+        """{label values: count}, counting only what happened after snapshot `since`."""
+        since = since or {}
+        values = {key: value - since.get(key, 0) for key, value in self.snapshot().items()}
+        return {key: value for key, value in values.items() if value}
+
+    def samples(self):
+        for key, value in sorted(self.snapshot().items()):
+            yield self.name + _format_labels(self.labels, key), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, like the Prometheus client's."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> [per-bucket counts, count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+        with _lock:
+            _metrics.append(self)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += 1
+            entry[2] += value
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def snapshot(self):
+        """{label values: (count, sum)}"""
+        with self._lock:
+            return {key: (entry[1], entry[2]) for key, entry in self._values.items()}
+
+    def summary(self, since=None):
+        """
+        {label values: {"count", "seconds", "avg"}}, counting only the
+        observations made after snapshot `since`.
+        """
+        since = since or {}
+        summary = {}
+        for key, (count, total) in self.snapshot().items():
+            before_count, before_total = since.get(key, (0, 0.0))
+            count, total = count - before_count, total - before_total
+            if count:
+                summary[key] = {"count": count, "seconds": round(total, 4), "avg": round(total / count, 4)}
+        return summary
+
+    def samples(self):
+        with self._lock:
+            values = {key: ([*entry[0]], entry[1], entry[2]) for key, entry in self._values.items()}
+        for key, (counts, count, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_value(float(bound))
+                yield self.name + "_bucket" + _format_labels(self.labels, key, [("le", le)]), cumulative
+            yield self.name + "_count" + _format_labels(self.labels, key), count
+            yield self.name + "_sum" + _format_labels(self.labels, key), total
+
+
+def register_collector(collect):
+    """
+    Adds a callable run at scrape time, for values kept elsewhere (cache
+    stats and the like). It returns (name, kind, help, [(labels dict, value)])
+    tuples; kind is "counter" or "gauge".
+    """
+    with _lock:
+        _collectors.append(collect)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        metrics, collectors = list(_metrics), list(_collectors)
+
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for sample, value in metric.samples():
+            lines.append(f"{sample} {_format_value(value)}")
+    for collect in collectors:
+        for name, kind, help, samples in collect():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Metrics shared across modules ---
+
+STAGE_SECONDS = Histogram(
+    "omnibus_fetch_stage_seconds",
+    "Time spent per page fetch stage (dns, connect, wait, download, parse) by shop.",
+    ("domain", "stage"),
+)
+FETCH_OUTCOMES = Counter(
+    "omnibus_fetch_total",
+    "Price checks by shop and outcome (ok, not_modified, dummy, blocked, skipped, timeout, error).",
+    ("domain", "outcome"),
+)
+EXTRACTIONS = Counter(
+    "omnibus_extraction_total",
+    "Parsed pages by shop and the strategy that found the price (jsonld, meta, selectors, regex, none).",
+    ("domain", "strategy"),
+)
+ALERT_SEND_SECONDS = Histogram(
+    "omnibus_alert_send_seconds",
+    "Time to hand one alert email to the SMTP server, retries included.",
+    ("outcome",),
+)
+RUN_SECONDS = Histogram(
+    "omnibus_cron_run_seconds",
+    "Duration of price check runs (full, due) and worker batches.",
+    ("mode",),
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
@@ -0,0 +1,80 @@
+"""
+Command line entry point.
+
+    python3 omnibus.py check [--due] [--budget N] [--daemon] [--worker ...]
+    python3 omnibus.py stats
+
+Commands import only what they use: `stats` never loads the fetching
+stack, and `check` loads requests/BeautifulSoup only when something is
+due and smtplib only when there are alerts to send, so frequent cron
+invocations with nothing to do finish in a fraction of the old start-up
+time (see bench_startup.py).
+"""
+import argparse
+import json
+import os
+import sys
+
+
+def load_env():
+    """Loads .env (requires python-dotenv) before modules read their settings at import."""
+    candidates = (os.getcwd(), os.path.dirname(os.path.abspath(__file__)))
+    path = next((os.path.join(d, ".env") for d in candidates if os.path.exists(os.path.join(d, ".env"))), None)
+    if path is None:
+        return
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(path)
+    except ImportError:
+        pass
+
+
+def check(args, cron=None):
+    """Runs `check`; `cron` is the already imported cron module when started as `python3 cron.py`."""
+    if cron is None:
+        import cron
+
+    if args.worker:
+        # Options left out fall back to cron.py's defaults (CRON_WORKER_BATCH, CRON_WORKER_LEASE)
+        options = {name: getattr(args, name) for name in ("batch", "lease") if getattr(args, name) is not None}
+        cron.run_worker(poll=args.poll, exit_when_idle=args.exit_when_idle, **options)
+    elif args.daemon:
+        cron.run_daemon(budget=args.budget, poll=args.poll)
+    else:
+        cron.run_cron(due=args.due, budget=args.budget)
+
+
+def stats(args):
+    import storage
+
+    print(json.dumps(storage.summary(), indent=2, ensure_ascii=False))
+
+
+def build_parser():
+    cli = argparse.ArgumentParser(prog="omnibus", description="Śledzenie cen produktów (Omnibus).")
+    commands = cli.add_subparsers(dest="command", required=True)
+
+    check_cli = commands.add_parser("check", help="sprawdź ceny śledzonych produktów")
+    check_cli.add_argument("--due", action="store_true", help="sprawdź tylko produkty, których termin sprawdzenia minął")
+    check_cli.add_argument("--budget", type=int, help="maksymalna liczba pobrań w jednym przebiegu")
+    check_cli.add_argument("--daemon", action="store_true", help="działaj w pętli, sprawdzając produkty w miarę jak stają się wymagalne")
+    check_cli.add_argument("--poll", type=float, default=60, help="maksymalna przerwa między przebiegami w trybie --daemon (s)")
+    check_cli.add_argument("--worker", action="store_true", help="tryb workera: pobieraj partie produktów z dzierżawą (wiele procesów na jednej bazie)")
+    check_cli.add_argument("--batch", type=int, help="liczba produktów w partii workera (domyślnie CRON_WORKER_BATCH)")
+    check_cli.add_argument("--lease", type=float, help="czas dzierżawy partii w s (domyślnie CRON_WORKER_LEASE)")
+    check_cli.add_argument("--exit-when-idle", action="store_true", help="zakończ workera, gdy nic nie jest wymagalne")
+    check_cli.set_defaults(run=check)
+
+    stats_cli = commands.add_parser("stats", help="pokaż liczbę produktów, terminy sprawdzeń, kolejkę alertów i ostatni przebieg")
+    stats_cli.set_defaults(run=stats)
+    return cli
+
+
+def main(argv=None):
+    load_env()
+    args = build_parser().parse_args(argv)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,7 +1,18 @@
 import requests
-from bs4 import BeautifulSoup
-import re
-import html
+import fetcher
+import metrics
+import strategies
+import throttle
+from extractors import Document, extractor_for
+from urls import get_domain
+
+def extract(url: str, text: str):
+    """
+    Runs the extractor registered for the URL's shop over a page.
+    Returns title, description, image_url, current_price and lowest_30d
+    (the last two are None when the page does not have them).
+    """
+    return extractor_for(url).extract(Document(text), url)
 
 def parse_price(url: str):
     """
@@ -18,16 +29,36 @@ def parse_price(url: str):
             "currency": "PLN"
         }
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    }
+    domain = get_domain(url)
+    permit = throttle.before_request(domain)
+    if not permit:
+        # The shop blocked us repeatedly; don't ask again until the cooldown is over
+        minutes = max(1, round(throttle.retry_after(domain) / 60))
+        print(f"Skipping {url}: circuit open for {domain}")
+        metrics.FETCH_OUTCOMES.inc(domain, "skipped")
+        return {
+            "blocked": True,
+            "current_price": 0.0,
+            "lowest_30d_price": 0.0,
+            "currency": "PLN",
+            "is_simulated": True,
+            "warning": f"Sklep tymczasowo blokuje automatyczne pobieranie. Kolejna próba za ok. {minutes} min."
+        }
 
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response, text, cached = fetcher.fetch(url, until=extractor_for(url).stream_check(strategies.winner(domain)))
+        if cached is not None:
+            # 304 Not Modified: the page is unchanged since the last parse
+            throttle.record(domain, ok=True)
+            metrics.FETCH_OUTCOMES.inc(domain, "not_modified")
+            return cached
         
         # Check if we were blocked
-        if response.status_code == 403 or "Twoje żądanie zostało zablokowane" in response.text:
+        blocked = response.status_code in (403, 429) or "Twoje żądanie zostało zablokowane" in text
+        throttle.record(domain, ok=not blocked)
+        if blocked:
             print(f"Blocked by {url}")
+            metrics.FETCH_OUTCOMES.inc(domain, "blocked")
             return {
                 "current_price": 2499.00,
                 "lowest_30d_price": 2799.00,
@@ -37,97 +68,15 @@ def parse_price(url: str):
             }
 
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        # Metadata extraction
-        title = soup.find("meta", property="og:title")
-        title = title["content"] if title else soup.title.string if soup.title else "Produkt"
-        title = html.unescape(title)
-        
-        description = soup.find("meta", property="og:description")
-        description = description["content"] if description else ""
-        description = html.unescape(description)
-        
-        image_url = soup.find("meta", property="og:image")
-        image_url = image_url["content"] if image_url else ""
-
-        current_price = None
-        lowest_30d = None
-
-        # Specific logic for TopHiFi.pl
-        if "tophifi.pl" in url:
-            # Title override if needed (often og:title is good)
-            # Image override if og:image is missing
-            if not image_url:
-                img_tag = soup.select_one('.gallery-placeholder__image')
-                if img_tag: image_url = img_tag.get('src')
-
-            # Most robust: try meta tags first
-            price_meta = soup.find("meta", {"property": "product:price:amount"})
-            if price_meta:
-                 current_price = float(price_meta["content"])
-            
-            # If meta fails, try specialized selector
-            if not current_price:
-                price_tag = soup.select_one('.product-info-main .price-box .price-container [data-price-type="finalPrice"] .price')
-                if price_tag:
-                    # Clean up: "1 499,00 zł" -> 1499.00
-                    price_text = price_tag.get_text().replace('\xa0', '').replace(' ', '').replace(',', '.')
-                    price_match = re.search(r'(\d+[.]?\d*)', price_text)
-                    if price_match:
-                        current_price = float(price_match.group(1))
-
-            # Lowest price from 30 days (Omnibus)
-            omnibus_tag = soup.select_one('.price-omnibus')
-            if omnibus_tag:
-                # Find all numbers in the text. We expect the price to be the one NOT equal to 30
-                # or the one followed by 'zł' or similar.
-                text = omnibus_tag.get_text()
-                # Find all potential price patterns
-                matches = re.finditer(r'(\d+[\s,.]\d*)', text)
-                for match in matches:
-                    val_str = match.group(1).replace(",", ".").replace("\xa0", "").replace(" ", "")
-                    try:
-                        val = float(val_str)
-                        if val != 30: # Simple heuristic: skip the "30" in "30 dni"
-                            lowest_30d = val
-                            break
-                    except ValueError:
-                        continue
 
-        # Specific logic for InkHouse.pl
-        if "inkhouse.pl" in url:
-            if not title or title == "Produkt":
-                title_tag = soup.select_one('h1')
-                if title_tag: title = title_tag.get_text().strip()
-
-            if not image_url:
-                img_tag = soup.select_one('#product-image')
-                if img_tag: image_url = img_tag.get('src')
-
-            # Current price usually in a meta tag or specific class
-            price_meta = soup.find("meta", {"property": "product:price:amount"})
-            if price_meta:
-                 current_price = float(price_meta["content"].replace(",", "."))
-            else:
-                # Fallback to searching for PLN text
-                price_text = soup.find(string=re.compile(r'\d+[,.]\d{2}\s*PLN'))
-                if price_text:
-                    price_match = re.search(r'(\d+[,.]\d{2})', price_text)
-                    if price_match:
-                        current_price = float(price_match.group(1).replace(",", "."))
-
-            # Lowest price from 30 days (Omnibus)
-            omnibus_text = soup.find(string=re.compile(r"Najniższa cena z 30 dni|30 dni przed", re.IGNORECASE))
-            if omnibus_text:
-                price_match = re.search(r'(\d+[,.]\d{2})', omnibus_text)
-                if not price_match and omnibus_text.parent:
-                    price_match = re.search(r'(\d+[,.]\d{2})', omnibus_text.parent.get_text())
-                if price_match:
-                    lowest_30d = float(price_match.group(1).replace(",", "."))
-        
-        # Generic fallback if specific logic didn't work
-        # ... (unchanged fallback logic) ...
+        with metrics.STAGE_SECONDS.time(domain, "parse"):
+            fields, attempts = extractor_for(url).extract_with_attempts(Document(text), url, strategies.order_for(domain))
+        strategies.record(domain, attempts)
+        current_price = fields["current_price"]
+        lowest_30d = fields["lowest_30d"]
+        title = fields["title"]
+        description = fields["description"]
+        image_url = fields["image_url"]
 
         if current_price:
             print(f"Successfully parsed current_price: {current_price} from {url}")
@@ -135,6 +84,8 @@ def parse_price(url: str):
             print(f"Successfully parsed lowest_30d: {lowest_30d} from {url}")
 
         # If we still don't have data, use PoC fallbacks
+        is_dummy = not current_price
+        lowest_30d_scraped = bool(lowest_30d)
         if not current_price: 
             print(f"Warning: Falling back to dummy current_price for {url}")
             current_price = 149.99
@@ -149,18 +100,29 @@ def parse_price(url: str):
             print(f"Warning: Falling back to dummy lowest_30d for {url}")
             lowest_30d = current_price * 1.2 if current_price else 179.99
         
-        return {
+        result = {
             "current_price": current_price,
             "lowest_30d_price": lowest_30d,
+            "lowest_30d_scraped": lowest_30d_scraped,
             "currency": "PLN",
             "is_simulated": False,
             "title": title,
             "description": description,
             "image_url": image_url
         }
+        if is_dummy:
+            result["is_dummy"] = True
+        else:
+            fetcher.remember(url, response, result)
+        metrics.FETCH_OUTCOMES.inc(domain, "dummy" if is_dummy else "ok")
+        return result
 
     except Exception as e:
         print(f"Error parsing {url}: {e}")
+        if isinstance(e, fetcher.NETWORK_ERRORS):
+            throttle.record(domain, ok=False)
+        timeout = isinstance(e, requests.exceptions.Timeout)
+        metrics.FETCH_OUTCOMES.inc(domain, "timeout" if timeout else "error")
         # Return a fallback even on crash for the PoC flow
         return {
             "current_price": 0.0,
@@ -169,3 +131,5 @@ def parse_price(url: str):
             "is_simulated": True,
             "error": str(e)
         }
+    finally:
+        throttle.release_probe(domain, permit)
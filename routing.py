@@ -0,0 +1,92 @@
+import threading
+from urllib.parse import quote_plus
+import storage
+from urls import get_domain
+
+
+def compile_template(template):
+    """
+    Splits an affiliate template on its {url} placeholder once, so building
+    a link is a join instead of a search-and-replace per click.
+    """
+    parts = template.split("{url}")
+    return lambda url: quote_plus(url).join(parts)
+
+
+class AffiliateRouter:
+    """
+    In-memory routing table for /out: item id -> redirect target, with the
+    affiliate rule of the item's shop already applied.
+
+    The table is built from the database on first use and after
+    invalidate() (affiliate rules changed); add_item() and remove_item()
+    keep it current when tracked items change in this process. An id
+    missing from the table (added by another process) is looked up in the
+    database once and then cached like the rest.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._targets = None
+        self._rules = {}
+        self._stats = {"hits": 0, "misses": 0, "rebuilds": 0}
+
+    def _build(self):
+        rules = {
+            domain: compile_template(rule["template"])
+            for domain, rule in storage.load_affiliates().items()
+            if rule["active"]
+        }
+        targets = {item_id: self._target(url, rules) for item_id, url in storage.item_urls()}
+        return rules, targets
+
+    @staticmethod
+    def _target(url, rules):
+        link = rules.get(get_domain(url))
+        return link(url) if link else url
+
+    def _table(self):
+        targets = self._targets
+        if targets is None:
+            with self._lock:
+                if self._targets is None:
+                    self._rules, self._targets = self._build()
+                    self._stats["rebuilds"] += 1
+                targets = self._targets
+        return targets
+
+    def resolve(self, item_id):
+        """Redirect target for a tracked item, or None if there is no such item."""
+        target = self._table().get(item_id)
+        if target is not None:
+            self._stats["hits"] += 1
+            return target
+
+        self._stats["misses"] += 1
+        item = storage.get_item(item_id)
+        if item is None:
+            return None
+        return self.add_item(item)
+
+    def add_item(self, item):
+        """Adds or updates one item's route; returns its target."""
+        targets = self._table()
+        with self._lock:
+            target = self._target(item["url"], self._rules)
+            targets[item["id"]] = target
+        return target
+
+    def remove_item(self, item_id):
+        targets = self._table()
+        with self._lock:
+            targets.pop(item_id, None)
+
+    def invalidate(self):
+        """Drops the table; it is rebuilt from the database on the next redirect."""
+        with self._lock:
+            self._targets = None
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        stats["routes"] = len(self._targets) if self._targets is not None else 0
+        return stats
@@ -0,0 +1,76 @@
+import heapq
+import os
+
+# Check intervals in seconds, overridable from .env
+MIN_INTERVAL = float(os.getenv("SCHEDULE_MIN_INTERVAL", str(15 * 60)))
+MAX_INTERVAL = float(os.getenv("SCHEDULE_MAX_INTERVAL", str(24 * 3600)))
+DEFAULT_INTERVAL = float(os.getenv("SCHEDULE_DEFAULT_INTERVAL", str(3600)))
+
+# A change halves the interval, a quiet check stretches it by half
+SPEEDUP = 0.5
+SLOWDOWN = 1.5
+
+
+def next_interval(interval, changed):
+    """
+    Adapts a product's check interval to how often its price moves:
+    products that change get checked more often, stable ones less.
+    """
+    interval = interval * (SPEEDUP if changed else SLOWDOWN)
+    return min(MAX_INTERVAL, max(MIN_INTERVAL, interval))
+
+
+class Scheduler:
+    """
+    Min-heap of products ordered by next check time.
+
+    Rescheduling pushes a new heap entry instead of updating the old one in
+    place; stale entries are recognised by their time and skipped on pop.
+    """
+
+    def __init__(self, entries=()):
+        # key -> (next_check_at, interval)
+        self.entries = {}
+        self.heap = []
+        for key, next_check_at, interval in entries:
+            self.entries[key] = (next_check_at, interval)
+            self.heap.append((next_check_at, key))
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _discard_stale(self):
+        heap = self.heap
+        while heap and self.entries.get(heap[0][1], (None,))[0] != heap[0][0]:
+            heapq.heappop(heap)
+
+    def next_due(self):
+        """Time the next product is due, or None when empty."""
+        self._discard_stale()
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now, budget=None):
+        """
+        Removes and returns the keys due at `now`, most overdue first,
+        at most `budget` of them. They come back with reschedule().
+        """
+        due = []
+        while (budget is None or len(due) < budget) and self.next_due() is not None and self.heap[0][0] <= now:
+            _, key = heapq.heappop(self.heap)
+            due.append(key)
+        return due
+
+    def reschedule(self, key, now, changed):
+        """
+        Schedules the next check after a check at `now`; returns
+        (next_check_at, interval). changed=None (the check failed) keeps
+        the current interval.
+        """
+        _, interval = self.entries.get(key, (None, DEFAULT_INTERVAL))
+        if changed is not None:
+            interval = next_interval(interval, changed)
+        next_check_at = now + interval
+        self.entries[key] = (next_check_at, interval)
+        heapq.heappush(self.heap, (next_check_at, key))
+        return next_check_at, interval
@@ -0,0 +1,673 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from urls import normalize_url
+
+DB_FILE = os.getenv("OMNIBUS_DB", "omnibus.db")
+
+# Legacy JSON files, imported once on first start
+LEGACY_DATA_FILE = "tracked.json"
+LEGACY_AFFILIATES_FILE = "affiliates.json"
+
+ITEM_FIELDS = (
+    "id", "url", "email", "title", "image_url", "status",
+    "current_price", "lowest_30d", "last_known_price", "last_checked", "created_at",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracked (
+    id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    norm_url TEXT NOT NULL,
+    email TEXT,
+    title TEXT,
+    image_url TEXT,
+    status TEXT,
+    current_price REAL,
+    lowest_30d REAL,
+    last_known_price REAL,
+    last_checked TEXT,
+    created_at TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tracked_url ON tracked(url);
+CREATE INDEX IF NOT EXISTS idx_tracked_norm_url ON tracked(norm_url);
+CREATE INDEX IF NOT EXISTS idx_tracked_email ON tracked(email);
+
+CREATE TABLE IF NOT EXISTS price_history (
+    norm_url TEXT NOT NULL,
+    observed_at REAL NOT NULL,
+    price REAL NOT NULL,
+    shop_lowest_30d REAL
+);
+CREATE INDEX IF NOT EXISTS idx_history_url_time ON price_history(norm_url, observed_at);
+CREATE INDEX IF NOT EXISTS idx_history_time ON price_history(observed_at);
+
+CREATE TABLE IF NOT EXISTS affiliates (
+    domain TEXT PRIMARY KEY,
+    network TEXT,
+    template TEXT NOT NULL,
+    active INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS schedule (
+    norm_url TEXT PRIMARY KEY,
+    next_check_at REAL NOT NULL,
+    interval REAL NOT NULL,
+    last_price REAL,
+    checks INTEGER NOT NULL DEFAULT 0,
+    changes INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS idx_schedule_next ON schedule(next_check_at);
+
+CREATE TABLE IF NOT EXISTS domain_state (
+    domain TEXT PRIMARY KEY,
+    failures INTEGER NOT NULL,
+    opened_until REAL NOT NULL,
+    cooldown REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS extraction_stats (
+    domain TEXT NOT NULL,
+    strategy TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    hits INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (domain, strategy)
+);
+
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    mode TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    owner TEXT,  -- "host:pid" of the process running it
+    heartbeat_at REAL  -- last commit of the owner
+);
+
+-- Products whose results a run has committed, so an interrupted run can resume
+CREATE TABLE IF NOT EXISTS run_journal (
+    run_id TEXT NOT NULL,
+    norm_url TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    PRIMARY KEY (run_id, norm_url)
+);
+
+-- Alerts are queued here in the same transaction as the price update, then sent
+CREATE TABLE IF NOT EXISTS alert_outbox (
+    key TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    url TEXT NOT NULL,
+    old_price REAL,
+    new_price REAL,
+    title TEXT,
+    image_url TEXT,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_until REAL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_pending ON alert_outbox(sent_at, created_at);
+CREATE INDEX IF NOT EXISTS idx_outbox_email ON alert_outbox(email, created_at) WHERE sent_at IS NULL;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def get_connection():
+    """
+    Returns this thread's connection to DB_FILE, creating the schema and
+    importing the legacy JSON files on first use.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == DB_FILE:
+        return conn
+
+    # isolation_level=None: transactions are opened explicitly with BEGIN
+    conn = sqlite3.connect(DB_FILE, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    _local.conn, _local.path = conn, DB_FILE
+
+    with _init_lock:
+        if DB_FILE not in _initialized:
+            conn.executescript(SCHEMA)
+            _add_missing_columns(conn)
+            migrate_from_json(conn)
+            _initialized.add(DB_FILE)
+    return conn
+
+
+def close():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+class transaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on error."""
+
+    def __init__(self, conn=None):
+        self.conn = conn or get_connection()
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+# Columns added after a table was first released: (table, column, type)
+ADDED_COLUMNS = (
+    ("schedule", "lease_owner", "TEXT"),
+    ("schedule", "lease_until", "REAL"),
+    ("runs", "owner", "TEXT"),
+    ("runs", "heartbeat_at", "REAL"),
+)
+
+
+def _add_missing_columns(conn):
+    """CREATE TABLE IF NOT EXISTS leaves old tables alone; add newer columns to them."""
+    for table, column, kind in ADDED_COLUMNS:
+        columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+
+
+def migrate_from_json(conn):
+    """One-shot import of tracked.json and affiliates.json into the database."""
+    with transaction(conn):
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return
+
+        items = _read_json(LEGACY_DATA_FILE, [])
+        for item in items:
+            _insert_item(conn, item)
+        for domain, rule in _read_json(LEGACY_AFFILIATES_FILE, {}).items():
+            _upsert_affiliate(conn, domain, rule)
+
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('json_migrated', ?)",
+            (datetime.now().isoformat(),),
+        )
+    if items:
+        print(f"Migrated {len(items)} tracked items from {LEGACY_DATA_FILE} to {DB_FILE}")
+
+
+def _read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r") as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError:
+            return default
+
+
+# --- Tracked items ---
+
+def _row_to_item(row):
+    item = {field: row[field] for field in ITEM_FIELDS}
+    if row["extra"]:
+        item.update(json.loads(row["extra"]))
+    return item
+
+
+def _insert_item(conn, item):
+    extra = {k: v for k, v in item.items() if k not in ITEM_FIELDS}
+    values = [item.get(field) for field in ITEM_FIELDS]
+    conn.execute(
+        f"INSERT OR IGNORE INTO tracked ({', '.join(ITEM_FIELDS)}, norm_url, extra) "
+        f"VALUES ({', '.join('?' * len(ITEM_FIELDS))}, ?, ?)",
+        values + [normalize_url(item["url"]), json.dumps(extra) if extra else None],
+    )
+
+
+def list_items():
+    rows = get_connection().execute("SELECT * FROM tracked ORDER BY rowid").fetchall()
+    return [_row_to_item(row) for row in rows]
+
+
+def get_item(item_id):
+    row = get_connection().execute("SELECT * FROM tracked WHERE id = ?", (item_id,)).fetchone()
+    return _row_to_item(row) if row else None
+
+
+def is_tracked(url, email):
+    """True if `email` already tracks the product at `url` (compared by normalized URL)."""
+    row = get_connection().execute(
+        "SELECT 1 FROM tracked WHERE norm_url = ? AND email = ?", (normalize_url(url), email)
+    ).fetchone()
+    return row is not None
+
+
+def add_item(item):
+    """Inserts a tracked item, assigning an id if it has none. Returns the stored item."""
+    item = dict(item)
+    item.setdefault("id", str(uuid.uuid4()))
+    item.setdefault("created_at", datetime.now().isoformat())
+    with transaction() as conn:
+        _insert_item(conn, item)
+    return item
+
+
+def delete_item(item_id):
+    """Deletes an item by id. Returns False if it did not exist."""
+    with transaction() as conn:
+        return conn.execute("DELETE FROM tracked WHERE id = ?", (item_id,)).rowcount > 0
+
+
+def item_urls():
+    """(id, url) of every tracked item."""
+    return [tuple(row) for row in get_connection().execute("SELECT id, url FROM tracked")]
+
+
+def list_products():
+    """Normalized URLs of all tracked products."""
+    return [row[0] for row in get_connection().execute("SELECT DISTINCT norm_url FROM tracked")]
+
+
+def items_for(norm_urls):
+    """Tracked items of the given products (by normalized URL)."""
+    norm_urls = list(norm_urls)
+    if not norm_urls:
+        return []
+    rows = get_connection().execute(
+        f"SELECT * FROM tracked WHERE norm_url IN ({', '.join('?' * len(norm_urls))}) ORDER BY rowid",
+        norm_urls,
+    ).fetchall()
+    return [_row_to_item(row) for row in rows]
+
+
+def _update_checked(conn, items):
+    conn.executemany(
+        "UPDATE tracked SET last_known_price = ?, last_checked = ? WHERE id = ?",
+        [(item["last_known_price"], item.get("last_checked"), item["id"]) for item in items],
+    )
+
+
+def update_checked(items):
+    """
+    Writes back the fields a price check changes, in one transaction.
+    Items deleted in the meantime are skipped; other fields are left untouched.
+    """
+    with transaction() as conn:
+        _update_checked(conn, items)
+
+
+# --- Price history ---
+
+def record_prices(observations):
+    """
+    Appends (url, price, shop_lowest_30d) observations to price_history,
+    one row each, stamped with the current time.
+    """
+    with transaction() as conn:
+        _record_prices(conn, observations)
+
+
+def _record_prices(conn, observations):
+    now = time.time()
+    conn.executemany(
+        "INSERT INTO price_history (norm_url, observed_at, price, shop_lowest_30d) VALUES (?, ?, ?, ?)",
+        [(normalize_url(url), now, price, shop_lowest) for url, price, shop_lowest in observations],
+    )
+
+
+def lowest_price(url, days=30, now=None):
+    """Lowest recorded price for a product over the last `days` days, or None."""
+    since = (now or time.time()) - days * 86400
+    row = get_connection().execute(
+        "SELECT MIN(price) FROM price_history WHERE norm_url = ? AND observed_at >= ?",
+        (normalize_url(url), since),
+    ).fetchone()
+    return row[0]
+
+
+def history_rows(norm_url, since=None, until=None):
+    """[(observed_at, price)] of a product, oldest first, with since <= observed_at < until."""
+    return get_connection().execute(
+        "SELECT observed_at, price FROM price_history WHERE norm_url = ? AND observed_at >= ? AND observed_at < ? "
+        "ORDER BY observed_at",
+        (norm_url, since if since is not None else float("-inf"), until if until is not None else float("inf")),
+    ).fetchall()
+
+
+def history_products(until):
+    """Products with price_history rows older than `until`."""
+    rows = get_connection().execute(
+        "SELECT DISTINCT norm_url FROM price_history WHERE observed_at < ?", (until,)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def delete_history(norm_url, until):
+    with transaction() as conn:
+        conn.execute("DELETE FROM price_history WHERE norm_url = ? AND observed_at < ?", (norm_url, until))
+
+
+# --- Check schedule ---
+
+def sync_schedule(norm_urls, default_interval):
+    """
+    Makes the schedule match the tracked products: new products are due
+    immediately, products nobody tracks any more are dropped.
+    """
+    norm_urls = set(norm_urls)
+    with transaction() as conn:
+        known = {row[0] for row in conn.execute("SELECT norm_url FROM schedule")}
+        conn.executemany(
+            "INSERT INTO schedule (norm_url, next_check_at, interval) VALUES (?, 0, ?)",
+            [(url, default_interval) for url in norm_urls - known],
+        )
+        conn.executemany("DELETE FROM schedule WHERE norm_url = ?", [(url,) for url in known - norm_urls])
+
+
+def load_schedule():
+    """Returns {norm_url: row} with next_check_at, interval, last_price, checks, changes."""
+    rows = get_connection().execute("SELECT * FROM schedule").fetchall()
+    return {row["norm_url"]: dict(row) for row in rows}
+
+
+SAVE_SCHEDULE = (
+    "UPDATE schedule SET next_check_at = :next_check_at, interval = :interval, last_price = :last_price, "
+    "checks = :checks, changes = :changes, lease_owner = NULL, lease_until = NULL WHERE norm_url = :norm_url"
+)
+
+
+def save_schedule(rows):
+    with transaction() as conn:
+        conn.executemany(SAVE_SCHEDULE, rows)
+
+
+# --- Check runs: incremental commits, resume, alert outbox ---
+
+def _process_gone(owner):
+    """True if `owner` ("host:pid") was a process on this host that is no longer running."""
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def start_run(mode, resume_window, owner, stale_after):
+    """
+    Starts a check run for `owner` ("host:pid"), or resumes the last
+    interrupted one if it started less than `resume_window` seconds ago.
+    A run counts as interrupted once its owner is gone or has not committed
+    for `stale_after` seconds; runs still going are left to their owners.
+    Returns (run_id, norm_urls the run already committed). Older
+    interrupted runs are closed as abandoned.
+    """
+    now = time.time()
+    with transaction() as conn:
+        stopped = [
+            row for row in conn.execute(
+                "SELECT id, started_at, owner, COALESCE(heartbeat_at, started_at) AS heartbeat_at "
+                "FROM runs WHERE finished_at IS NULL ORDER BY started_at DESC"
+            )
+            if row["heartbeat_at"] < now - stale_after or _process_gone(row["owner"])
+        ]
+        if stopped and stopped[0]["started_at"] >= now - resume_window:
+            run_id = stopped[0]["id"]
+            conn.execute("UPDATE runs SET owner = ?, heartbeat_at = ? WHERE id = ?", (owner, now, run_id))
+            done = {r[0] for r in conn.execute("SELECT norm_url FROM run_journal WHERE run_id = ?", (run_id,))}
+            return run_id, done
+        conn.executemany("UPDATE runs SET finished_at = ? WHERE id = ?", [(now, row["id"]) for row in stopped])
+        run_id = str(uuid.uuid4())
+        conn.execute(
+            "INSERT INTO runs (id, mode, started_at, owner, heartbeat_at) VALUES (?, ?, ?, ?, ?)",
+            (run_id, mode, now, owner, now),
+        )
+    return run_id, set()
+
+
+def commit_results(run_id, schedule_rows, items, observations, alerts):
+    """
+    Commits a slice of a run's results in one transaction: item updates,
+    price history, schedule rows and queued alerts, journaled under
+    `run_id` so a restarted run skips these products. Also the run's
+    heartbeat.
+    """
+    now = time.time()
+    with transaction() as conn:
+        _update_checked(conn, items)
+        _record_prices(conn, observations)
+        conn.executemany(SAVE_SCHEDULE, schedule_rows)
+        _queue_alerts(conn, alerts)
+        conn.executemany(
+            "INSERT OR IGNORE INTO run_journal (run_id, norm_url, checked_at) VALUES (?, ?, ?)",
+            [(run_id, row["norm_url"], now) for row in schedule_rows],
+        )
+        conn.execute("UPDATE runs SET heartbeat_at = ? WHERE id = ?", (now, run_id))
+
+
+def finish_run(run_id):
+    with transaction() as conn:
+        conn.execute("UPDATE runs SET finished_at = ? WHERE id = ?", (time.time(), run_id))
+
+
+def _queue_alerts(conn, alerts):
+    """Alert keys are unique, so queueing the same alert twice is a no-op."""
+    now = time.time()
+    conn.executemany(
+        "INSERT OR IGNORE INTO alert_outbox (key, email, url, old_price, new_price, title, image_url, created_at) "
+        "VALUES (:key, :email, :url, :old_price, :new_price, :title, :image_url, :created_at)",
+        [dict(alert, created_at=now) for alert in alerts],
+    )
+
+
+def claim_alerts(max_attempts, lease_seconds, hold=0, now=None):
+    """
+    Claims the queued alerts that are not sent yet and were tried fewer
+    than `max_attempts` times, grouped by email, oldest first. Claimed
+    alerts are skipped by other processes for `lease_seconds` (or until
+    mark_alert()).
+
+    With `hold` > 0 a subscriber's alerts are only claimed once the oldest
+    of them has waited `hold` seconds, so drops arriving in the meantime
+    go out together in one digest.
+    """
+    now = now or time.time()
+    claimable = "sent_at IS NULL AND attempts < :attempts AND (claimed_until IS NULL OR claimed_until <= :now)"
+    with transaction() as conn:
+        rows = conn.execute(
+            f"SELECT * FROM alert_outbox WHERE {claimable} AND email IN "
+            f"(SELECT email FROM alert_outbox WHERE {claimable} GROUP BY email HAVING MIN(created_at) <= :ready) "
+            "ORDER BY email, created_at",
+            {"attempts": max_attempts, "now": now, "ready": now - hold},
+        ).fetchall()
+        conn.executemany(
+            "UPDATE alert_outbox SET claimed_until = ? WHERE key = ?",
+            [(now + lease_seconds, row["key"]) for row in rows],
+        )
+    return [dict(row) for row in rows]
+
+
+def mark_alert(key, sent):
+    """Records a send attempt: sent alerts are never sent again, failed ones wait for the next run."""
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE alert_outbox SET sent_at = ?, attempts = attempts + 1, claimed_until = NULL WHERE key = ?",
+            (time.time() if sent else None, key),
+        )
+
+
+def compact(keep_days, max_attempts):
+    """
+    Drops the journals of finished runs, and runs and alerts (sent or
+    tried `max_attempts` times) older than `keep_days`, then truncates the
+    WAL file. Alerts still waiting to be sent are kept however old.
+    """
+    cutoff = time.time() - keep_days * 86400
+    with transaction() as conn:
+        conn.execute("DELETE FROM run_journal WHERE run_id IN (SELECT id FROM runs WHERE finished_at IS NOT NULL)")
+        conn.execute("DELETE FROM runs WHERE finished_at < ?", (cutoff,))
+        conn.execute(
+            "DELETE FROM alert_outbox WHERE created_at < ? AND (sent_at IS NOT NULL OR attempts >= ?)",
+            (cutoff, max_attempts),
+        )
+    get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def summary(now=None):
+    """Counts for `omnibus.py stats`: tracked items, schedule, alert outbox and the last run."""
+    now = now or time.time()
+    conn = get_connection()
+    items, products = conn.execute("SELECT COUNT(*), COUNT(DISTINCT norm_url) FROM tracked").fetchone()
+    due, next_due = conn.execute(
+        "SELECT COALESCE(SUM(next_check_at <= ?), 0), MIN(next_check_at) FROM schedule", (now,)
+    ).fetchone()
+    pending, failed = conn.execute(
+        "SELECT COALESCE(SUM(sent_at IS NULL AND attempts = 0), 0), COALESCE(SUM(sent_at IS NULL AND attempts > 0), 0) "
+        "FROM alert_outbox"
+    ).fetchone()
+    last_run = conn.execute(
+        "SELECT id, mode, started_at, finished_at FROM runs ORDER BY started_at DESC LIMIT 1"
+    ).fetchone()
+    return {
+        "items": items,
+        "products": products,
+        "due": due,
+        "next_due": next_due,
+        "alerts_pending": pending,
+        "alerts_failed": failed,
+        "affiliates": conn.execute("SELECT COUNT(*) FROM affiliates WHERE active").fetchone()[0],
+        "last_run": dict(last_run) if last_run else None,
+    }
+
+
+# --- Leases for multi-process workers ---
+
+def claim_due(owner, limit, lease_seconds, now=None):
+    """
+    Claims up to `limit` due products for worker `owner`, most overdue
+    first, and returns their schedule rows. A claimed product is leased
+    for `lease_seconds`: other workers skip it until the lease runs out,
+    so a crashed worker's products are picked up again afterwards.
+    """
+    now = now or time.time()
+    with transaction() as conn:
+        rows = conn.execute(
+            "SELECT * FROM schedule WHERE next_check_at <= ? AND (lease_until IS NULL OR lease_until <= ?) "
+            "ORDER BY next_check_at LIMIT ?",
+            (now, now, limit),
+        ).fetchall()
+        conn.executemany(
+            "UPDATE schedule SET lease_owner = ?, lease_until = ? WHERE norm_url = ?",
+            [(owner, now + lease_seconds, row["norm_url"]) for row in rows],
+        )
+    return [dict(row, lease_owner=owner, lease_until=now + lease_seconds) for row in rows]
+
+
+def complete_claims(owner, schedule_rows, items, observations, alerts=()):
+    """
+    Commits a worker's results and queues its alerts in one transaction,
+    releasing its leases.
+    Results for products whose lease was taken over by another worker
+    (it ran out in the meantime) are dropped, so every check is applied
+    once. Returns the set of normalized URLs that were committed.
+    """
+    owned = set()
+    with transaction() as conn:
+        for row in schedule_rows:
+            cursor = conn.execute(SAVE_SCHEDULE + " AND lease_owner = :owner", dict(row, owner=owner))
+            if cursor.rowcount:
+                owned.add(row["norm_url"])
+        _update_checked(conn, [item for item in items if normalize_url(item["url"]) in owned])
+        _record_prices(conn, [obs for obs in observations if normalize_url(obs[0]) in owned])
+        _queue_alerts(conn, [alert for alert in alerts if normalize_url(alert["url"]) in owned])
+    return owned
+
+
+# --- Per-shop circuit breaker state ---
+
+def load_domain_state(domain):
+    row = get_connection().execute("SELECT * FROM domain_state WHERE domain = ?", (domain,)).fetchone()
+    return dict(row) if row else None
+
+
+def save_domain_state(domain, state):
+    with transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO domain_state (domain, failures, opened_until, cooldown) VALUES (?, ?, ?, ?)",
+            (domain, state["failures"], state["opened_until"], state["cooldown"]),
+        )
+
+
+def load_strategy_stats():
+    """{domain: {strategy: (attempts, hits, seconds)}} for price extraction strategies."""
+    stats = {}
+    for row in get_connection().execute("SELECT * FROM extraction_stats"):
+        stats.setdefault(row["domain"], {})[row["strategy"]] = (row["attempts"], row["hits"], row["seconds"])
+    return stats
+
+
+def save_strategy_stats(stats):
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO extraction_stats (domain, strategy, attempts, hits, seconds) VALUES (?, ?, ?, ?, ?)",
+            [(domain, name, *values) for domain, strategies in stats.items() for name, values in strategies.items()],
+        )
+
+
+# --- Affiliates ---
+
+def _upsert_affiliate(conn, domain, rule):
+    conn.execute(
+        "INSERT OR REPLACE INTO affiliates (domain, network, template, active) VALUES (?, ?, ?, ?)",
+        (domain, rule.get("network"), rule["template"], int(bool(rule.get("active")))),
+    )
+
+
+def load_affiliates():
+    rows = get_connection().execute("SELECT * FROM affiliates ORDER BY domain").fetchall()
+    return {
+        row["domain"]: {"network": row["network"], "template": row["template"], "active": bool(row["active"])}
+        for row in rows
+    }
+
+
+def get_affiliate(domain):
+    row = get_connection().execute("SELECT * FROM affiliates WHERE domain = ?", (domain,)).fetchone()
+    if not row:
+        return None
+    return {"network": row["network"], "template": row["template"], "active": bool(row["active"])}
+
+
+def save_affiliate(domain, rule):
+    with transaction() as conn:
+        _upsert_affiliate(conn, domain, rule)
+
+
+def delete_affiliate(domain):
+    with transaction() as conn:
+        return conn.execute("DELETE FROM affiliates WHERE domain = ?", (domain,)).rowcount > 0
+
+
+if __name__ == "__main__":
+    get_connection()
+    print(f"{DB_FILE}: {len(list_items())} tracked items, {len(load_affiliates())} affiliate rules")
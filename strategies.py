@@ -0,0 +1,126 @@
+import atexit
+import threading
+import time
+import metrics
+import storage
+from extractors import extractor_for
+
+# Learned per shop: how often each price extraction strategy was tried, how
+# often it found the price and how long it took. Strategies are tried in
+# order of expected cost (time per try / chance of success), so cheap
+# structured data goes first while it keeps working, and of the expensive
+# ones (full tree, text scan) the one that works for the shop comes first.
+# The winner also decides how much of a page is downloaded (see winner()).
+
+# Assumed seconds per try before a strategy was timed on a shop, by position in
+# the extractor's default order (Extractor.strategies), so that order is kept
+PRIOR_SECONDS = (0.0001, 0.0002, 0.01, 0.02)
+# Counts are halved past this many tries, so a shop redesign is picked up
+MAX_ATTEMPTS = 100
+# Pages of a shop read for the default strategy before concluding none works,
+# and how often such a shop is explored again (it may have been redesigned)
+EXPLORE_PAGES = 5
+REEXPLORE_EVERY = 20
+# Learned stats are written to the database at most this often (and on exit)
+FLUSH_INTERVAL = 30
+
+_learned = None
+_dirty = set()
+_last_flush = time.monotonic()
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_stats = {"first_try": 0, "fallbacks": 0, "misses": 0}
+
+
+def _load():
+    global _learned
+    if _learned is None:
+        _learned = storage.load_strategy_stats()
+    return _learned
+
+
+def expected_cost(stats, name, default):
+    attempts, hits, seconds = stats.get(name, (0, 0, 0.0))
+    per_try = seconds / attempts if attempts else PRIOR_SECONDS[default.index(name)]
+    return per_try * (attempts + 2) / (hits + 1)
+
+
+def _default(domain):
+    return extractor_for(f"https://{domain}/").strategies
+
+
+def _order(domain, stats):
+    default = _default(domain)
+    return tuple(sorted(default, key=lambda name: expected_cost(stats, name, default)))
+
+
+def order_for(domain):
+    """Strategies to try for a shop, cheapest expected cost first."""
+    with _lock:
+        stats = dict(_load().get(domain, {}))
+    return _order(domain, stats)
+
+
+def winner(domain):
+    """
+    The strategy expected to find a shop's price: the first in order_for()
+    that has found one before. While nothing has yet, the first of the
+    extractor's default order for EXPLORE_PAGES pages, then None (none
+    works) except for every REEXPLORE_EVERY-th page.
+    """
+    with _lock:
+        stats = dict(_load().get(domain, {}))
+    for name in _order(domain, stats):
+        if stats.get(name, (0, 0))[1]:
+            return name
+    pages = max((tries for tries, _, _ in stats.values()), default=0)
+    if pages < EXPLORE_PAGES or pages % REEXPLORE_EVERY == 0:
+        return _default(domain)[0]
+    return None
+
+
+def record(domain, attempts):
+    """
+    Reports one extraction: [(strategy, found, seconds)] in the order they
+    were tried, the last one being the strategy that found the price (if any).
+    """
+    strategy = attempts[-1][0] if attempts and attempts[-1][1] else None
+    metrics.EXTRACTIONS.inc(domain, strategy or "none")
+    with _lock:
+        stats = _load().setdefault(domain, {})
+        for name, found, seconds in attempts:
+            tries, hits, total = stats.get(name, (0, 0, 0.0))
+            tries, hits, total = tries + 1, hits + int(found), total + seconds
+            if tries > MAX_ATTEMPTS:
+                tries, hits, total = tries // 2, hits // 2, total / 2
+            stats[name] = (tries, hits, total)
+        _dirty.add(domain)
+        if strategy is None:
+            _stats["misses"] += 1
+        else:
+            _stats["first_try" if len(attempts) == 1 else "fallbacks"] += 1
+        due = time.monotonic() - _last_flush > FLUSH_INTERVAL
+    if due:
+        flush()
+
+
+def flush():
+    """Writes the stats of shops that changed since the last flush."""
+    global _last_flush
+    with _flush_lock:
+        with _lock:
+            if not _dirty:
+                return
+            changed = {domain: dict(_learned[domain]) for domain in _dirty}
+            _dirty.clear()
+            _last_flush = time.monotonic()
+        storage.save_strategy_stats(changed)
+
+
+atexit.register(flush)
+
+
+def get_stats():
+    with _lock:
+        shops = {domain: list(_order(domain, stats)) for domain, stats in _load().items()}
+        return dict(_stats, shops=shops)
@@ -0,0 +1,139 @@
+import socketserver
+import threading
+
+import pytest
+
+import alerts
+from alerts import AlertDispatcher
+
+
+class StubSMTP(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: records connections and delivered messages."""
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 stub ESMTP")
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            command = line.split(" ", 1)[0].upper()
+            if command in ("EHLO", "HELO"):
+                self.reply("250 stub")
+            elif command == "RCPT":
+                if "refused" in line:
+                    self.reply("550 no such user")
+                else:
+                    server.recipients.append(line.split(":", 1)[1].strip("<> "))
+                    self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 go ahead")
+                while self.rfile.readline().rstrip(b"\r\n") != b".":
+                    pass
+                server.delivered += 1
+                self.reply("250 queued")
+                if server.drop_after and server.delivered == server.drop_after:
+                    return  # hang up mid-session
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 OK")
+
+    def reply(self, text):
+        self.wfile.write((text + "\r\n").encode())
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), StubSMTP)
+    server.connections = 0
+    server.delivered = 0
+    server.drop_after = 0
+    server.recipients = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def dispatcher_for(server, **kwargs):
+    config = {
+        "host": "127.0.0.1", "port": str(server.server_address[1]),
+        "user": None, "password": None, "sender": "alerts@omnibus.test", "security": "none",
+    }
+    return AlertDispatcher(config=config, rate=1000, sleep=lambda seconds: None, **kwargs)
+
+
+def test_batch_goes_over_one_connection_and_renders_once_per_product(smtp_server, monkeypatch):
+    renders = []
+    render = alerts.render_alert
+    monkeypatch.setattr(alerts, "render_alert", lambda *args: renders.append(args) or render(*args))
+
+    dispatcher = dispatcher_for(smtp_server)
+    for i in range(20):
+        dispatcher.add(f"user{i}@x.pl", "https://shop.pl/p", 100.0, 80.0, title="Głośniki")
+    dispatcher.add("other@x.pl", "https://shop.pl/q", 50.0, 40.0)
+    stats = dispatcher.flush()
+
+    assert stats["sent"] == 21
+    assert smtp_server.delivered == 21
+    assert smtp_server.connections == 1
+    assert len(renders) == 2
+    assert smtp_server.recipients[:2] == ["user0@x.pl", "user1@x.pl"]
+
+
+def test_reconnects_after_limit_and_retries_dropped_connection(smtp_server):
+    smtp_server.drop_after = 3
+    dispatcher = dispatcher_for(smtp_server, max_per_connection=5)
+    for i in range(12):
+        dispatcher.add(f"user{i}@x.pl", "https://shop.pl/p", 100.0, 80.0)
+    dispatcher.add("refused@x.pl", "https://shop.pl/p", 100.0, 80.0)
+    stats = dispatcher.flush()
+
+    assert stats["sent"] == 12
+    assert stats["failed"] == 1
+    assert stats["retries"] == 1
+    assert smtp_server.delivered == 12
+    assert smtp_server.connections >= 3
+
+
+def test_reports_each_message_to_the_outbox(smtp_server):
+    results = []
+    dispatcher = dispatcher_for(smtp_server, on_result=lambda key, sent: results.append((key, sent)))
+    dispatcher.add("a@x.pl", "https://shop.pl/p", 100.0, 80.0, key="1:100:80")
+    dispatcher.add("refused@x.pl", "https://shop.pl/p", 100.0, 80.0, key="2:100:80")
+    dispatcher.add("b@x.pl", "https://shop.pl/p", 100.0, 80.0)
+    dispatcher.flush()
+
+    assert results == [("1:100:80", True), ("2:100:80", False)]
+
+
+def test_alerts_for_one_subscriber_go_out_as_one_digest(smtp_server):
+    results = []
+    dispatcher = dispatcher_for(smtp_server, on_result=lambda key, sent: results.append((key, sent)))
+    dispatcher.add("a@x.pl", "https://shop.pl/p", 100.0, 80.0, title="Głośniki", key="1:100:80")
+    dispatcher.add("a@x.pl", "https://shop.pl/q", 50.0, 45.0, title="Kabel", key="2:50:45")
+    dispatcher.add("a@x.pl", "https://shop.pl/p", 80.0, 70.0, title="Głośniki", key="1:80:70")
+    dispatcher.add("b@x.pl", "https://shop.pl/q", 50.0, 45.0, title="Kabel", key="3:50:45")
+    stats = dispatcher.flush()
+
+    assert smtp_server.recipients == ["a@x.pl", "b@x.pl"]
+    assert stats["sent"] == 2 and stats["digests"] == 1
+    assert sorted(results) == [("1:100:80", True), ("1:80:70", True), ("2:50:45", True), ("3:50:45", True)]
+
+
+def test_digest_merges_repeated_drops_of_a_product():
+    products = [("https://shop.pl/q", 50.0, 45.0, "Kabel", None), ("https://shop.pl/p", 100.0, 70.0, "Głośniki", None)]
+    dispatcher = AlertDispatcher(config={"host": None, "user": None, "password": None, "security": "none"})
+    for url, old, new, title, image_url in products:
+        dispatcher.add("a@x.pl", url, old, new, title=title)
+    dispatcher.add("a@x.pl", "https://shop.pl/p", 70.0, 60.0, title="Głośniki")
+    merged = [entry["product"] for entry in dispatcher.pending["a@x.pl"].values()]
+    assert merged[1] == ("https://shop.pl/p", 100.0, 60.0, "Głośniki", None)
+
+    subject, text, html = alerts.render_digest(merged, ["<tr>q</tr>", "<tr>p</tr>"])
+    assert "2 Twoich produktów" in subject and "45.0 PLN" in subject
+    assert "Głośniki: 100.0 -> 60.0 PLN" in text
+    assert "<tr>q</tr><tr>p</tr>" in html
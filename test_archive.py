@@ -0,0 +1,131 @@
+import os
+import random
+
+import pytest
+from fastapi import HTTPException
+
+import app
+import archive
+import history
+import storage
+
+DAY_MS = 86400 * 1000
+URL = "https://shop.pl/p"
+
+
+@pytest.fixture
+def archive_dir(db, monkeypatch):
+    monkeypatch.setenv("OMNIBUS_ARCHIVE", str(db / "archive"))
+    monkeypatch.setattr(history, "_windows", {})
+    return db / "archive"
+
+
+def random_series(count, start=1_600_000_000_000):
+    rng = random.Random(7)
+    points, ms, grosze = [], start, 49_999
+    for _ in range(count):
+        # Mostly hourly checks with small moves, some long gaps and big jumps that need wider deltas
+        ms += rng.choice([3600_000] * 20 + [40 * DAY_MS])
+        grosze = max(1, grosze + rng.choice([0, 0, 0, -100, 100, -50_000, 50_000]))
+        points.append((ms, grosze))
+    return points
+
+
+def brute_force(points, start, end, buckets):
+    sampler = archive.Downsampler(start, end, buckets)
+    for ms, grosze in points:
+        sampler.add(ms, grosze)
+    return sampler.series()
+
+
+def test_blocks_round_trip_and_stay_compact(archive_dir, monkeypatch):
+    monkeypatch.setattr(archive, "BLOCK_POINTS", 100)
+    points = random_series(1000)
+    # Appended in uneven slices so partial last blocks get merged
+    for i in range(0, len(points), 170):
+        assert archive.append(URL, points[i:i + 170]) == len(points[i:i + 170])
+    assert archive.append(URL, points[-10:]) == 0
+
+    with archive._Mapped(URL) as mapped:
+        blocks = mapped.blocks()
+        decoded = [point for block in blocks for point in block.decode(mapped.buffer)]
+    assert decoded == points
+    assert [block.count for block in blocks] == [100] * 10
+    assert archive.first_ms(URL) == points[0][0]
+
+    # Hourly checks with small price moves pack into 4-byte time and 2-byte price deltas
+    regular = [(1_600_000_000_000 + i * 3600_000, 49_999 + i % 3 * 100) for i in range(1000)]
+    archive.append("https://shop.pl/regular", regular)
+    assert os.path.getsize(archive.path_for("https://shop.pl/regular")) < len(regular) * 7
+
+
+def test_append_writes_only_the_new_blocks(archive_dir, monkeypatch):
+    monkeypatch.setattr(archive, "BLOCK_POINTS", 100)
+    monkeypatch.setattr(archive, "INDEX_SIZE", 2)
+    monkeypatch.setattr(archive, "_index", archive.OrderedDict())
+    points = random_series(260)
+    archive.append(URL, points[:250])
+    path = archive.path_for(URL)
+    before = os.stat(path)
+    with open(path, "rb") as f:
+        full_blocks = f.read(len(archive.encode_block(points[:100]) + archive.encode_block(points[100:200])))
+
+    # The file is extended in place: full blocks stay as they are, the partial one grows
+    assert archive.append(URL, points[250:]) == 10
+    assert os.stat(path).st_ino == before.st_ino
+    with open(path, "rb") as f:
+        assert f.read(len(full_blocks)) == full_blocks
+
+    # A block cut short by a crash is ignored, and overwritten by the next append
+    with open(path, "ab") as f:
+        f.write(archive.encode_block(points[:5])[:-3])
+    with archive._Mapped(URL) as mapped:
+        assert [block.count for block in mapped.blocks()] == [100, 100, 60]
+    assert archive.append(URL, [(points[-1][0] + 1, 100)]) == 1
+    with archive._Mapped(URL) as mapped:
+        assert [point for block in mapped.blocks() for point in block.decode(mapped.buffer)] == points + [(points[-1][0] + 1, 100)]
+
+    # Parsed headers are kept for the most recently read files only
+    for i in range(5):
+        archive.append(f"{URL}/{i}", points[:10])
+        archive.first_ms(f"{URL}/{i}")
+    assert len(archive._index) == 2
+
+
+def test_downsampling_from_headers_matches_decoding_every_point(archive_dir, monkeypatch):
+    monkeypatch.setattr(archive, "BLOCK_POINTS", 64)
+    points = random_series(5000)
+    archive.append(URL, points)
+    start, end = points[0][0], points[-1][0] + 1
+
+    for buckets in (1, 7, 300, 100_000):
+        assert archive.downsample(URL, start, end, buckets).series() == brute_force(points, start, end, buckets)
+    middle = points[1000][0], points[3000][0]
+    assert archive.downsample(URL, *middle, 50).series() == brute_force(points, *middle, 50)
+
+
+def test_old_history_moves_to_the_archive_and_series_joins_both(archive_dir):
+    now = 1_800_000_000
+    rows = [(now - day * 86400, 100.0 + day) for day in range(100)]
+    with storage.transaction() as conn:
+        conn.executemany("INSERT INTO price_history (norm_url, observed_at, price) VALUES (?, ?, ?)",
+                         [(URL, observed_at, price) for observed_at, price in rows])
+
+    assert archive.archive_history(after_days=45, now=now) == 54
+    assert archive.archive_history(after_days=45, now=now) == 0
+    assert len(storage.history_rows(URL)) == 46
+
+    start, end = (now - 100 * 86400) * 1000, (now + 1) * 1000
+    series = history.series(URL, start, end, buckets=10)
+    expected = brute_force([(observed_at * 1000, round(price * 100)) for observed_at, price in rows], start, end, 10)
+    assert series["points"] == expected and len(expected) == 10
+    # Archived observations still count as coverage for the Omnibus comparison
+    assert history._window_for(URL, now).coverage_days(now) == 99
+
+
+def test_history_endpoint_validates_range(archive_dir):
+    with pytest.raises(HTTPException):
+        app.get_history(URL, start=10, end=5)
+    with pytest.raises(HTTPException):
+        app.get_history(URL, buckets=0)
+    assert app.get_history(URL)["points"] == []
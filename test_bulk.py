@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+import app
+import bulk
+import storage
+
+
+def test_reads_jsonl_and_csv():
+    jsonl = '{"url": "https://shop.pl/a", "email": "a@x.pl"}\n\n"https://shop.pl/b"\nnot json\n'
+    assert bulk.read_rows(jsonl) == [
+        (1, {"url": "https://shop.pl/a", "email": "a@x.pl"}),
+        (3, {"url": "https://shop.pl/b", "email": None}),
+        (4, {"url": "not json", "error": "Niepoprawny JSON"}),
+    ]
+    assert bulk.read_rows("email,URL\na@x.pl,https://shop.pl/a\n,https://shop.pl/b\n", "text/csv") == [
+        (2, {"url": "https://shop.pl/a", "email": "a@x.pl"}),
+        (3, {"url": "https://shop.pl/b", "email": None}),
+    ]
+    assert bulk.read_rows("https://shop.pl/a\nhttps://shop.pl/b\n") == [
+        (1, {"url": "https://shop.pl/a", "email": None}),
+        (2, {"url": "https://shop.pl/b", "email": None}),
+    ]
+    with pytest.raises(bulk.UploadError):
+        bulk.read_rows("name,price\nx,1\n", "text/csv")
+
+
+def test_plan_validates_and_dedupes(monkeypatch):
+    rows = bulk.read_rows(
+        "url,email\n"
+        "https://www.shop.pl/a?utm_source=x,a@x.pl\n"
+        "https://shop.pl/a,b@x.pl\n"
+        "https://shop.pl/a,a@x.pl\n"
+        "ftp://shop.pl/a,\n"
+        "https://shop.pl/b,\n"
+    )
+    products, rejected = bulk.plan(rows)
+
+    assert products == {
+        "https://shop.pl/a": {"url": "https://www.shop.pl/a?utm_source=x", "lines": [2, 3], "emails": ["a@x.pl", "b@x.pl"]},
+        "https://shop.pl/b": {"url": "https://shop.pl/b", "lines": [6], "emails": []},
+    }
+    assert [(r["line"], r["error"]) for r in rejected] == [(4, "Duplikat"), (5, "Niepoprawny URL")]
+
+    monkeypatch.setattr(bulk, "MAX_URLS", 1)
+    with pytest.raises(bulk.TooManyUrls):
+        bulk.plan(rows)
+
+
+def test_streams_results_and_tracks(db, monkeypatch):
+    prices = {"https://shop.pl/a": 80.0, "https://shop.pl/b": 0.0}
+    monkeypatch.setattr(app, "parse_price", lambda url: {
+        "current_price": prices[url], "lowest_30d_price": 90.0, "lowest_30d_scraped": True, "currency": "PLN",
+        "is_simulated": False, "title": "Produkt",
+    })
+    app.check_cache.invalidate()
+    products, rejected = bulk.plan(bulk.read_rows(
+        '{"url": "https://shop.pl/a", "email": "a@x.pl"}\n{"url": "https://shop.pl/b"}\n{"url": "nope"}\n'
+    ))
+
+    lines = [json.loads(line) for line in app.stream_bulk_results(products, rejected)]
+
+    assert lines[0] == {"line": 3, "url": "nope", "error": "Niepoprawny URL"}
+    by_url = {line["url"]: line for line in lines[1:-1]}
+    assert by_url["https://shop.pl/a"]["result"]["status"] == "green"
+    assert by_url["https://shop.pl/a"]["tracked"] == ["a@x.pl"]
+    assert "error" in by_url["https://shop.pl/b"]
+    assert lines[-1] == {"summary": {"urls": 2, "rejected": 1, "ok": 1, "failed": 1, "tracked": 1}}
+    assert [(i["email"], i["last_known_price"]) for i in storage.list_items()] == [("a@x.pl", 80.0)]
+
+    # Importing the same file again does not track twice
+    list(app.stream_bulk_results(products, rejected))
+    assert len(storage.list_items()) == 1
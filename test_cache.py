@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_concurrent_loads_are_coalesced():
+    cache = TTLCache(maxsize=10, ttl=60)
+    calls = []
+
+    def slow_load():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"current_price": 10.0}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("k", slow_load))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [{"current_price": 10.0}] * 8
+    stats = cache.get_stats()
+    assert (stats["misses"], stats["coalesced"]) == (1, 7)
+
+
+def test_ttl_and_lru_eviction():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+    cache.get_or_load("a", lambda: 1)
+    cache.get_or_load("b", lambda: 2)
+    cache.get_or_load("a", lambda: pytest.fail("a should be cached"))
+    cache.get_or_load("c", lambda: 3)  # evicts b, the least recently used
+
+    assert cache.get_or_load("b", lambda: 20) == 20
+    clock.now = 11
+    assert cache.get_or_load("b", lambda: 200) == 200
+
+    stats = cache.get_stats()
+    assert stats["evictions"] == 2
+    assert stats["expirations"] == 1
+    assert stats["hits"] == 1
+
+
+def test_failed_load_is_not_cached():
+    cache = TTLCache()
+
+    def boom():
+        raise ValueError("shop down")
+
+    with pytest.raises(ValueError):
+        cache.get_or_load("k", boom)
+    assert cache.get_or_load("k", lambda: 5) == 5
+
+
+def test_async_callers_wait_on_the_event_loop_not_in_threads():
+    cache = TTLCache(maxsize=10, ttl=60)
+    executor = ThreadPoolExecutor(max_workers=2)
+    release = threading.Event()
+    calls = []
+
+    def slow_load():
+        calls.append("slow")
+        release.wait(5)
+        return {"current_price": 10.0}
+
+    async def scenario():
+        slow = [asyncio.create_task(cache.get_or_load_async("slow", slow_load, executor)) for _ in range(16)]
+        await asyncio.sleep(0.05)
+        # Sixteen callers of the slow URL hold one of the two threads; another URL still loads
+        other = await asyncio.wait_for(cache.get_or_load_async("other", lambda: {"current_price": 5.0}, executor), 1)
+        release.set()
+        return other, await asyncio.gather(*slow)
+
+    other, slow = asyncio.run(scenario())
+    executor.shutdown()
+
+    assert other == {"current_price": 5.0}
+    assert slow == [{"current_price": 10.0}] * 16 and calls == ["slow"]
+    stats = cache.get_stats()
+    assert (stats["misses"], stats["coalesced"]) == (2, 15)
@@ -0,0 +1,206 @@
+import threading
+import time
+
+import pytest
+
+import alerts
+import cron
+import parser
+import storage
+
+
+class FakeDispatcher:
+    """Stands in for AlertDispatcher; every instance records into the shared `emails` list."""
+
+    emails = []
+
+    def __init__(self, on_result=None):
+        self.on_result = on_result
+        self.pending = []
+
+    def add(self, email, *args, key=None, **kwargs):
+        self.pending.append((email, key))
+
+    def flush(self):
+        for email, key in self.pending:
+            FakeDispatcher.emails.append(email)
+            if self.on_result:
+                self.on_result(key, True)
+        return {"sent": len(self.pending)}
+
+
+@pytest.fixture(autouse=True)
+def fake_dispatcher(monkeypatch):
+    monkeypatch.setattr(FakeDispatcher, "emails", [])
+    monkeypatch.setattr(alerts, "AlertDispatcher", FakeDispatcher)
+
+
+def test_check_urls_respects_per_domain_limit():
+    lock = threading.Lock()
+    active = {}
+    peak = {}
+
+    def fake_check(url):
+        domain = url.split("/")[2]
+        with lock:
+            active[domain] = active.get(domain, 0) + 1
+            peak[domain] = max(peak.get(domain, 0), active[domain])
+        time.sleep(0.02)
+        with lock:
+            active[domain] -= 1
+        return {"current_price": 1.0}
+
+    urls = [f"https://shop{i % 3}.pl/p/{i}" for i in range(30)]
+    results = list(cron.check_urls(urls, check=fake_check, max_workers=8, per_domain=2))
+
+    assert len(results) == 30
+    assert max(peak.values()) <= 2
+    assert len(peak) == 3
+
+
+def test_run_cron_fetches_each_product_once(db, monkeypatch):
+    for item in [
+        {"id": "1", "url": "https://www.shop.pl/p?utm_source=mail", "email": "a@x.pl", "last_known_price": 100},
+        {"id": "2", "url": "https://shop.pl/p", "email": "b@x.pl", "last_known_price": 100},
+        {"id": "3", "url": "https://shop.pl/other", "email": "a@x.pl", "last_known_price": 50},
+    ]:
+        storage.add_item(item)
+    fetched = []
+    monkeypatch.setattr(parser, "parse_price", lambda url: fetched.append(url) or {"current_price": 80.0})
+
+    stats = cron.run_cron()
+
+    assert sorted(fetched) == ["https://shop.pl/other", "https://www.shop.pl/p?utm_source=mail"]
+    assert stats["fetches_saved"] == 1
+    assert sorted(FakeDispatcher.emails) == ["a@x.pl", "b@x.pl"]
+    assert {i["id"]: i["last_known_price"] for i in storage.list_items()} == {"1": 80.0, "2": 80.0, "3": 50}
+    assert storage.lowest_price("https://shop.pl/p") == 80.0
+
+
+def test_zero_budget_checks_nothing(db, monkeypatch):
+    storage.add_item({"id": "1", "url": "https://shop.pl/p", "email": "a@x.pl", "last_known_price": 100})
+    fetched = []
+    monkeypatch.setattr(parser, "parse_price", lambda url: fetched.append(url) or {"current_price": 80.0})
+
+    stats = cron.run_cron(budget=0)
+
+    assert fetched == [] and stats["fetches"] == 0
+
+
+def test_run_cron_ignores_dummy_results(db, monkeypatch):
+    storage.add_item({"id": "1", "url": "https://shop.pl/p", "email": "a@x.pl", "last_known_price": 100})
+    monkeypatch.setattr(parser, "parse_price", lambda url: {"current_price": 149.99, "is_dummy": True})
+
+    cron.run_cron()
+
+    assert FakeDispatcher.emails == []
+    assert storage.get_item("1")["last_known_price"] == 100
+    assert storage.lowest_price("https://shop.pl/p") is None
+
+
+def test_small_drops_add_up_until_they_pass_the_threshold(db, monkeypatch):
+    storage.add_item({"id": "1", "url": "https://shop.pl/p", "email": "a@x.pl", "last_known_price": 100})
+    monkeypatch.setattr(cron, "ALERT_MIN_SAVINGS", 15)
+    prices = iter([90.0, 84.0])
+    monkeypatch.setattr(parser, "parse_price", lambda url: {"current_price": next(prices)})
+
+    assert cron.run_cron()["alerts_suppressed"] == 1
+    assert FakeDispatcher.emails == []
+    assert storage.get_item("1")["last_known_price"] == 100
+
+    cron.run_cron()
+    assert FakeDispatcher.emails == ["a@x.pl"]
+    assert storage.get_item("1")["last_known_price"] == 84.0
+
+
+def test_below_lowest_30d_threshold_uses_history(db, monkeypatch):
+    storage.add_item({"id": "1", "url": "https://shop.pl/p", "email": "a@x.pl", "last_known_price": 100})
+    storage.record_prices([("https://shop.pl/p", 70.0, None)])
+    monkeypatch.setattr(cron, "ALERT_BELOW_LOWEST_30D", True)
+    monkeypatch.setattr(parser, "parse_price", lambda url: {"current_price": 80.0})
+
+    assert cron.run_cron()["alerts_suppressed"] == 1
+    assert cron.worth_alerting(100, 60, lowest_30d=70)
+
+
+def test_workers_check_each_product_once(db, monkeypatch):
+    for i in range(40):
+        storage.add_item({"id": str(i), "url": f"https://shop{i % 4}.pl/p/{i}", "email": "a@x.pl",
+                          "last_known_price": 100})
+    lock = threading.Lock()
+    fetched = []
+
+    def fake_check(url):
+        time.sleep(0.005)
+        with lock:
+            fetched.append(url)
+        return {"current_price": 80.0}
+
+    monkeypatch.setattr(parser, "parse_price", fake_check)
+
+    results = []
+    workers = [
+        threading.Thread(target=lambda n=n: results.append(
+            cron.run_worker(worker_id=f"w{n}", batch=5, exit_when_idle=True)))
+        for n in range(3)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(fetched) == sorted(item["url"] for item in storage.list_items())
+    assert sum(stats["fetches"] for stats in results) == 40
+    assert all(item["last_known_price"] == 80.0 for item in storage.list_items())
+    assert sorted(FakeDispatcher.emails) == ["a@x.pl"] * 40
+    assert all(row["checks"] == 1 and row["lease_owner"] is None for row in storage.load_schedule().values())
+
+
+def test_worker_archives_old_history(db, monkeypatch, tmp_path):
+    monkeypatch.setenv("OMNIBUS_ARCHIVE", str(tmp_path / "archive"))
+    now = time.time()
+    with storage.transaction() as conn:
+        conn.executemany("INSERT INTO price_history (norm_url, observed_at, price) VALUES (?, ?, ?)",
+                         [("https://shop.pl/p", now - (day + 0.5) * 86400, 100.0) for day in range(60)])
+
+    stats = cron.run_worker(worker_id="w1", exit_when_idle=True)
+
+    assert stats["archived"] == 15
+    assert len(storage.history_rows("https://shop.pl/p")) == 45
+
+
+def test_interrupted_run_resumes_without_resending(db, monkeypatch):
+    for i in range(6):
+        storage.add_item({"id": str(i), "url": f"https://shop.pl/p/{i}", "email": f"{i}@x.pl", "last_known_price": 100})
+    monkeypatch.setattr(cron, "JOURNAL_BATCH", 2)
+    monkeypatch.setattr(cron, "check_urls", lambda urls: ((url, {"current_price": 80.0}) for url in urls))
+
+    # The first run dies after committing two batches, before sending anything
+    commits = []
+    real_commit = storage.commit_results
+
+    def crash_after_two(*args):
+        if len(commits) == 2:
+            raise SystemExit("killed")
+        commits.append(args)
+        real_commit(*args)
+
+    monkeypatch.setattr(storage, "commit_results", crash_after_two)
+    with pytest.raises(SystemExit):
+        cron.run_cron()
+    monkeypatch.setattr(storage, "commit_results", real_commit)
+    assert FakeDispatcher.emails == []
+    # The killed run stops heart-beating (its process is gone)
+    monkeypatch.setattr(cron, "RUN_STALE_AFTER", 0)
+
+    fetched = []
+    monkeypatch.setattr(cron, "check_urls", lambda urls: ((url, fetched.append(url) or {"current_price": 80.0}) for url in urls))
+    stats = cron.run_cron()
+
+    assert stats["resumed"] == 4 and len(fetched) == 2
+    assert sorted(FakeDispatcher.emails) == [f"{i}@x.pl" for i in range(6)]
+    assert all(item["last_known_price"] == 80.0 for item in storage.list_items())
+
+    # Nothing is pending any more, so another run sends nothing
+    cron.run_cron()
+    assert len(FakeDispatcher.emails) == 6
@@ -0,0 +1,98 @@
+import pytest
+
+from bench_extractors import load_fixtures
+from extractors import Document, extractor_for, scan_meta
+from parser import extract
+
+FIXTURES = load_fixtures()
+
+
+@pytest.mark.parametrize("fixture", FIXTURES, ids=[f["name"] for f in FIXTURES])
+def test_fixture_extraction(fixture):
+    assert extract(fixture["url"], fixture["html"]) == fixture["expected"]
+
+
+def test_registry_dispatch_by_domain():
+    assert extractor_for("https://www.tophifi.pl/a.html").name == "tophifi"
+    assert extractor_for("https://sklep.inkhouse.pl/a.html").name == "inkhouse"
+    assert extractor_for("https://notophifi.pl/a.html").name == "generic"
+
+
+def test_meta_price_skips_full_tree():
+    fixture = next(f for f in FIXTURES if f["name"] == "tophifi.pl/bowers-wilkins-606-s3")
+    doc = Document(fixture["html"])
+    extractor_for(fixture["url"]).extract(doc, fixture["url"])
+    assert not doc.has_tree
+
+
+def test_scan_meta_handles_attribute_order_and_quotes():
+    meta = scan_meta("""<meta content='12,50' property="product:price:amount"><META NAME=description CONTENT="a &amp; b">""")
+    assert meta == {"product:price:amount": "12,50", "description": "a & b"}
+
+
+JSONLD_PAGE = """<html><head><title>Sklep</title>
+<meta property="product:price:amount" content="999.00"></head><body>
+<script type="application/ld+json">{"@context": "https://schema.org", "@graph": [
+  {"@type": "BreadcrumbList"},
+  {"@type": ["Product"], "name": "Telewizor &amp; pilot", "image": ["https://shop.pl/tv.jpg"],
+   "offers": [{"@type": "AggregateOffer", "lowPrice": "1 299,00", "priceCurrency": "PLN"}]}
+]}</script>
+<span itemprop="price" content="1100.00">1 100 zł</span>
+</body></html>"""
+
+
+def test_strategies_run_in_the_given_order():
+    extractor = extractor_for("https://www.euro.com.pl/tv.bhtml")
+    fields, attempts = extractor.extract_with_attempts(Document(JSONLD_PAGE), "https://www.euro.com.pl/tv.bhtml")
+    assert [(name, found) for name, found, _ in attempts] == [("jsonld", True)]
+    assert (fields["current_price"], fields["title"], fields["image_url"]) == (1299.0, "Sklep", "https://shop.pl/tv.jpg")
+
+    doc = Document(JSONLD_PAGE)
+    fields, attempts = extractor.extract_with_attempts(doc, "https://www.euro.com.pl/tv.bhtml", ("meta", "jsonld"))
+    assert (attempts[-1][0], fields["current_price"]) == ("meta", 999.0)
+    assert not doc.has_tree
+
+    # Shops with their own extractor trust their price tag over an AggregateOffer "from" price
+    tophifi = extractor_for("https://www.tophifi.pl/tv.html")
+    fields, attempts = tophifi.extract_with_attempts(Document(JSONLD_PAGE), "https://www.tophifi.pl/tv.html", tophifi.strategies)
+    assert (attempts[-1][0], fields["current_price"]) == ("meta", 999.0)
+
+    page = JSONLD_PAGE.replace("ld+json", "json").replace('<meta property="product:price:amount" content="999.00">', "")
+    fields, attempts = extractor.extract_with_attempts(Document(page), "https://www.euro.com.pl/tv.bhtml")
+    assert [(name, found) for name, found, _ in attempts] == [("jsonld", False), ("meta", False), ("selectors", True)]
+    assert fields["current_price"] == 1100.0
+
+
+def test_generic_extractor_does_not_guess_from_other_products():
+    fixture = next(f for f in FIXTURES if f["name"].startswith("euro.com.pl/"))
+    fields, attempts = extractor_for(fixture["url"]).extract_with_attempts(Document(fixture["html"]), fixture["url"])
+    assert fields["current_price"] is None and not any(found for _, found, _ in attempts)
+
+
+def test_stream_check_reads_as_far_as_the_winning_strategy_needs():
+    extractor = extractor_for("https://www.euro.com.pl/tv.bhtml")
+    head, body = JSONLD_PAGE.replace('<meta property="product:price:amount" content="999.00">', "").split("<body>")
+    before_jsonld, after_jsonld = body.split("<span")
+
+    # JSON-LD wins: up to the first priced Product block, fed chunk by chunk
+    has_enough = extractor.stream_check("jsonld")
+    assert not has_enough(head + "<body>")
+    assert not has_enough(head + "<body>" + before_jsonld[:60])
+    assert has_enough(head + "<body>" + before_jsonld)
+
+    # Meta wins, or nothing does: the head is enough if it has a price tag
+    priced_head = JSONLD_PAGE.split("<body>")[0]
+    assert extractor.stream_check("meta")(priced_head + "<body>")
+    assert extractor.stream_check(None)(priced_head + "<body>")
+    # Without one the body is read, up to a priced JSON-LD block (or a block notice, to the end)
+    for winner in ("meta", None):
+        has_enough = extractor.stream_check(winner)
+        assert not has_enough(head + "<body>")
+        assert has_enough(head + "<body>" + before_jsonld)
+    assert not extractor.stream_check("meta")(head + "<body><p>Twoje żądanie zostało zablokowane</p>")
+    # Selectors or patterns need the whole page
+    assert not extractor.stream_check("selectors")(head + "<body>" + body)
+
+    # A shop page without its head price tag is read in full for the shop's fallbacks
+    tophifi = extractor_for("https://www.tophifi.pl/a.html")
+    assert not tophifi.stream_check("meta")(head.replace("<title>", '<meta property="og:image" content="a.jpg"><title>'))
@@ -0,0 +1,177 @@
+import socket
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import fetcher
+
+PAGE = b"<html><head><title>Stub</title></head></html>"
+
+
+class StubShop(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = set()
+
+    def do_GET(self):
+        StubShop.connections.add(self.client_address)
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def shop(tmp_path, monkeypatch):
+    monkeypatch.setattr(fetcher, "CACHE_FILE", str(tmp_path / "http_cache.json"))
+    monkeypatch.setattr(fetcher, "_validators", None)
+    monkeypatch.setattr(fetcher, "_stats", dict.fromkeys(fetcher._stats, 0))
+    StubShop.connections = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubShop)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/product"
+    server.shutdown()
+
+
+def test_unchanged_page_reuses_parsed_result(shop):
+    response, text, cached = fetcher.fetch(shop)
+    assert response.status_code == 200 and cached is None
+    assert text == PAGE.decode()
+    fetcher.remember(shop, response, {"current_price": 99.0})
+
+    response, _, cached = fetcher.fetch(shop)
+    assert response.status_code == 304
+    assert cached == {"current_price": 99.0}
+
+    fetcher.fetch(shop)
+    stats = fetcher.get_stats()
+    assert (stats["misses"], stats["hits"], stats["not_modified"]) == (1, 2, 2)
+    # All three requests went over one kept-alive connection
+    assert len(StubShop.connections) == 1
+
+
+def test_validators_survive_restart(shop):
+    response, _, _ = fetcher.fetch(shop)
+    fetcher.remember(shop, response, {"current_price": 99.0})
+    fetcher.flush()
+
+    fetcher._validators = None
+    _, _, cached = fetcher.fetch(shop)
+    assert cached == {"current_price": 99.0}
+
+
+def test_streamed_download_stops_once_extractor_has_enough(tmp_path, monkeypatch):
+    from bench_extractors import load_fixtures
+    from extractors import extractor_for
+    from parser import extract
+
+    fixture = next(f for f in load_fixtures() if f["name"] == "tophifi.pl/bowers-wilkins-606-s3")
+    body = fixture["html"].encode()
+
+    class FixtureShop(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except ConnectionError:
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    monkeypatch.setattr(fetcher, "_stream_stats", {})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureShop)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/product"
+        _, text, _ = fetcher.fetch(url, until=extractor_for(fixture["url"]).stream_check())
+    finally:
+        server.shutdown()
+
+    assert len(text) < len(fixture["html"]) * 0.6
+    assert extract(fixture["url"], text) == fixture["expected"]
+    stats = fetcher.get_stats()["streaming"][f"127.0.0.1:{server.server_port}"]
+    assert stats["truncated"] == 1
+    assert stats["bytes_saved"] > len(body) * 0.4
+    assert stats["connections_closed"] == 1
+
+
+def test_stage_timings_per_domain(shop):
+    import metrics
+
+    before = metrics.STAGE_SECONDS.snapshot()
+    fetcher.fetch(shop)
+    fetcher.fetch(shop + "?again")
+
+    domain = shop.split("/")[2]
+    counts = {stage: timing["count"] for (d, stage), timing in metrics.STAGE_SECONDS.summary(since=before).items()
+              if d == domain}
+    # One new connection (resolved and connected once), two requests over it
+    assert counts == {"dns": 1, "connect": 1, "wait": 2, "download": 2}
+
+
+def test_unreachable_first_address_falls_back_to_the_next(shop, monkeypatch):
+    resolve = socket.getaddrinfo
+
+    def dead_address_first(host, port, *args, **kwargs):
+        addresses = resolve(host, port, *args, **kwargs)
+        if host == "127.0.0.1":
+            # Nothing listens on 127.0.0.2, like an IPv6 address without a route
+            family, type_, proto, _, _ = addresses[0]
+            addresses = [(family, type_, proto, "", ("127.0.0.2", port))] + addresses
+        return addresses
+
+    monkeypatch.setattr(socket, "getaddrinfo", dead_address_first)
+    response, text, _ = fetcher.fetch(shop)
+    assert response.status_code == 200 and text == PAGE.decode()
+
+
+@pytest.mark.parametrize("drain_bytes, connections, drained, closed", [(65536, 1, 2, 0), (0, 2, 0, 2)])
+def test_small_rest_of_page_is_drained_to_keep_the_connection(monkeypatch, drain_bytes, connections, drained, closed):
+    body = b"<html><head><title>Stub</title></head><body>" + b"x" * 40_000 + b"</body></html>"
+    seen = set()
+
+    class LongPage(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            seen.add(self.client_address)
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except ConnectionError:
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    monkeypatch.setattr(fetcher, "_stream_stats", {})
+    monkeypatch.setattr(fetcher, "DRAIN_BYTES", drain_bytes)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LongPage)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/product"
+        for _ in range(2):
+            _, text, _ = fetcher.fetch(url, until=lambda text: "</head>" in text)
+            assert len(text) < len(body)
+    finally:
+        server.shutdown()
+
+    stats = fetcher.get_stats()["streaming"][f"127.0.0.1:{server.server_port}"]
+    assert len(seen) == connections
+    assert (stats["drained"], stats["connections_closed"]) == (drained, closed)
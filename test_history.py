@@ -0,0 +1,42 @@
+import history
+import storage
+from history import PriceWindow
+
+DAY = 86400
+
+
+def test_window_minimum_slides():
+    window = PriceWindow(window_days=30)
+    window.push(0, 100.0)
+    window.push(10 * DAY, 80.0)
+    window.push(20 * DAY, 120.0)
+
+    assert window.minimum(now=25 * DAY) == 80.0
+    # The 80.0 observation leaves the window, 120.0 is what remains
+    assert window.minimum(now=41 * DAY) == 120.0
+    assert window.minimum(now=51 * DAY) is None
+
+
+def test_compare_with_shop_flags_disagreement(db, monkeypatch):
+    monkeypatch.setattr(history, "_windows", {})
+    conn = storage.get_connection()
+    now = 100 * DAY
+    for day, price in [(60, 120.0), (80, 99.0), (95, 110.0)]:
+        conn.execute(
+            "INSERT INTO price_history (norm_url, observed_at, price) VALUES (?, ?, ?)",
+            ("https://shop.pl/p", day * DAY, price),
+        )
+
+    assert history.lowest_30d("https://www.shop.pl/p", now=now) == 99.0
+    assert history.compare_with_shop("https://shop.pl/p", 99.0, now=now) == (99.0, False)
+    # Shop claims a higher 30-day low than a price we saw ourselves
+    assert history.compare_with_shop("https://shop.pl/p", 105.0, now=now) == (99.0, True)
+    # Shop claims a lower one; we have watched for 40 days, so this is flagged too
+    assert history.compare_with_shop("https://shop.pl/p", 90.0, now=now) == (99.0, True)
+
+    # New rows written by another process are picked up incrementally
+    conn.execute(
+        "INSERT INTO price_history (norm_url, observed_at, price) VALUES (?, ?, ?)",
+        ("https://shop.pl/p", 99 * DAY, 85.0),
+    )
+    assert history.lowest_30d("https://shop.pl/p", now=now) == 85.0
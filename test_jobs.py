@@ -0,0 +1,33 @@
+import threading
+import time
+
+import jobs
+
+
+def wait_for(job_id):
+    while jobs.get(job_id)["status"] == "running":
+        time.sleep(0.01)
+    return jobs.get(job_id)
+
+
+def test_job_runs_in_background_and_reports_result():
+    release = threading.Event()
+    job_id = jobs.start("test-batch", lambda: release.wait(5) and {"items": 3})
+
+    assert jobs.get(job_id)["status"] == "running"
+    # A second start while running joins the running job
+    assert jobs.start("test-batch", lambda: None) == job_id
+
+    release.set()
+    job = wait_for(job_id)
+    assert job["status"] == "done"
+    assert job["result"] == {"items": 3}
+
+
+def test_failed_job_reports_error():
+    def boom():
+        raise RuntimeError("smtp down")
+
+    job = wait_for(jobs.start("test-failing", boom))
+    assert job["status"] == "failed"
+    assert job["error"] == "smtp down"
@@ -0,0 +1,31 @@
+import metrics
+
+
+def test_render_prometheus_text():
+    outcomes = metrics.Counter("test_outcomes_total", "Outcomes.", ("domain", "outcome"))
+    latency = metrics.Histogram("test_latency_seconds", "Latency.", ("domain",), buckets=(0.1, 1))
+    outcomes.inc("shop.pl", "ok")
+    outcomes.inc("shop.pl", "ok", amount=2)
+    latency.observe(0.05, "shop.pl")
+    latency.observe(0.5, "shop.pl")
+    metrics.register_collector(lambda: [("test_cache_ratio", "gauge", "Ratio.", [({}, 0.5)])])
+
+    text = metrics.render()
+
+    assert "# TYPE test_outcomes_total counter" in text
+    assert 'test_outcomes_total{domain="shop.pl",outcome="ok"} 3' in text
+    assert 'test_latency_seconds_bucket{domain="shop.pl",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{domain="shop.pl",le="1.0"} 2' in text
+    assert 'test_latency_seconds_bucket{domain="shop.pl",le="+Inf"} 2' in text
+    assert 'test_latency_seconds_count{domain="shop.pl"} 2' in text
+    assert "test_cache_ratio 0.5" in text
+
+
+def test_summary_since_snapshot():
+    stages = metrics.Histogram("test_stage_seconds", "Stages.", ("stage",))
+    stages.observe(1.0, "download")
+    before = stages.snapshot()
+    stages.observe(0.25, "download")
+    stages.observe(0.75, "download")
+
+    assert stages.summary(since=before) == {("download",): {"count": 2, "seconds": 1.0, "avg": 0.5}}
@@ -0,0 +1,65 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import storage
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ("requests", "bs4", "smtplib", "fastapi")
+
+
+def run_cli(db, *code):
+    env = dict(os.environ, OMNIBUS_DB=str(db / "omnibus.db"))
+    result = subprocess.run([sys.executable, "-c", "\n".join(code)], cwd=HERE, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def test_check_with_nothing_due_skips_heavy_imports(db):
+    storage.add_item({"id": "1", "url": "https://shop.pl/a", "email": "a@x.pl", "last_known_price": 100})
+    storage.sync_schedule(storage.list_products(), 3600)
+    with storage.transaction() as conn:
+        conn.execute("UPDATE schedule SET next_check_at = ?", (time.time() + 3600,))
+    storage.close()
+
+    output = run_cli(
+        db,
+        "import sys, omnibus",
+        "omnibus.main(['check', '--due'])",
+        f"print('LOADED', [m for m in {HEAVY_MODULES!r} if m in sys.modules])",
+    )
+    assert "LOADED []" in output
+    assert '"not_due": 1' in output
+
+
+def test_stats_reports_counts_without_cron(db):
+    storage.add_item({"id": "1", "url": "https://shop.pl/a", "email": "a@x.pl", "last_known_price": 100})
+    storage.add_item({"id": "2", "url": "https://shop.pl/a?utm_source=x", "email": "b@x.pl", "last_known_price": 100})
+    storage.close()
+
+    output = run_cli(
+        db,
+        "import sys, omnibus",
+        "omnibus.main(['stats'])",
+        "assert 'cron' not in sys.modules and 'requests' not in sys.modules",
+    )
+    stats = json.loads(output)
+    assert stats["items"] == 2
+    assert stats["products"] == 1
+    assert stats["last_run"] is None
+
+
+def test_cron_script_runs_check_without_importing_itself_again(db):
+    storage.close()
+    output = run_cli(
+        db,
+        "import runpy, sys",
+        "sys.argv = ['cron.py', '--due']",
+        "runpy.run_path('cron.py', run_name='__main__')",
+        "print('IMPORTED', 'cron' in sys.modules)",
+    )
+    assert "IMPORTED False" in output
+    assert "No items to check." in output
@@ -0,0 +1,38 @@
+import pytest
+
+import throttle
+from bench_extractors import load_fixtures
+from bench_replay import check_result, compare, replay
+from parser import parse_price
+
+FIXTURES = load_fixtures()
+
+
+@pytest.fixture(autouse=True)
+def unthrottled(db, monkeypatch):
+    monkeypatch.setattr(throttle, "SHOP_RATE", 1e9)
+    monkeypatch.setattr(throttle, "SHOP_BURST", 1e9)
+    monkeypatch.setattr(throttle, "_buckets", {})
+    monkeypatch.setattr(throttle, "_breakers", {})
+
+
+@pytest.mark.parametrize("fixture", FIXTURES, ids=[f["name"] for f in FIXTURES])
+def test_replayed_page_parses_offline(fixture):
+    with replay(FIXTURES) as adapter:
+        result = parse_price(fixture["url"])
+    assert adapter.requests == 1
+    assert check_result(fixture["expected"], result) == []
+
+
+def test_unknown_page_is_404():
+    with replay(FIXTURES):
+        result = parse_price("https://www.tophifi.pl/missing.html")
+    assert result["is_simulated"] and "404" in result["error"]
+
+
+def test_compare_flags_slowdowns_only_beyond_tolerance():
+    baseline = {"tophifi": {"p50_ms": 2.0, "p99_ms": 5.0, "peak_kb": 100.0}}
+    assert compare({"tophifi": {"p50_ms": 2.9, "p99_ms": 50.0, "peak_kb": 120.0}}, baseline, 0.5) == []
+    assert compare({"tophifi": {"p50_ms": 3.1, "p99_ms": 5.0, "peak_kb": 100.0}}, baseline, 0.5) == [
+        "tophifi: p50_ms 2.0 -> 3.1"
+    ]
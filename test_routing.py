@@ -0,0 +1,38 @@
+from urllib.parse import quote_plus
+
+import pytest
+
+import storage
+from routing import AffiliateRouter, compile_template
+
+
+def test_compiled_template_matches_replace():
+    template = "https://aff.example/?u={url}&id=7&back={url}"
+    url = "https://shop.pl/p?a=1&b=ż"
+    assert compile_template(template)(url) == template.replace("{url}", quote_plus(url))
+
+
+def test_routes_from_memory_and_follows_changes(db, monkeypatch):
+    item = storage.add_item({"url": "https://www.shop.pl/p", "last_known_price": 10})
+    other = storage.add_item({"url": "https://other.pl/q", "last_known_price": 10})
+    storage.save_affiliate("shop.pl", {"network": "n", "template": "https://aff/?u={url}", "active": True})
+    router = AffiliateRouter()
+    assert router.resolve(item["id"]) == "https://aff/?u=https%3A%2F%2Fwww.shop.pl%2Fp"
+
+    # Once built, redirects do not touch the database
+    real_connection = storage.get_connection
+    monkeypatch.setattr(storage, "get_connection", lambda: pytest.fail("database access on the hot path"))
+    for _ in range(3):
+        assert router.resolve(other["id"]) == "https://other.pl/q"
+    router.remove_item(other["id"])
+    monkeypatch.setattr(storage, "get_connection", real_connection)
+
+    storage.save_affiliate("shop.pl", {"network": "n", "template": "https://aff/?u={url}", "active": False})
+    router.invalidate()
+    assert router.resolve(item["id"]) == "https://www.shop.pl/p"
+
+    # Items added elsewhere are found in the database once, missing ones are None
+    added = storage.add_item({"url": "https://shop.pl/new", "last_known_price": 10})
+    assert router.resolve(added["id"]) == "https://shop.pl/new"
+    assert router.resolve("nope") is None
+    assert router.get_stats()["rebuilds"] == 2
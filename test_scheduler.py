@@ -0,0 +1,46 @@
+import cron
+import parser
+import scheduler
+import storage
+from scheduler import Scheduler
+
+
+def test_interval_adapts_within_bounds():
+    assert scheduler.next_interval(3600, changed=True) == 1800
+    assert scheduler.next_interval(3600, changed=False) == 5400
+    assert scheduler.next_interval(scheduler.MIN_INTERVAL, changed=True) == scheduler.MIN_INTERVAL
+    assert scheduler.next_interval(scheduler.MAX_INTERVAL, changed=False) == scheduler.MAX_INTERVAL
+
+
+def test_pop_due_is_most_overdue_first_within_budget():
+    queue = Scheduler([("a", 30, 3600), ("b", 10, 3600), ("c", 20, 3600), ("d", 500, 3600)])
+
+    assert queue.pop_due(now=100, budget=2) == ["b", "c"]
+    # Rescheduled entries replace the old heap position
+    queue.reschedule("b", now=100, changed=True)
+    assert queue.pop_due(now=100) == ["a"]
+    assert queue.next_due() == 500
+
+
+def test_due_run_only_checks_due_products(db, monkeypatch):
+    storage.add_item({"id": "1", "url": "https://shop.pl/a", "email": "a@x.pl", "last_known_price": 100})
+    storage.add_item({"id": "2", "url": "https://shop.pl/b", "email": "a@x.pl", "last_known_price": 100})
+    fetched = []
+    monkeypatch.setattr(parser, "parse_price", lambda url: fetched.append(url) or {"current_price": 100.0})
+
+    # New products are due right away
+    stats = cron.run_cron(due=True)
+    assert sorted(fetched) == ["https://shop.pl/a", "https://shop.pl/b"]
+
+    # After a check neither is due until its interval passes
+    fetched.clear()
+    stats = cron.run_cron(due=True)
+    assert fetched == []
+    assert stats["not_due"] == 2
+
+    storage.get_connection().execute("UPDATE schedule SET next_check_at = 0 WHERE norm_url = 'https://shop.pl/b'")
+    cron.run_cron(due=True)
+    assert fetched == ["https://shop.pl/b"]
+    row = storage.load_schedule()["https://shop.pl/b"]
+    assert (row["checks"], row["changes"]) == (2, 0)
+    assert row["interval"] == scheduler.DEFAULT_INTERVAL * scheduler.SLOWDOWN ** 2
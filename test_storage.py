@@ -0,0 +1,132 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+
+import storage
+
+
+def test_migrates_legacy_json_once(db):
+    (db / "tracked.json").write_text(json.dumps([
+        {"id": "a", "url": "https://www.shop.pl/p", "email": "a@x.pl", "last_known_price": 10, "note": "kept"},
+    ]))
+    (db / "affiliates.json").write_text(json.dumps({
+        "shop.pl": {"network": "awin", "template": "https://aff/?u={url}", "active": True},
+    }))
+
+    item = storage.get_item("a")
+    assert item["url"] == "https://www.shop.pl/p"
+    assert item["note"] == "kept"
+    assert storage.get_affiliate("shop.pl")["template"] == "https://aff/?u={url}"
+
+    # A second process start must not import the items again
+    storage.close()
+    storage._initialized.clear()
+    storage.delete_item("a")
+    assert storage.list_items() == []
+
+
+def test_lowest_price_uses_window(db):
+    storage.add_item({"id": "a", "url": "https://shop.pl/p", "last_known_price": 10})
+    storage.record_prices([("https://www.shop.pl/p", 90.0, None)])
+    storage.get_connection().execute(
+        "INSERT INTO price_history (norm_url, observed_at, price) VALUES (?, ?, ?)",
+        ("https://shop.pl/p", 0, 50.0),
+    )
+    storage.record_prices([("https://shop.pl/p?utm_medium=x", 80.0, 85.0)])
+
+    assert storage.lowest_price("https://shop.pl/p") == 80.0
+    assert storage.lowest_price("https://shop.pl/p", days=100000) == 50.0
+
+
+def test_claims_are_leased_and_reclaimed_after_expiry(db):
+    for i in range(3):
+        storage.add_item({"id": str(i), "url": f"https://shop.pl/p/{i}", "last_known_price": 10})
+    storage.sync_schedule(storage.list_products(), 3600)
+
+    first = storage.claim_due("w1", limit=2, lease_seconds=60, now=1000)
+    second = storage.claim_due("w2", limit=5, lease_seconds=60, now=1000)
+    assert len(first) == 2 and len(second) == 1
+    assert storage.claim_due("w3", limit=5, lease_seconds=60, now=1030) == []
+    storage.complete_claims("w2", [dict(row, next_check_at=5000) for row in second], [], [])
+
+    # w1 dies; after its lease runs out w3 takes over, and w1's late results are dropped
+    taken = storage.claim_due("w3", limit=5, lease_seconds=60, now=1061)
+    assert {row["norm_url"] for row in taken} == {row["norm_url"] for row in first}
+    late = [dict(row, checks=1, next_check_at=5000) for row in first]
+    assert storage.complete_claims("w1", late, [], [(row["norm_url"], 1.0, None) for row in first]) == set()
+    assert storage.lowest_price(first[0]["norm_url"]) is None
+
+    done = [dict(row, checks=1, next_check_at=5000) for row in taken]
+    assert storage.complete_claims("w3", done, [], [(row["norm_url"], 9.0, None) for row in taken]) == {
+        row["norm_url"] for row in taken
+    }
+    assert storage.lowest_price(taken[0]["norm_url"]) == 9.0
+    assert storage.load_schedule()[taken[0]["norm_url"]]["lease_owner"] is None
+
+
+def test_adds_lease_columns_to_old_schedule_table(db):
+    conn = sqlite3.connect(str(db / "omnibus.db"))
+    conn.execute("CREATE TABLE schedule (norm_url TEXT PRIMARY KEY, next_check_at REAL NOT NULL, "
+                 "interval REAL NOT NULL, last_price REAL, checks INTEGER NOT NULL DEFAULT 0, "
+                 "changes INTEGER NOT NULL DEFAULT 0)")
+    conn.close()
+
+    storage.sync_schedule(["https://shop.pl/p"], 3600)
+    assert storage.claim_due("w1", limit=1, lease_seconds=60)[0]["lease_owner"] == "w1"
+
+
+def test_alerts_are_held_per_subscriber_for_the_digest_window(db):
+    def alert(key, email):
+        return {"key": key, "email": email, "url": f"https://shop.pl/{key}", "old_price": 100.0,
+                "new_price": 80.0, "title": None, "image_url": None}
+
+    with storage.transaction() as conn:
+        storage._queue_alerts(conn, [alert("1", "a@x.pl")])
+        conn.execute("UPDATE alert_outbox SET created_at = created_at - 600")
+        storage._queue_alerts(conn, [alert("2", "b@x.pl"), alert("3", "a@x.pl")])
+
+    # a@ has waited long enough, so all of a@'s alerts go out together; b@ waits
+    claimed = storage.claim_alerts(max_attempts=5, lease_seconds=60, hold=300)
+    assert [row["key"] for row in claimed] == ["1", "3"]
+    assert [row["key"] for row in storage.claim_alerts(max_attempts=5, lease_seconds=60, hold=0)] == ["2"]
+
+
+def test_compact_keeps_alerts_that_were_never_sent(db):
+    alerts = [{"key": key, "email": "a@x.pl", "url": f"https://shop.pl/{key}", "old_price": 100.0,
+               "new_price": 80.0, "title": None, "image_url": None} for key in ("sent", "given_up", "pending")]
+    with storage.transaction() as conn:
+        storage._queue_alerts(conn, alerts)
+        conn.execute("UPDATE alert_outbox SET created_at = created_at - 8 * 86400")
+        conn.execute("UPDATE alert_outbox SET sent_at = created_at, attempts = 1 WHERE key = 'sent'")
+        conn.execute("UPDATE alert_outbox SET attempts = 5 WHERE key = 'given_up'")
+
+    # An SMTP outage longer than the retention must not lose queued alerts
+    storage.compact(keep_days=7, max_attempts=5)
+    assert [row["key"] for row in storage.claim_alerts(max_attempts=5, lease_seconds=60)] == ["pending"]
+    assert storage.get_connection().execute("SELECT COUNT(*) FROM alert_outbox").fetchone()[0] == 1
+
+
+def test_concurrent_runs_are_not_shared_and_stopped_ones_resume(db):
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    barrier = threading.Barrier(2)
+    runs = []
+
+    def start():
+        barrier.wait()
+        runs.append(storage.start_run("full", resume_window=3600, owner=owner, stale_after=600))
+
+    threads = [threading.Thread(target=start) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert runs[0][0] != runs[1][0]
+
+    # Once a run stops heart-beating, the next start picks it up with its journal
+    storage.commit_results(runs[0][0], [{"norm_url": "https://shop.pl/p", "next_check_at": 0, "interval": 3600,
+                                         "last_price": 10.0, "checks": 1, "changes": 0}], [], [], [])
+    with storage.transaction() as conn:
+        conn.execute("UPDATE runs SET heartbeat_at = heartbeat_at - 601 WHERE id = ?", (runs[0][0],))
+    assert storage.start_run("full", resume_window=3600, owner="other:1", stale_after=600) == (runs[0][0], {"https://shop.pl/p"})
@@ -0,0 +1,64 @@
+import pytest
+
+import storage
+import strategies
+
+
+@pytest.fixture(autouse=True)
+def fresh(db, monkeypatch):
+    monkeypatch.setattr(strategies, "_learned", None)
+    monkeypatch.setattr(strategies, "_dirty", set())
+    monkeypatch.setattr(strategies, "_stats", {"first_try": 0, "fallbacks": 0, "misses": 0})
+
+
+def test_order_follows_expected_cost(monkeypatch):
+    assert strategies.order_for("shop.pl") == ("jsonld", "meta", "selectors", "regex")
+
+    # Pages without structured data: the text pattern works, the full tree never does
+    for _ in range(3):
+        strategies.record("shop.pl", [("jsonld", False, 0.0001), ("meta", False, 0.0001),
+                                      ("selectors", False, 0.04), ("regex", True, 0.005)])
+    assert strategies.order_for("shop.pl")[2:] == ("regex", "selectors")
+
+    # A shop extractor's own order comes first; a cheap strategy that missed once
+    # is still worth trying before an expensive one
+    assert strategies.order_for("tophifi.pl") == ("meta", "jsonld", "selectors", "regex")
+    strategies.record("tophifi.pl", [("meta", False, 0.0001), ("jsonld", False, 0.0001), ("selectors", True, 0.05)])
+    assert strategies.order_for("tophifi.pl")[:2] == ("meta", "jsonld")
+    strategies.record("tophifi.pl", [("meta", True, 0.0001)])
+    assert strategies.get_stats()["fallbacks"] == 4
+
+    # A new process picks up what was learned
+    strategies.flush()
+    monkeypatch.setattr(strategies, "_learned", None)
+    assert strategies.order_for("shop.pl")[2:] == ("regex", "selectors")
+    assert storage.load_strategy_stats()["tophifi.pl"]["meta"] == (2, 1, 0.0002)
+
+
+def test_counts_are_halved_so_old_results_fade(monkeypatch):
+    monkeypatch.setattr(strategies, "MAX_ATTEMPTS", 4)
+    for _ in range(5):
+        strategies.record("shop.pl", [("jsonld", True, 0.001)])
+    assert strategies._learned["shop.pl"]["jsonld"][:2] == (2, 2)
+
+
+def test_winner_is_explored_then_learned():
+    assert strategies.winner("shop.pl") == "jsonld"
+    strategies.record("shop.pl", [("jsonld", False, 0.0001), ("meta", True, 0.0001)])
+    assert strategies.winner("shop.pl") == "meta"
+
+    # Nothing ever finds the price: stop reading past the head after a few pages
+    misses = [("jsonld", False, 0.0001), ("meta", False, 0.0001), ("selectors", False, 0.01), ("regex", False, 0.0)]
+    for _ in range(strategies.EXPLORE_PAGES - 1):
+        strategies.record("euro.com.pl", misses)
+    assert strategies.winner("euro.com.pl") == "jsonld"
+    strategies.record("euro.com.pl", misses)
+    assert strategies.winner("euro.com.pl") is None
+
+    # Explored again from time to time, so a shop that starts serving JSON-LD is picked up
+    winners = []
+    while len(winners) < strategies.REEXPLORE_EVERY and "jsonld" not in winners:
+        winners.append(strategies.winner("euro.com.pl"))
+        strategies.record("euro.com.pl", misses if winners[-1] is None else [("jsonld", True, 0.0001)])
+    assert winners[-1] == "jsonld" and set(winners[:-1]) == {None}
+    assert strategies.winner("euro.com.pl") == "jsonld"
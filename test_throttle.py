@@ -0,0 +1,149 @@
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+import fetcher
+import strategies
+import throttle
+from parser import parse_price
+from throttle import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def fresh_state(db, monkeypatch):
+    monkeypatch.setattr(throttle, "_breakers", {})
+    monkeypatch.setattr(throttle, "_buckets", {})
+    monkeypatch.setattr(throttle, "SHOP_RATE", 1000)
+    return db
+
+
+def test_token_bucket_paces_after_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=lambda s: None)
+
+    waits = [bucket.acquire() for _ in range(5)]
+
+    assert waits[:3] == [0, 0, 0]
+    assert waits[3:] == [0.5, 1.0]
+
+
+def test_breaker_opens_persists_and_probes(fresh_state, monkeypatch):
+    for _ in range(throttle.BREAKER_THRESHOLD):
+        assert throttle.before_request("shop.pl")
+        throttle.record("shop.pl", ok=False)
+
+    assert not throttle.before_request("shop.pl")
+    assert throttle.retry_after("shop.pl") > 0
+
+    # A new process (next cron run) sees the open circuit too
+    monkeypatch.setattr(throttle, "_breakers", {})
+    assert not throttle.before_request("shop.pl")
+
+    # After the cooldown a single probe goes through
+    breaker = throttle._breaker("shop.pl")
+    breaker.opened_until = 0
+    assert throttle.before_request("shop.pl")
+    assert not throttle.before_request("shop.pl")
+
+    # A failed probe re-opens with a doubled cooldown; success closes
+    throttle.record("shop.pl", ok=False)
+    assert breaker.cooldown == 2 * throttle.BREAKER_COOLDOWN
+    breaker.opened_until = 0
+    assert throttle.before_request("shop.pl")
+    throttle.record("shop.pl", ok=True)
+    assert throttle.before_request("shop.pl") and throttle.before_request("shop.pl")
+
+
+def test_blocked_shop_is_not_hammered(fresh_state):
+    hits = []
+
+    class BlockingShop(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            self.send_response(403)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BlockingShop)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        results = [parse_price(f"http://127.0.0.1:{server.server_port}/p/{i}") for i in range(10)]
+    finally:
+        server.shutdown()
+
+    assert len(hits) == throttle.BREAKER_THRESHOLD
+    assert all(r["is_simulated"] for r in results)
+    assert results[-1]["blocked"]
+
+
+def test_probe_failing_with_unexpected_error_is_released(fresh_state, monkeypatch):
+    def redirect_loop(url, until=None):
+        raise requests.exceptions.TooManyRedirects("Exceeded 30 redirects.")
+
+    monkeypatch.setattr(fetcher, "fetch", redirect_loop)
+    for _ in range(throttle.BREAKER_THRESHOLD):
+        throttle.record("shop.pl", ok=False)
+    throttle._breaker("shop.pl").opened_until = 0
+
+    # Neither a block nor a timeout: no verdict, but the next check probes again instead of skipping forever
+    assert "error" in parse_price("https://shop.pl/p/1")
+    assert "error" in parse_price("https://shop.pl/p/2")
+    assert throttle._breaker("shop.pl").failures == throttle.BREAKER_THRESHOLD
+
+
+def test_block_page_served_with_200_opens_the_circuit(fresh_state, monkeypatch):
+    page = ("<html><head><title>Sklep</title></head><body>" + "x" * 40_000
+            + "<p>Twoje żądanie zostało zablokowane</p></body></html>").encode()
+
+    class BlockPage(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(page)))
+            self.end_headers()
+            self.wfile.write(page)
+
+        def log_message(self, *args):
+            pass
+
+    # Even where the head usually holds the price, the block notice in the body is read
+    monkeypatch.setattr(strategies, "winner", lambda domain: "meta")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BlockPage)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        for i in range(throttle.BREAKER_THRESHOLD):
+            parse_price(f"http://127.0.0.1:{server.server_port}/p/{i}")
+    finally:
+        server.shutdown()
+
+    assert throttle._breaker(f"127.0.0.1:{server.server_port}").is_open
+
+
+def test_request_in_flight_does_not_release_another_probe(fresh_state):
+    # Let through while the circuit was still closed, and still running
+    in_flight = throttle.before_request("shop.pl")
+    for _ in range(throttle.BREAKER_THRESHOLD):
+        throttle.record("shop.pl", ok=False)
+    throttle._breaker("shop.pl").opened_until = 0
+    probe = throttle.before_request("shop.pl")
+    assert probe
+
+    # The older request ends with an unexpected error: the probe stays the only request let through
+    throttle.release_probe("shop.pl", in_flight)
+    assert not throttle.before_request("shop.pl")
+
+    throttle.release_probe("shop.pl", probe)
+    assert throttle.before_request("shop.pl")
@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+import metrics
+import storage
+
+# Requests per second per shop, and how many may go out back to back
+SHOP_RATE = float(os.getenv("SHOP_RATE", "1"))
+SHOP_BURST = float(os.getenv("SHOP_BURST", "3"))
+
+# Consecutive blocks/timeouts that open the circuit, and the cooldown range
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "3"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", str(5 * 60)))
+BREAKER_MAX_COOLDOWN = float(os.getenv("BREAKER_MAX_COOLDOWN", str(6 * 3600)))
+
+# Breaker state is re-read from the database this often, to see other processes' updates
+STATE_TTL = 10
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `capacity` stored."""
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _reserve(self):
+        """Takes a token (possibly going negative) and returns how long to wait for it."""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    """
+    Per-shop breaker. After `threshold` consecutive blocks or timeouts it
+    opens and the shop is skipped for a cooldown that doubles every time it
+    re-opens. After the cooldown one probe request is let through: success
+    closes the breaker, another failure re-opens it.
+    """
+
+    def __init__(self, domain, state=None, clock=time.time):
+        state = state or {}
+        self.domain = domain
+        self.clock = clock
+        self.failures = state.get("failures", 0)
+        self.opened_until = state.get("opened_until", 0.0)
+        self.cooldown = state.get("cooldown", 0.0)
+        self.probing = None  # token of the probe in flight, see allow()
+        self.loaded_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self.opened_until > self.clock()
+
+    def allow(self):
+        """False to skip the request; otherwise True, or a token if it is the half-open probe."""
+        if self.is_open:
+            return False
+        if self.failures >= BREAKER_THRESHOLD:
+            # Cooldown over: half-open, let a single probe through
+            if self.probing:
+                return False
+            self.probing = object()
+            return self.probing
+        return True
+
+    def record(self, ok):
+        """Updates the state after a request; returns True if the state changed."""
+        self.probing = None
+        if ok:
+            changed = self.failures > 0 or self.cooldown > 0
+            self.failures, self.opened_until, self.cooldown = 0, 0.0, 0.0
+            return changed
+        self.failures += 1
+        if self.failures >= BREAKER_THRESHOLD:
+            self.cooldown = min(BREAKER_MAX_COOLDOWN, self.cooldown * 2 if self.cooldown else BREAKER_COOLDOWN)
+            self.opened_until = self.clock() + self.cooldown
+            print(f"Circuit open for {self.domain}: skipping for {self.cooldown:.0f}s after {self.failures} failures")
+        return True
+
+    def release(self, probe):
+        """Ends a probe that got no verdict (neither success nor block); the next request probes again."""
+        if self.probing is probe:
+            self.probing = None
+
+    def state(self):
+        return {"failures": self.failures, "opened_until": self.opened_until, "cooldown": self.cooldown}
+
+
+_buckets = {}
+_breakers = {}
+_lock = threading.Lock()
+_stats = {"allowed": 0, "skipped": 0, "waited_seconds": 0.0, "failures": 0}
+
+
+def _breaker(domain):
+    with _lock:
+        breaker = _breakers.get(domain)
+        if breaker is None or (not breaker.probing and time.monotonic() - breaker.loaded_at > STATE_TTL):
+            breaker = _breakers[domain] = CircuitBreaker(domain, storage.load_domain_state(domain))
+        return breaker
+
+
+def before_request(domain):
+    """
+    Call before fetching from a shop. Returns False if the shop's circuit is
+    open (skip the request); otherwise waits for a rate-limit token and
+    returns a true value to pass to release_probe() afterwards.
+    """
+    breaker = _breaker(domain)
+    with _lock:
+        allowed = breaker.allow()
+        _stats["allowed" if allowed else "skipped"] += 1
+        bucket = _buckets.get(domain)
+        if bucket is None:
+            bucket = _buckets[domain] = TokenBucket(SHOP_RATE, SHOP_BURST)
+    if not allowed:
+        return False
+    waited = bucket.acquire()
+    with _lock:
+        _stats["waited_seconds"] += waited
+    return allowed
+
+
+def record(domain, ok):
+    """Reports the outcome of a request: ok=False for a block (403/429) or a timeout."""
+    breaker = _breaker(domain)
+    with _lock:
+        changed = breaker.record(ok)
+        state = breaker.state()
+        if not ok:
+            _stats["failures"] += 1
+    if changed:
+        storage.save_domain_state(domain, state)
+
+
+def release_probe(domain, permit):
+    """
+    Call after every request that before_request() let through, with what
+    it returned. If the request was the half-open probe and ended without
+    record() (an unexpected error), the probe is released so the shop isn't
+    skipped for good. Other requests leave a probe in flight alone.
+    """
+    if permit is True:
+        return
+    breaker = _breaker(domain)
+    with _lock:
+        breaker.release(permit)
+
+
+def retry_after(domain):
+    """Seconds until an open circuit lets requests through again (0 if closed)."""
+    return max(0.0, _breaker(domain).opened_until - time.time())
+
+
+def get_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["open"] = sorted(domain for domain, breaker in _breakers.items() if breaker.is_open)
+    stats["waited_seconds"] = round(stats["waited_seconds"], 2)
+    return stats
+
+
+def _collect_metrics():
+    stats = get_stats()
+    return [
+        ("omnibus_shop_requests_total", "counter", "Requests let through or skipped by the per-shop circuit breakers.",
+         [({"decision": "allowed"}, stats["allowed"]), ({"decision": "skipped"}, stats["skipped"])]),
+        ("omnibus_shop_rate_limit_wait_seconds_total", "counter", "Time spent waiting for per-shop rate limit tokens.",
+         [({}, stats["waited_seconds"])]),
+        ("omnibus_shop_circuit_open", "gauge", "1 for each shop whose circuit breaker is open.",
+         [({"domain": domain}, 1) for domain in stats["open"]]),
+    ]
+
+metrics.register_collector(_collect_metrics)
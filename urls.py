@@ -0,0 +1,42 @@
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+
+def get_domain(url):
+    try:
+        parsed = urlparse(url)
+        domain = parsed.netloc
+        # Remove www.
+        if domain.startswith("www."):
+            domain = domain[4:]
+        return domain
+    except:
+        return None
+
+# Query parameters added by ads, newsletters and affiliate networks.
+# They never change what the shop renders, so they are dropped when comparing URLs.
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "yclid", "dclid", "srsltid", "_ga", "mc_cid", "mc_eid", "ref"}
+TRACKING_PREFIXES = ("utm_",)
+
+def normalize_url(url):
+    """
+    Returns a canonical form of a product URL: lowercase host without www.,
+    no fragment, no tracking parameters, remaining parameters sorted.
+    Two URLs with the same normalized form point at the same product.
+    """
+    parsed = urlparse(url.strip())
+    domain = parsed.netloc.lower()
+    if domain.startswith("www."):
+        domain = domain[4:]
+
+    query = [
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+    return urlunparse((
+        parsed.scheme.lower(),
+        domain,
+        parsed.path or "/",
+        parsed.params,
+        urlencode(sorted(query)),
+        "",
+    ))